@@ -0,0 +1,176 @@
+import json
+import os
+
+import pytest
+
+from leapp.cli.commands.upgrade import breadcrumbs
+
+
+@pytest.fixture
+def crumbs_files(monkeypatch, tmp_path):
+    rhsm_dir = tmp_path / 'rhsm'
+    rhsm_dir.mkdir()
+    paths = {
+        'results': str(tmp_path / 'migration-results'),
+        'index': str(tmp_path / 'migration-results.index'),
+        'facts': str(rhsm_dir / 'facts' / 'leapp.facts'),
+    }
+    monkeypatch.setattr(breadcrumbs, 'MIGRATION_RESULTS', paths['results'])
+    monkeypatch.setattr(breadcrumbs, 'MIGRATION_RESULTS_INDEX', paths['index'])
+    monkeypatch.setattr(breadcrumbs, 'RHSM_DIR', str(rhsm_dir))
+    monkeypatch.setattr(breadcrumbs, 'RHSM_FACTS_DIR', str(rhsm_dir / 'facts'))
+    monkeypatch.setattr(breadcrumbs, 'RHSM_FACTS', paths['facts'])
+    monkeypatch.setattr(breadcrumbs, 'get_messages', lambda *args: [])
+    monkeypatch.setattr(breadcrumbs._BreadCrumbs, '_get_packages', lambda self: [])
+    monkeypatch.setattr(breadcrumbs._BreadCrumbs, '_commit_rhsm_facts', lambda self: None)
+    monkeypatch.delenv('LEAPP_NO_RHSM_FACTS', raising=False)
+    monkeypatch.delenv('LEAPP_BREADCRUMBS_LIMIT', raising=False)
+    return paths
+
+
+def _save_activities(activities):
+    for activity in activities:
+        breadcrumbs._BreadCrumbs(activity=activity).save()
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _expected_facts(results):
+    return breadcrumbs._flattened({
+        'leapp': [a for a in results['activities'] if a['activity'] in ('preupgrade', 'upgrade')]
+    })
+
+
+def test_save_appends_activities(monkeypatch, crumbs_files):
+    compacted = []
+    orig_compact = breadcrumbs._BreadCrumbs._compact
+
+    def compact_mocked(self):
+        compacted.append(self._crumbs['activity'])
+        orig_compact(self)
+
+    monkeypatch.setattr(breadcrumbs._BreadCrumbs, '_compact', compact_mocked)
+    _save_activities(['preupgrade', 'other', 'upgrade', 'upgrade'])
+
+    results = _load(crumbs_files['results'])
+    assert [a['activity'] for a in results['activities']] == ['preupgrade', 'other', 'upgrade', 'upgrade']
+    assert _load(crumbs_files['facts']) == _expected_facts(results)
+    # only the first activity has written the documents from scratch
+    assert compacted == ['preupgrade']
+
+    # the file is written in the same format as when it is written at once
+    with open(crumbs_files['results']) as f:
+        assert f.read() == json.dumps(results, indent=2, sort_keys=True) + '\n'
+
+
+def test_save_compacts_modified_results(crumbs_files):
+    _save_activities(['preupgrade', 'upgrade'])
+    results = _load(crumbs_files['results'])
+    del results['activities'][0]
+    with open(crumbs_files['results'], 'w') as f:
+        json.dump(results, f)
+
+    _save_activities(['upgrade'])
+
+    results = _load(crumbs_files['results'])
+    assert [a['activity'] for a in results['activities']] == ['upgrade', 'upgrade']
+    assert _load(crumbs_files['facts']) == _expected_facts(results)
+
+
+@pytest.mark.parametrize('content', ['', 'invalid', '{"activities": 1}'])
+def test_save_invalid_results(crumbs_files, content):
+    with open(crumbs_files['results'], 'w') as f:
+        f.write(content)
+    _save_activities(['preupgrade', 'upgrade'])
+    assert [a['activity'] for a in _load(crumbs_files['results'])['activities']] == ['preupgrade', 'upgrade']
+
+
+def test_save_retention_limit(monkeypatch, crumbs_files):
+    monkeypatch.setenv('LEAPP_BREADCRUMBS_LIMIT', '3')
+    _save_activities(['preupgrade', 'other', 'preupgrade', 'upgrade', 'other'])
+    # activities are appended until their number reaches twice the limit
+    results = _load(crumbs_files['results'])
+    assert [a['activity'] for a in results['activities']] == ['preupgrade', 'other', 'preupgrade', 'upgrade', 'other']
+    assert _load(crumbs_files['facts']) == _expected_facts(results)
+
+    _save_activities(['upgrade'])
+    results = _load(crumbs_files['results'])
+    assert [a['activity'] for a in results['activities']] == ['upgrade', 'other', 'upgrade']
+    assert _load(crumbs_files['facts']) == _expected_facts(results)
+
+    _save_activities(['preupgrade', 'upgrade'])
+    results = _load(crumbs_files['results'])
+    assert [a['activity'] for a in results['activities']] == ['upgrade', 'other', 'upgrade', 'preupgrade', 'upgrade']
+
+
+def test_save_no_rhsm_facts(monkeypatch, crumbs_files):
+    monkeypatch.setenv('LEAPP_NO_RHSM_FACTS', '1')
+    _save_activities(['preupgrade', 'upgrade'])
+    assert len(_load(crumbs_files['results'])['activities']) == 2
+    assert not os.path.exists(crumbs_files['facts'])
+
+    # facts are generated for all activities once enabled again
+    monkeypatch.delenv('LEAPP_NO_RHSM_FACTS')
+    _save_activities(['upgrade', 'upgrade'])
+    results = _load(crumbs_files['results'])
+    assert len(results['activities']) == 4
+    assert _load(crumbs_files['facts']) == _expected_facts(results)
+
+
+@pytest.fixture
+def rpmdb(monkeypatch, tmp_path):
+    rpmdb_dir = tmp_path / 'rpm'
+    rpmdb_dir.mkdir()
+    (rpmdb_dir / 'rpmdb.sqlite').write_text(u'db')
+    monkeypatch.setattr(breadcrumbs, 'RPMDB_DIR', str(rpmdb_dir))
+    monkeypatch.setattr(breadcrumbs, 'RPM_CACHE', str(tmp_path / 'breadcrumbs-rpm.cache'))
+    monkeypatch.setenv('LEAPP_EXECUTION_ID', 'run1')
+    monkeypatch.setenv('LEAPP_IPU_IN_PROGRESS', '8to9')
+    calls = []
+
+    def call_mocked(cmd, *args, **kwargs):
+        calls.append(cmd)
+        if cmd[1] == '-qa':
+            return {'exit_code': 0, 'stdout': 'leapp-0.16.0-1.el8.noarch RSA/SHA256, Key ID 199e2f91fd431d51\n'
+                                              'snactor-0.16.0-1.el8.noarch (none)\n'}
+        return {'exit_code': 1, 'stdout': 'S.5....T.  c /etc/leapp/files/pes-events.json\n'}
+
+    monkeypatch.setattr(breadcrumbs, '_call', call_mocked)
+    return rpmdb_dir / 'rpmdb.sqlite', calls
+
+
+def test_get_packages_cached(rpmdb):
+    db, calls = rpmdb
+    expected = [
+        {'nevra': 'leapp-0.16.0-1.el8.noarch', 'signature': 'RSA/SHA256, Key ID 199e2f91fd431d51'},
+        {'nevra': 'snactor-0.16.0-1.el8.noarch', 'signature': '(none)'},
+    ]
+    assert breadcrumbs._BreadCrumbs('upgrade')._get_packages() == expected
+    assert calls == [['rpm', '-qa', '--queryformat', '%{nevra} %{SIGPGP:pgpsig}\n', '*leapp*', '*snactor*']]
+    assert breadcrumbs._BreadCrumbs('upgrade')._get_packages() == expected
+    assert len(calls) == 1
+    # a new rpmdb generation is queried again
+    db.write_text(u'changed db')
+    assert breadcrumbs._BreadCrumbs('upgrade')._get_packages() == expected
+    assert len(calls) == 2
+
+
+def test_verify_leapp_pkgs_cached(monkeypatch, rpmdb):
+    db, calls = rpmdb
+    crumbs = breadcrumbs._BreadCrumbs('upgrade')
+    del calls[:]
+    expected = [{'result': 'S.5....T.', 'file_name': ' c /etc/leapp/files/pes-events.json'}]
+    assert crumbs._verify_leapp_pkgs() == expected
+    assert calls == [['rpm', '-V', 'leapp', 'leapp-upgrade-el8toel9']]
+    assert crumbs._verify_leapp_pkgs() == expected
+    assert len(calls) == 1
+    # the files could be modified between leapp executions
+    monkeypatch.setenv('LEAPP_EXECUTION_ID', 'run2')
+    assert crumbs._verify_leapp_pkgs() == expected
+    assert len(calls) == 2
+    db.write_text(u'changed db')
+    assert crumbs._verify_leapp_pkgs() == expected
+    assert len(calls) == 3
@@ -14,6 +14,41 @@ try:
 except ImportError:
     JSONDecodeError = ValueError
 
+MIGRATION_RESULTS = '/etc/migration-results'
+MIGRATION_RESULTS_INDEX = '/var/lib/leapp/migration-results.index'
+"""
+Index of the /etc/migration-results and rhsm facts files.
+
+It keeps the number of activities stored in both files together with their
+sizes and mtimes, so a new activity can be appended to the end of both
+documents without parsing them. When the index does not match the files, the
+documents are compacted - parsed and written again from scratch.
+"""
+RHSM_DIR = '/etc/rhsm'
+RHSM_FACTS_DIR = os.path.join(RHSM_DIR, 'facts')
+RHSM_FACTS = os.path.join(RHSM_FACTS_DIR, 'leapp.facts')
+
+# The end of the documents as written by json.dump with the indentation used by us
+_RESULTS_TAIL = b'\n  ]\n}\n'
+_FACTS_TAIL = b'\n}'
+# The separator of items as written by json.dump with indentation (', ' on Python 2, ',' on Python 3)
+_ITEM_SEPARATOR = json.dumps([None, None], indent=0).split('\n')[1][len('null'):]
+
+RPMDB_DIR = '/var/lib/rpm'
+# Files changed by every rpm transaction, for bdb and sqlite backends
+RPMDB_FILES = ('Packages', 'rpmdb.sqlite', 'rpmdb.sqlite-wal')
+RPM_CACHE = '/var/lib/leapp/breadcrumbs-rpm.cache'
+"""
+Cache of the leapp packages and their verification for the current rpmdb generation.
+
+Breadcrumbs are produced several times during a single upgrade, while the rpmdb
+changes only by the upgrade RPM transaction, so the packages are queried only
+once per rpmdb generation. The verification is reused only within the same
+leapp execution, as the files of the packages can be modified without changing
+the rpmdb in between.
+"""
+LEAPP_PACKAGES_GLOBS = ('*leapp*', '*snactor*')
+
 
 def runs_in_container():
     """
@@ -36,6 +71,120 @@ def _flattened(d):
     return dict(items)
 
 
+def _get_retention_limit():
+    """
+    Return the number of activities kept in /etc/migration-results or 0 for unlimited
+
+    The limit is set by the LEAPP_BREADCRUMBS_LIMIT environment variable.
+    Activities are appended until their number reaches twice the limit, then
+    the documents are compacted to keep only the latest `limit` activities.
+    """
+    try:
+        return max(int(os.environ.get('LEAPP_BREADCRUMBS_LIMIT', '0')), 0)
+    except ValueError:
+        return 0
+
+
+def _is_rhsm_facts_activity(activity):
+    return activity.get('activity', '') in ('preupgrade', 'upgrade')
+
+
+def _indented(data, indent):
+    """ Return json dump of data with every line indented by given number of spaces """
+    prefix = ' ' * indent
+    return '\n'.join(prefix + line for line in json.dumps(data, indent=2, sort_keys=True).split('\n'))
+
+
+def _get_file_id(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime]
+
+
+def _load_index():
+    try:
+        with open(MIGRATION_RESULTS_INDEX) as f:
+            index = json.load(f)
+    except (OSError, IOError, ValueError):
+        return None
+    if not isinstance(index, dict):
+        return None
+    if index.get('results') != _get_file_id(MIGRATION_RESULTS) or index.get('facts') != _get_file_id(RHSM_FACTS):
+        # the files have been changed by someone else
+        return None
+    return index
+
+
+def _store_index(activities, facts_activities):
+    index = {
+        'activities': activities,
+        'facts_activities': facts_activities,
+        'results': _get_file_id(MIGRATION_RESULTS),
+        'facts': _get_file_id(RHSM_FACTS),
+    }
+    try:
+        with open(MIGRATION_RESULTS_INDEX, 'w') as f:
+            json.dump(index, f)
+    except (OSError, IOError):
+        # the index is just an optimization, the documents are compacted next time
+        pass
+
+
+def _get_rpmdb_generation():
+    """ Return the identification of the current rpmdb content or None if it cannot be determined """
+    generation = [[name] + _get_file_id(os.path.join(RPMDB_DIR, name))
+                  for name in RPMDB_FILES if _get_file_id(os.path.join(RPMDB_DIR, name))]
+    return generation or None
+
+
+def _load_rpm_cache(generation):
+    if not generation:
+        return {}
+    try:
+        with open(RPM_CACHE) as f:
+            cache = json.load(f)
+    except (OSError, IOError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('rpmdb') != generation:
+        return {}
+    return cache
+
+
+def _store_rpm_cache(generation, **kwargs):
+    if not generation:
+        return
+    cache = _load_rpm_cache(generation)
+    cache.update(kwargs, rpmdb=generation)
+    try:
+        with open(RPM_CACHE, 'w') as f:
+            json.dump(cache, f)
+    except (OSError, IOError):
+        # the cache is just an optimization
+        pass
+
+
+def _append_to_document(path, tail, content):
+    """
+    Replace the expected tail of the json document in the file by content and the tail
+
+    Return False if the file does not end with the tail.
+    """
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < len(tail):
+            return False
+        f.seek(size - len(tail))
+        if f.read() != tail:
+            return False
+        f.seek(size - len(tail))
+        f.truncate()
+        f.write(content.encode('utf-8') + tail)
+    return True
+
+
 class _BreadCrumbs(object):
     def __init__(self, activity):
         self._crumbs = {
@@ -56,23 +205,27 @@ class _BreadCrumbs(object):
     def fail(self):
         self._crumbs['success'] = False
 
-    def _save_rhsm_facts(self, activities):
-        if not os.path.isdir('/etc/rhsm/facts'):
-            if not os.path.exists('/etc/rhsm'):
+    def _ensure_rhsm_facts_dir(self):
+        """ Return True if the directory for rhsm facts exists """
+        if not os.path.isdir(RHSM_FACTS_DIR):
+            if not os.path.exists(RHSM_DIR):
                 # If there's no /etc/rhsm folder just skip it
-                return
+                return False
             try:
-                os.mkdir('/etc/rhsm/facts')
+                os.mkdir(RHSM_FACTS_DIR)
             except OSError as e:
-                if e.errno == 17:
-                    # The directory already exists which is all we need.
-                    pass
+                if e.errno != 17:
+                    return False
+                # The directory already exists which is all we need.
+        return True
+
+    def _save_rhsm_facts(self, activities):
+        if not self._ensure_rhsm_facts_dir():
+            return
         try:
-            with open('/etc/rhsm/facts/leapp.facts', 'w') as f:
+            with open(RHSM_FACTS, 'w') as f:
                 json.dump(_flattened({
-                    'leapp': [
-                        activity for activity in activities
-                        if activity.get('activity', '') in ('preupgrade', 'upgrade')]
+                    'leapp': [activity for activity in activities if _is_rhsm_facts_activity(activity)]
                     }), f, indent=4)
             self._commit_rhsm_facts()
         except OSError:
@@ -80,6 +233,24 @@ class _BreadCrumbs(object):
             # even though it shouldn't though, just ignore it
             pass
 
+    def _append_rhsm_facts(self, facts_activities):
+        """
+        Append facts of the current activity to the existing rhsm facts of previous activities
+
+        Return False if the facts could not be appended.
+        """
+        facts = _flattened({'leapp': {str(facts_activities): self._crumbs}})
+        content = ''.join(
+            '{}\n    {}: {}'.format(_ITEM_SEPARATOR, json.dumps(k), json.dumps(v)) for k, v in facts.items()
+        )
+        try:
+            if not _append_to_document(RHSM_FACTS, _FACTS_TAIL, content):
+                return False
+        except (OSError, IOError):
+            return False
+        self._commit_rhsm_facts()
+        return True
+
     def _commit_rhsm_facts(self):
         if runs_in_container():
             return
@@ -101,47 +272,115 @@ class _BreadCrumbs(object):
         self._crumbs['activity_ended'] = datetime.datetime.utcnow().isoformat() + 'Z'
         self._crumbs['env'] = {k: v for k, v in os.environ.items() if k.startswith('LEAPP_')}
         try:
-            with open('/etc/migration-results', 'a+') as crumbs:
-                crumbs.seek(0)
-                doc = {'activities': []}
-                try:
-                    content = json.load(crumbs)
-                    if isinstance(content, dict):
-                        if isinstance(content.get('activities', None), list):
-                            doc = content
-                except JSONDecodeError:
-                    # Expected to happen when /etc/migration-results is still empty or does not yet exist
-                    pass
-                doc['activities'].append(self._crumbs)
-                crumbs.seek(0)
-                crumbs.truncate()
-                json.dump(doc, crumbs, indent=2, sort_keys=True)
-                crumbs.write('\n')
-                if os.environ.get('LEAPP_NO_RHSM_FACTS', '0') != '1':
-                    self._save_rhsm_facts(doc['activities'])
-        except OSError:
+            if not self._append():
+                self._compact()
+        except (OSError, IOError):
             sys.stderr.write('WARNING: Could not write to /etc/migration-results\n')
 
+    def _append(self):
+        """
+        Append the activity to the end of /etc/migration-results and rhsm facts without parsing them
+
+        Return False when the documents have to be compacted instead.
+        """
+        index = _load_index()
+        if not index or not index.get('activities'):
+            return False
+        limit = _get_retention_limit()
+        if limit and index['activities'] + 1 >= 2 * limit:
+            # compact only once per `limit` activities instead of on every run
+            return False
+        facts_activities = index.get('facts_activities', 0)
+        update_facts = (
+            os.environ.get('LEAPP_NO_RHSM_FACTS', '0') != '1'
+            and _is_rhsm_facts_activity(self._crumbs)
+            and os.path.exists(RHSM_DIR)
+        )
+        if update_facts and not facts_activities:
+            # the facts have to be generated from all activities
+            return False
+        content = _ITEM_SEPARATOR + '\n' + _indented(self._crumbs, 4)
+        if not _append_to_document(MIGRATION_RESULTS, _RESULTS_TAIL, content):
+            return False
+        if update_facts:
+            # when the facts are out of sync, generate them again next time
+            facts_activities = facts_activities + 1 if self._append_rhsm_facts(facts_activities) else 0
+        _store_index(index['activities'] + 1, facts_activities)
+        return True
+
+    def _compact(self):
+        """
+        Write /etc/migration-results and rhsm facts from scratch, keeping the retention limit of latest activities
+        """
+        with open(MIGRATION_RESULTS, 'a+') as crumbs:
+            crumbs.seek(0)
+            doc = {'activities': []}
+            try:
+                content = json.load(crumbs)
+                if isinstance(content, dict):
+                    if isinstance(content.get('activities', None), list):
+                        doc = content
+            except JSONDecodeError:
+                # Expected to happen when /etc/migration-results is still empty or does not yet exist
+                pass
+            doc['activities'].append(self._crumbs)
+            limit = _get_retention_limit()
+            if limit:
+                doc['activities'] = doc['activities'][-limit:]
+            crumbs.seek(0)
+            crumbs.truncate()
+            json.dump(doc, crumbs, indent=2, sort_keys=True)
+            crumbs.write('\n')
+        facts_activities = 0
+        if os.environ.get('LEAPP_NO_RHSM_FACTS', '0') != '1':
+            self._save_rhsm_facts(doc['activities'])
+            if os.path.exists(RHSM_FACTS):
+                facts_activities = len([a for a in doc['activities'] if _is_rhsm_facts_activity(a)])
+        _store_index(len(doc['activities']), facts_activities)
+
     def _get_packages(self):
-        cmd = ['/bin/bash', '-c', 'rpm -qa --queryformat="%{nevra} %{SIGPGP:pgpsig}\n" | grep -Ee "leapp|snactor"']
+        generation = _get_rpmdb_generation()
+        cache = _load_rpm_cache(generation)
+        if isinstance(cache.get('packages'), list):
+            return cache['packages']
+        # rpm filters the packages by their names before formatting, so signatures of other packages are not read
+        cmd = ['rpm', '-qa', '--queryformat', '%{nevra} %{SIGPGP:pgpsig}\n'] + list(LEAPP_PACKAGES_GLOBS)
         res = _call(cmd, lambda x, y: None, lambda x, y: None)
-        if res.get('exit_code', None) == 0:
-            if res.get('stdout', None):
-                return [{'nevra': t[0], 'signature': t[1]}
-                        for t in [line.strip().split(' ', 1) for line in res['stdout'].split('\n') if line.strip()]]
-        return []
+        if res.get('exit_code', None) != 0:
+            return []
+        packages = []
+        for line in (res.get('stdout', None) or '').split('\n'):
+            if not line.strip():
+                continue
+            nevra, signature = (line.strip().split(' ', 1) + [''])[:2]
+            package = {'nevra': nevra, 'signature': signature}
+            # a package matching several patterns is listed several times
+            if package not in packages:
+                packages.append(package)
+        _store_rpm_cache(generation, packages=packages)
+        return packages
 
     def _verify_leapp_pkgs(self):
         if not os.environ.get('LEAPP_IPU_IN_PROGRESS'):
             return []
         upg_path = os.environ.get('LEAPP_IPU_IN_PROGRESS').split('to')
-        cmd = ['/bin/bash', '-c', 'rpm -V leapp leapp-upgrade-el{}toel{}'.format(upg_path[0], upg_path[1])]
+        generation = _get_rpmdb_generation()
+        key = [os.environ.get('LEAPP_EXECUTION_ID', 'N/A'), os.environ.get('LEAPP_IPU_IN_PROGRESS')]
+        cached = _load_rpm_cache(generation).get('verification')
+        if isinstance(cached, dict) and cached.get('key') == key and isinstance(cached.get('result'), list):
+            return cached['result']
+        cmd = ['rpm', '-V', 'leapp', 'leapp-upgrade-el{}toel{}'.format(upg_path[0], upg_path[1])]
         res = _call(cmd, lambda x, y: None, lambda x, y: None)
+        result = []
         if res.get('exit_code', None) == 1:
             if res.get('stdout', None):
-                return [{'result': t[0], 'file_name': t[1]}
-                        for t in [line.strip().split(' ', 1) for line in res['stdout'].split('\n') if line.strip()]]
-        return []
+                result = [{'result': t[0], 'file_name': t[1]}
+                          for t in [line.strip().split(' ', 1) for line in res['stdout'].split('\n') if line.strip()]]
+        elif res.get('exit_code', None) != 0:
+            # do not cache failures of rpm itself
+            return result
+        _store_rpm_cache(generation, verification={'key': key, 'result': result})
+        return result
 
 
 def produces_breadcrumbs(f):
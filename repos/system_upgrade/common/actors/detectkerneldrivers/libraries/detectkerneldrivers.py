@@ -1,3 +1,4 @@
+from leapp.libraries.common.devicedriverdeprecation import get_deprecation_index
 from leapp.libraries.stdlib import api
 from leapp.models import ActiveKernelModulesFacts, DetectedDeviceOrDriver, DeviceDriverDeprecationData
 
@@ -8,14 +9,20 @@ def process():
         for message in api.consume(ActiveKernelModulesFacts)
         for module in message.kernel_modules
     }
-    driver_data = {
-        entry.driver_name: entry
-        for message in api.consume(DeviceDriverDeprecationData)
-        for entry in message.entries
-        if not entry.device_id
-    }
+    index = get_deprecation_index()
+    if index:
+        get_entry = index.get_driver_entry
+    else:
+        driver_data = {
+            entry.driver_name: entry
+            for message in api.consume(DeviceDriverDeprecationData)
+            for entry in message.entries
+            if not entry.device_id
+        }
+        get_entry = driver_data.get
+    entries = [get_entry(driver) for driver in loaded_drivers]
     api.produce(*[
-        DetectedDeviceOrDriver(**driver_data[driver].dump())
-        for driver in loaded_drivers
-        if driver in driver_data
+        DetectedDeviceOrDriver(**entry.dump())
+        for entry in entries
+        if entry
     ])
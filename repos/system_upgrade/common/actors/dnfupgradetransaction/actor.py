@@ -1,7 +1,7 @@
 import shutil
 
 from leapp.actors import Actor
-from leapp.libraries.common import dnfplugin
+from leapp.libraries.common import dnfplugin, overlaygen
 from leapp.libraries.stdlib import run
 from leapp.models import (
     DNFPluginTask,
@@ -60,6 +60,9 @@ class DnfUpgradeTransaction(Actor):
         userspace = next(self.consume(TargetUserSpaceInfo), None)
         if userspace:
             try:
+                overlaygen.remove_userspace_metadata(userspace.path)
                 shutil.rmtree(userspace.path)
             except EnvironmentError:
                 self.log.info("Failed to remove temporary userspace - error ignored", exc_info=True)
+            # Disk images kept for next leapp runs (LEAPP_OVL_REUSE_DISK_IMGS=1) are useless after the upgrade
+            overlaygen.remove_disk_images(userspace.scratch)
@@ -1,5 +1,6 @@
 from leapp.exceptions import StopActorExecutionError
 from leapp.libraries.common import fetch
+from leapp.libraries.common.devicedriverdeprecation import store_deprecation_index
 from leapp.libraries.common.rpms import get_leapp_packages, LeappComponents
 from leapp.libraries.stdlib import api
 from leapp.models import DeviceDriverDeprecationData, DeviceDriverDeprecationEntry
@@ -11,6 +12,9 @@ def process():
     Loads the device and driver deprecation data and produces a DeviceDriverDeprecationData message with its content.
     It will filter the data on the device_type field, based on the choices set in the StringEnum on the
     DeviceDriverDeprecationEntry model
+
+    The loaded entries are stored also in the indexed form,
+    see the devicedriverdeprecation library.
     """
     # This is how you get the StringEnum choices value, so we can filter based on the model definition
     supported_device_types = set(DeviceDriverDeprecationEntry.device_type.serialize()['choices'])
@@ -26,15 +30,12 @@ def process():
                                              docs_title='')
 
     try:
-        api.produce(
-            DeviceDriverDeprecationData(
-                entries=[
-                    DeviceDriverDeprecationEntry(**entry)
-                    for entry in deprecation_data['data']
-                    if entry.get('device_type') in supported_device_types
-                ]
-            )
-        )
+        entries = [
+            DeviceDriverDeprecationEntry(**entry)
+            for entry in deprecation_data['data']
+            if entry.get('device_type') in supported_device_types
+        ]
+        api.produce(DeviceDriverDeprecationData(entries=entries))
     except (ModelViolationError, ValueError, KeyError, AttributeError, TypeError) as err:
         # For the listed errors, we expect this to happen only when data is malformed
         # or manually updated. Corrupted data in the upstream is discovered
@@ -51,3 +52,5 @@ def process():
             )
         )
         raise StopActorExecutionError(msg, details={'hint': hint})
+
+    store_deprecation_index(entries)
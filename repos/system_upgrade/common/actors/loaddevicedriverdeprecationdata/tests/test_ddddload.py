@@ -2,7 +2,7 @@ import pytest
 
 from leapp.exceptions import StopActorExecutionError
 from leapp.libraries.actor import deviceanddriverdeprecationdataload as ddddload
-from leapp.libraries.common import fetch
+from leapp.libraries.common import devicedriverdeprecation, fetch
 from leapp.libraries.common.testutils import CurrentActorMocked
 
 TEST_DATA = {
@@ -54,6 +54,7 @@ def test_filtered_load(monkeypatch):
         return TEST_DATA
 
     monkeypatch.setattr(fetch, 'load_data_asset', load_data_asset_mock)
+    monkeypatch.setattr(ddddload.api, 'current_actor', CurrentActorMocked())
     monkeypatch.setattr(ddddload.api, 'produce', lambda *v: produced.extend(v))
 
     ddddload.process()
@@ -85,3 +86,21 @@ def test_invalid_dddd_data(monkeypatch, data):
     with pytest.raises(StopActorExecutionError):
         ddddload.process()
     assert not produced
+
+
+def test_load_stores_index(monkeypatch, tmp_path):
+    index_path = str(tmp_path / 'device_driver_deprecation_index.json')
+    monkeypatch.setattr(devicedriverdeprecation, 'DEPRECATION_INDEX', index_path)
+    monkeypatch.setattr(fetch, 'load_data_asset', lambda *args, **kwargs: TEST_DATA)
+    monkeypatch.setattr(ddddload.api, 'current_actor', CurrentActorMocked(
+        src_ver='8.8', dst_ver='9.2', envars={'LEAPP_EXECUTION_ID': 'run1'}
+    ))
+    monkeypatch.setattr(ddddload.api, 'produce', lambda *v: None)
+
+    ddddload.process()
+
+    index = devicedriverdeprecation.get_deprecation_index()
+    assert index.get_pci_device_entry('10df:f180').device_name == TEST_DATA['data'][3]['device_name']
+    assert [entry.device_id for entry in index.get_cpu_entries('x86_64')] == [
+        'x86_64:amd:25:1', 'x86_64:amd:25:[2-255]'
+    ]
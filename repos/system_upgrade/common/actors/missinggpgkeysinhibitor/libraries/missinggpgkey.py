@@ -3,8 +3,9 @@ import os
 import re
 import shutil
 import tempfile
+from multiprocessing.pool import ThreadPool
 
-from six.moves import urllib
+import requests
 
 from leapp import reporting
 from leapp.exceptions import StopActorExecutionError
@@ -21,6 +22,8 @@ from leapp.models import (
 from leapp.utils.deprecation import suppress_deprecation
 
 FMT_LIST_SEPARATOR = '\n    - '
+GPGKEY_DOWNLOAD_TIMEOUT = (5, 30)
+GPGKEY_DOWNLOAD_WORKERS = 8
 
 
 def _expand_vars(path):
@@ -130,6 +133,48 @@ def _get_repo_gpgkey_urls(repo):
     return re.findall(r'[^,\s]+', _expand_vars(repo_additional['gpgkey']))
 
 
+def _download_gpgkey(session, url, tmpdir):
+    """
+    Download the gpgkey from the url into a temporary file in tmpdir
+
+    Return a tuple (path, error), where exactly one of the items is None.
+    """
+    try:
+        response = session.get(url, timeout=GPGKEY_DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        fd, tmp_file = tempfile.mkstemp(dir=tmpdir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(response.content)
+    except (requests.exceptions.RequestException, IOError, OSError) as err:
+        return None, str(err)
+    return tmp_file, None
+
+
+def _download_gpgkeys(urls, tmpdir):
+    """
+    Download the gpgkeys from given urls concurrently
+
+    Connections to the same server are reused for all keys hosted there.
+
+    :return: A dict mapping urls to tuples (path, error) as returned by _download_gpgkey
+    """
+    if not urls:
+        return {}
+    workers = min(GPGKEY_DOWNLOAD_WORKERS, len(urls))
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    pool = ThreadPool(workers)
+    try:
+        results = pool.map(lambda url: _download_gpgkey(session, url, tmpdir), urls)
+    finally:
+        pool.close()
+        pool.join()
+        session.close()
+    return dict(zip(urls, results))
+
+
 def _report(title, summary, keys, inhibitor=False):
     summary = (
         '{summary}'
@@ -293,8 +338,7 @@ def process():
     repos_missing_keys = list()
 
     pubkeys = [key.fingerprint for key in trusted_gpg_keys.items]
-    processed_gpgkey_urls = set()
-    tmpdir = None
+    gpgkey_urls = []
     for repoid in used_target_repos:
         if repoid.repoid not in target_repo_id_to_repositories_facts_map:
             api.current_logger().warning('The target repository {} metadata not available'.format(repoid.repoid))
@@ -306,40 +350,39 @@ def process():
             repos_missing_keys.append(repo.repoid)
             continue
         for gpgkey_url in gpgkeys:
-            if gpgkey_url in processed_gpgkey_urls:
-                continue
-            processed_gpgkey_urls.add(gpgkey_url)
-
-            if gpgkey_url.startswith('file:///'):
-                key_file = _get_abs_file_path(target_userspace, gpgkey_url)
-            elif gpgkey_url.startswith('http://') or gpgkey_url.startswith('https://'):
-                # delay creating temporary directory until we need it
-                tmpdir = tempfile.mkdtemp() if tmpdir is None else tmpdir
-                # FIXME: what to do with dummy? it's fd, that should be closed also
-                dummy, tmp_file = tempfile.mkstemp(dir=tmpdir)
-                try:
-                    urllib.request.urlretrieve(gpgkey_url, tmp_file)
-                    key_file = tmp_file
-                except urllib.error.URLError as err:
-                    api.current_logger().warning(
-                        'Failed to download the gpgkey {}: {}'.format(gpgkey_url, str(err)))
-                    failed_download.append(gpgkey_url)
-                    continue
-            else:
-                unknown_protocol.append(gpgkey_url)
-                api.current_logger().error(
-                    'Skipping unknown protocol for gpgkey {}'.format(gpgkey_url))
-                continue
-            fps = get_gpg_fp_from_file(key_file)
-            if not fps:
-                invalid_keys.append(gpgkey_url)
+            if gpgkey_url not in gpgkey_urls:
+                gpgkey_urls.append(gpgkey_url)
+
+    # Download all remote keys at once, delay creating temporary directory until we need it
+    remote_urls = [url for url in gpgkey_urls if url.startswith('http://') or url.startswith('https://')]
+    tmpdir = tempfile.mkdtemp() if remote_urls else None
+    downloaded = _download_gpgkeys(remote_urls, tmpdir)
+
+    for gpgkey_url in gpgkey_urls:
+        if gpgkey_url.startswith('file:///'):
+            key_file = _get_abs_file_path(target_userspace, gpgkey_url)
+        elif gpgkey_url in downloaded:
+            key_file, error = downloaded[gpgkey_url]
+            if error:
                 api.current_logger().warning(
-                    'Cannot get any gpg key from the file: {}'.format(gpgkey_url)
-                )
+                    'Failed to download the gpgkey {}: {}'.format(gpgkey_url, error))
+                failed_download.append(gpgkey_url)
                 continue
-            for fp in fps:
-                if fp not in pubkeys and gpgkey_url not in missing_keys:
-                    missing_keys.append(_get_abs_file_path(target_userspace, gpgkey_url))
+        else:
+            unknown_protocol.append(gpgkey_url)
+            api.current_logger().error(
+                'Skipping unknown protocol for gpgkey {}'.format(gpgkey_url))
+            continue
+        fps = get_gpg_fp_from_file(key_file)
+        if not fps:
+            invalid_keys.append(gpgkey_url)
+            api.current_logger().warning(
+                'Cannot get any gpg key from the file: {}'.format(gpgkey_url)
+            )
+            continue
+        for fp in fps:
+            if fp not in pubkeys and gpgkey_url not in missing_keys:
+                missing_keys.append(_get_abs_file_path(target_userspace, gpgkey_url))
 
     if tmpdir:
         # clean up temporary directory with downloaded gpg keys
@@ -1,8 +1,10 @@
+import os
+
 import pytest
-from six.moves.urllib.error import URLError
 
 from leapp import reporting
 from leapp.exceptions import StopActorExecutionError
+from leapp.libraries.actor import missinggpgkey
 from leapp.libraries.actor.missinggpgkey import process
 from leapp.libraries.common.gpg import get_pubkeys_from_rpms
 from leapp.libraries.common.testutils import create_report_mocked, CurrentActorMocked, logger_mocked, produce_mocked
@@ -28,6 +30,14 @@ from leapp.utils.deprecation import suppress_deprecation
 # whole process as I was initially advised not to use these component tests.
 
 
+@pytest.fixture(autouse=True)
+def gpg_only(monkeypatch):
+    # Let the mocked gpg read all the keys instead of reading them directly from files or the cache
+    monkeypatch.setattr('leapp.libraries.common.gpg._read_fp_from_key_file', lambda key_path: None)
+    monkeypatch.setattr('leapp.libraries.common.gpg._get_cached_fp', lambda key_path: None)
+    monkeypatch.setattr('leapp.libraries.common.gpg._cache_fp', lambda key_path, fps: None)
+
+
 def _get_test_gpgkeys_missing():
     """
     Return list of Trusted GPG keys without the epel9 key we look for
@@ -402,8 +412,8 @@ def get_test_tmptargetrepositoriesfacts_ftp():
     )
 
 
-def _urlretrive_mocked(url, filename=None, reporthook=None, data=None):
-    return filename
+def _download_gpgkey_mocked(session, url, tmpdir):
+    return os.path.join(tmpdir, 'key.gpg'), None
 
 
 @pytest.mark.skip("Broken test")
@@ -420,7 +430,7 @@ def test_perform_https_gpgkey(monkeypatch):
     monkeypatch.setattr(api, 'current_logger', logger_mocked())
     monkeypatch.setattr(reporting, 'create_report', create_report_mocked())
     monkeypatch.setattr('leapp.libraries.common.gpg._gpg_show_keys', _gpg_show_keys_mocked)
-    monkeypatch.setattr('six.moves.urllib.request.urlretrieve', _urlretrive_mocked)
+    monkeypatch.setattr(missinggpgkey, '_download_gpgkey', _download_gpgkey_mocked)
 
     process()
     assert api.produce.called == 1
@@ -430,8 +440,8 @@ def test_perform_https_gpgkey(monkeypatch):
     assert "https://example.com/rpm-gpg/key.gpg" in reporting.create_report.reports[0]['summary']
 
 
-def _urlretrive_mocked_urlerror(url, filename=None, reporthook=None, data=None):
-    raise URLError('error')
+def _download_gpgkey_mocked_error(session, url, tmpdir):
+    return None, 'error'
 
 
 @pytest.mark.skip("Broken test")
@@ -448,7 +458,7 @@ def test_perform_https_gpgkey_urlerror(monkeypatch):
     monkeypatch.setattr(api, 'current_logger', logger_mocked())
     monkeypatch.setattr(reporting, 'create_report', create_report_mocked())
     monkeypatch.setattr('leapp.libraries.common.gpg._gpg_show_keys', _gpg_show_keys_mocked)
-    monkeypatch.setattr('six.moves.urllib.request.urlretrieve', _urlretrive_mocked_urlerror)
+    monkeypatch.setattr(missinggpgkey, '_download_gpgkey', _download_gpgkey_mocked_error)
 
     process()
     assert len(api.current_logger.warnmsg) == 1
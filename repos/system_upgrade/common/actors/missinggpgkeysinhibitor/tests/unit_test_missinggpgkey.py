@@ -2,10 +2,13 @@ import os
 import shutil
 import sys
 import tempfile
+import threading
 
 import distro
 import pytest
+from six.moves import BaseHTTPServer, socketserver
 
+from leapp.libraries.actor import missinggpgkey
 from leapp.libraries.actor.missinggpgkey import _expand_vars, _get_abs_file_path, _get_repo_gpgkey_urls
 from leapp.libraries.common.testutils import CurrentActorMocked
 from leapp.libraries.stdlib import api
@@ -70,3 +73,65 @@ def test_get_abs_file_path(monkeypatch, target_userspace, file_url, exists_in_co
     monkeypatch.setattr('os.path.exists', os_path_exists_mocked)
     path = _get_abs_file_path(target_userspace, file_url)
     assert path == exp
+
+
+class _KeyRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+
+    def do_GET(self):
+        self.connections.add(self.client_address[1])
+        if self.path.startswith('/missing'):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        content = 'key {}'.format(self.path).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    # do not wait for kept-alive connections on shutdown
+    daemon_threads = True
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_download_gpgkeys(monkeypatch, tmp_path, workers):
+    _KeyRequestHandler.connections = set()
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _KeyRequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    monkeypatch.setattr(missinggpgkey, 'GPGKEY_DOWNLOAD_WORKERS', workers)
+    base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    try:
+        urls = ['{}/key{}.gpg'.format(base_url, i) for i in range(10)] + ['{}/missing.gpg'.format(base_url)]
+        downloaded = missinggpgkey._download_gpgkeys(urls, str(tmp_path))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert sorted(downloaded) == sorted(urls)
+    for i in range(10):
+        key_file, error = downloaded['{}/key{}.gpg'.format(base_url, i)]
+        assert error is None
+        with open(key_file) as f:
+            assert f.read() == 'key /key{}.gpg'.format(i)
+    key_file, error = downloaded['{}/missing.gpg'.format(base_url)]
+    assert key_file is None
+    assert '404' in error
+    # connections are reused, at most one is opened per worker
+    assert len(_KeyRequestHandler.connections) <= workers
+
+
+def test_download_gpgkeys_unreachable(tmp_path):
+    downloaded = missinggpgkey._download_gpgkeys(['http://127.0.0.1:1/key.gpg'], str(tmp_path))
+    key_file, error = downloaded['http://127.0.0.1:1/key.gpg']
+    assert key_file is None
+    assert error
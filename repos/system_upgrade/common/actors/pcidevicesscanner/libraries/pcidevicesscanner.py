@@ -1,5 +1,6 @@
 import re
 
+from leapp.libraries.common.devicedriverdeprecation import get_deprecation_index
 from leapp.libraries.stdlib import api, run
 from leapp.models import (
     ActiveKernelModulesFacts,
@@ -76,15 +77,21 @@ def parse_pci_devices(pci_textual, pci_numeric):
 
 
 def produce_detected_devices(devices):
-    prefix_re = re.compile('0x')
-    entry_lookup = {
-        prefix_re.sub('', entry.device_id): entry
-        for message in api.consume(DeviceDriverDeprecationData) for entry in message.entries
-    }
+    index = get_deprecation_index()
+    if index:
+        get_entry = index.get_pci_device_entry
+    else:
+        prefix_re = re.compile('0x')
+        entry_lookup = {
+            prefix_re.sub('', entry.device_id): entry
+            for message in api.consume(DeviceDriverDeprecationData) for entry in message.entries
+        }
+        get_entry = entry_lookup.get
+    entries = [get_entry(device.pci_id) for device in devices]
     api.produce(*[
-        DetectedDeviceOrDriver(**entry_lookup[device.pci_id].dump())
-        for device in devices
-        if device.pci_id in entry_lookup
+        DetectedDeviceOrDriver(**entry.dump())
+        for entry in entries
+        if entry
     ])
 
 
@@ -94,16 +101,25 @@ def produce_detected_drivers(devices):
         for message in api.consume(ActiveKernelModulesFacts) for module in message.kernel_modules
     }
 
-    # Create a lookup by driver_name and filter out the kernel that are active
-    entry_lookup = {
-        entry.driver_name: entry
-        for message in api.consume(DeviceDriverDeprecationData) for entry in message.entries
-        if not entry.device_id and entry.driver_name and entry.driver_name not in active_modules
+    index = get_deprecation_index()
+    if index:
+        get_entry = index.get_driver_entry
+    else:
+        # Create a lookup by driver_name
+        entry_lookup = {
+            entry.driver_name: entry
+            for message in api.consume(DeviceDriverDeprecationData) for entry in message.entries
+            if not entry.device_id and entry.driver_name
+        }
+        get_entry = entry_lookup.get
+
+    # Filter out the kernel drivers that are active
+    drivers = {
+        device.driver for device in devices
+        if device.driver and device.driver not in active_modules and get_entry(device.driver)
     }
-
-    drivers = {device.driver for device in devices if device.driver in entry_lookup}
     api.produce(*[
-        DetectedDeviceOrDriver(**entry_lookup[driver].dump())
+        DetectedDeviceOrDriver(**get_entry(driver).dump())
         for driver in drivers
     ])
 
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 from collections import defaultdict, namedtuple
@@ -7,9 +8,16 @@ from itertools import chain
 from leapp import reporting
 from leapp.exceptions import StopActorExecution
 from leapp.libraries.common import fetch
-from leapp.libraries.common.config import architecture
+from leapp.libraries.common.config import architecture, version
 from leapp.libraries.common.rpms import get_leapp_packages, LeappComponents
-from leapp.libraries.stdlib import api
+from leapp.libraries.stdlib import api, CalledProcessError, run
+
+# NOTE: Every PES data file has its own cache file holding its events (already filtered by the architecture) in
+# a compact JSON form. The cache entry is used only when its key matches - i.e. the data file has the same sha256
+# digest, the architecture and the relevant releases are the same and the same version of leapp-repository is
+# installed. Bump the format version whenever the representation of cached events changes.
+PES_EVENTS_CACHE_DIR = '/var/lib/leapp/pes_events_cache'
+PES_EVENTS_CACHE_FORMAT_VERSION = 2
 
 # NOTE(mhecko): The modulestream field contains a set of modulestreams until the very end when we generate a Package
 # for every modulestream in this set.
@@ -61,12 +69,148 @@ class Action(IntEnum):
     REINSTALLED = 8
 
 
-def get_pes_events(pes_json_directory, pes_json_filename):
+def _get_file_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _get_events_cache_path(pes_json_path):
+    path_digest = hashlib.sha256(os.path.abspath(pes_json_path).encode('utf-8')).hexdigest()
+    return os.path.join(PES_EVENTS_CACHE_DIR, '{}.json'.format(path_digest))
+
+
+def _get_leapp_repository_version():
+    """
+    Get NEVRAs of the installed leapp-repository packages.
+
+    :return: A list of NEVRAs or None if the packages are not installed.
+    """
+    cmd = ['rpm', '-q', '--queryformat', r'%{NEVRA}\n'] + get_leapp_packages(component=LeappComponents.REPOSITORY)
+    try:
+        return run(cmd, split=True)['stdout']
+    except (CalledProcessError, OSError) as e:
+        api.current_logger().debug('Cannot get the version of leapp-repository: {}'.format(e))
+        return None
+
+
+def _get_events_cache_key(pes_json_path, arch, relevant_releases_match_list):
+    """
+    Get the key identifying the PES data file and the way it has been parsed.
+
+    :return: A list representing the key or None if the key cannot be created, e.g. the data file cannot be accessed
+             or leapp-repository is not installed as a package.
+    """
+    leapp_repository_version = _get_leapp_repository_version()
+    if not leapp_repository_version:
+        return None
+    try:
+        pes_json_digest = _get_file_digest(pes_json_path)
+    except (OSError, IOError):
+        return None
+    return [
+        PES_EVENTS_CACHE_FORMAT_VERSION,
+        leapp_repository_version,
+        arch,
+        list(relevant_releases_match_list or []),
+        pes_json_digest,
+    ]
+
+
+def _event_to_primitive(event):
+    def pkgs_to_primitive(pkgs):
+        return [[pkg.name, pkg.repository, pkg.modulestream] for pkg in pkgs]
+
+    return [event.id, int(event.action), pkgs_to_primitive(event.in_pkgs), pkgs_to_primitive(event.out_pkgs),
+            event.from_release, event.to_release, event.architectures]
+
+
+def _event_from_primitive(primitive):
+    def pkgs_from_primitive(pkgs):
+        return {Package(name, repository, tuple(modulestream) if modulestream else None)
+                for name, repository, modulestream in pkgs}
+
+    event_id, action, in_pkgs, out_pkgs, from_release, to_release, architectures = primitive
+    return Event(event_id, Action(action), pkgs_from_primitive(in_pkgs), pkgs_from_primitive(out_pkgs),
+                 tuple(from_release), tuple(to_release), list(architectures))
+
+
+def _load_cached_events(pes_json_path, cache_key):
+    """
+    Load events of the given PES data file from the cache.
+
+    :return: A tuple (events, provided_data_streams) or None if there is no valid cache entry.
+    """
+    cache_path = _get_events_cache_path(pes_json_path)
+    if not cache_key or not os.path.exists(cache_path):
+        return None
+
+    try:
+        with open(cache_path) as f:
+            cache_entry = json.load(f)
+        if cache_entry.get('key') != cache_key:
+            api.current_logger().debug('The cache of PES events for {} is outdated.'.format(pes_json_path))
+            return None
+        events = [_event_from_primitive(primitive) for primitive in cache_entry['events']]
+        return events, cache_entry['provided_data_streams']
+    except Exception as e:  # pylint: disable=broad-except
+        # The cache is just an optimization, fall back to parsing the data file
+        api.current_logger().debug('Cannot load the cache of PES events for {}: {}'.format(pes_json_path, e))
+        return None
+
+
+def _store_cached_events(pes_json_path, cache_key, events, provided_data_streams):
+    if not cache_key:
+        return
+
+    cache_path = _get_events_cache_path(pes_json_path)
+    cache_entry = {
+        'key': cache_key,
+        'events': [_event_to_primitive(event) for event in events],
+        'provided_data_streams': provided_data_streams,
+    }
+    tmp_cache_path = '{}.tmp'.format(cache_path)
+    try:
+        if not os.path.isdir(PES_EVENTS_CACHE_DIR):
+            os.makedirs(PES_EVENTS_CACHE_DIR, 0o700)
+        with open(tmp_cache_path, 'w') as f:
+            json.dump(cache_entry, f)
+        os.rename(tmp_cache_path, cache_path)
+    except (OSError, IOError) as e:
+        api.current_logger().debug('Cannot store the cache of PES events for {}: {}'.format(pes_json_path, e))
+
+
+def get_pes_events(pes_json_directory, pes_json_filename, relevant_releases_match_list=None):
     """
     Get all the events from the source JSON file exported from PES.
 
+    The parsed events are cached in PES_EVENTS_CACHE_DIR, so the JSON data file does not have to be parsed
+    again when leapp is executed repeatedly, until the data file is changed.
+
+    :param relevant_releases_match_list: If specified, only events with the release (to_release) matching
+                                         the list are returned (see version.matches_version for the format).
+                                         Other entries are dropped before they are expanded into events.
     :return: List of Event tuples, where each event contains event type and input/output pkgs
     """
+    arch = api.current_actor().configuration.architecture
+    pes_json_path = os.path.join(pes_json_directory, pes_json_filename)
+    cache_key = _get_events_cache_key(pes_json_path, arch, relevant_releases_match_list)
+
+    cached_events = _load_cached_events(pes_json_path, cache_key)
+    if cached_events is not None:
+        events, provided_data_streams = cached_events
+        api.current_logger().debug('Using the cached PES events for {}'.format(pes_json_path))
+        # The asset has to be reported in the same way as when it is loaded by fetch.load_data_asset
+        fetch.produce_consumed_data_asset(api.current_actor(),
+                                          pes_json_filename,
+                                          asset_fulltext_name='PES events file',
+                                          docs_url='',
+                                          docs_title='',
+                                          provided_data_streams=provided_data_streams)
+        return events
+
     try:
         # NOTE(pstodulk): load_data_assert raises StopActorExecutionError, see
         # the code for more info. Keeping the handling on the framework in such
@@ -83,10 +227,18 @@ def get_pes_events(pes_json_directory, pes_json_filename):
         if events_data.get('packageinfo') is None:
             raise ValueError('Found PES data with invalid structure')
 
-        all_events = list(chain(*[parse_entry(entry) for entry in events_data['packageinfo']]))
-        arch = api.current_actor().configuration.architecture
-        events_matching_arch = [e for e in all_events if not e.architectures or arch in e.architectures]
-        return events_matching_arch
+        provided_data_streams = events_data.get(fetch.ASSET_PROVIDED_DATA_STREAMS_FIELD)
+        if provided_data_streams and not isinstance(provided_data_streams, list):
+            provided_data_streams = []
+
+        # Hand the entries over to the parser, so they can be released while being parsed
+        entries = events_data.pop('packageinfo')
+        del events_data
+        events = parse_entries_incrementally(entries, arch, relevant_releases_match_list)
+
+        _store_cached_events(pes_json_path, cache_key, events, provided_data_streams)
+
+        return events
     except (ValueError, KeyError):
         local_path = os.path.join(pes_json_directory, pes_json_filename)
         title = 'Missing/Invalid PES data file ({})'.format(local_path)
@@ -184,6 +336,59 @@ def parse_pes_events(json_data):
     return list(chain(*[parse_entry(entry) for entry in data['packageinfo']]))
 
 
+def is_entry_relevant(entry, arch, relevant_releases_match_list=None, _release_relevance_cache=None):
+    """
+    Check whether the PES event entry (raw JSON data) can be relevant for the upgrade without parsing it.
+
+    Entries for other architectures and, if relevant_releases_match_list is specified, entries with releases
+    not matching the list are irrelevant. Entries with invalid architectures are considered relevant, so
+    the problem is detected by parse_entry.
+
+    :param _release_relevance_cache: Optional dictionary used to memoize results of release matching.
+    """
+    architectures = entry.get('architectures') or []
+    if architectures and arch not in architectures:
+        if all(entry_arch in architecture.ARCH_ACCEPTED for entry_arch in architectures):
+            return False
+
+    if not relevant_releases_match_list:
+        return True
+
+    release = parse_release(entry.get('release'))
+    if _release_relevance_cache is None:
+        _release_relevance_cache = {}
+    if release not in _release_relevance_cache:
+        _release_relevance_cache[release] = version.matches_version(relevant_releases_match_list,
+                                                                    '{}.{}'.format(*release))
+    return _release_relevance_cache[release]
+
+
+def parse_entries_incrementally(entries, arch, relevant_releases_match_list=None):
+    """
+    Parse PES event entries, dropping the irrelevant ones before they are expanded into events.
+
+    The given list of entries is consumed - every entry is removed from the list once it is processed, so
+    the memory occupied by the raw JSON data is released progressively and does not add up with the memory
+    occupied by the parsed events. The order of the resulting events is the same as the order of entries.
+
+    :param entries: List of PES event entries (see parse_entry). The list is emptied.
+    :param arch: The architecture of the system. Events for other architectures are dropped.
+    :param relevant_releases_match_list: See is_entry_relevant.
+    :return: List of Event tuples
+    """
+    events = []
+    release_relevance_cache = {}
+
+    # Pop the entries from the end of the list to avoid shifting the rest of the list
+    entries.reverse()
+    while entries:
+        entry = entries.pop()
+        if not is_entry_relevant(entry, arch, relevant_releases_match_list, release_relevance_cache):
+            continue
+        events.extend(event for event in parse_entry(entry) if not event.architectures or arch in event.architectures)
+    return events
+
+
 def parse_entry(entry):
     """
     Parse PES event data
@@ -99,17 +99,24 @@ def get_transaction_configuration():
     return transaction_configuration
 
 
-def get_relevant_releases(events):
+def get_relevant_releases_match_list():
     """
-    Get releases present in the PES Events that are relevant for this IPU.
-
-    Relevant release happened between the source OS version and the target OS version.
+    Get the version match list (see version.matches_version) matching releases relevant for this IPU.
     """
     # Collect releases that happened between source OS version and target OS version
-    relevant_releases_match_list = [
+    return [
         '> {0}'.format(api.current_actor().configuration.version.source),
         '<= {0}'.format(api.current_actor().configuration.version.target)
     ]
+
+
+def get_relevant_releases(events):
+    """
+    Get releases present in the PES Events that are relevant for this IPU.
+
+    Relevant release happened between the source OS version and the target OS version.
+    """
+    relevant_releases_match_list = get_relevant_releases_match_list()
     releases = {event.to_release for event in events}
     releases = [r for r in releases if version.matches_version(relevant_releases_match_list, '{}.{}'.format(*r))]
     return sorted(releases)
@@ -127,17 +134,82 @@ def _get_enabled_modules():
     return enabled_modules_msg.modules
 
 
+class EventIndex(object):
+    """
+    Index of PES events allowing to quickly look up the events relevant for the given release and packages.
+
+    Events are bucketed by their to_release and, within every bucket, an inverted index maps the in_pkgs of events
+    to positions of the events in the bucket. The relative order of events within the bucket is preserved, as the
+    result of the event application depends on it.
+    """
+
+    def __init__(self, events):
+        self._events_by_release = defaultdict(list)
+        self._positions_by_in_pkg = defaultdict(lambda: defaultdict(list))
+        # Events without in_pkgs have to be considered regardless of the current package set
+        self._positions_without_in_pkgs = defaultdict(list)
+
+        for event in events:
+            release_events = self._events_by_release[event.to_release]
+            position = len(release_events)
+            release_events.append(event)
+
+            if not event.in_pkgs:
+                self._positions_without_in_pkgs[event.to_release].append(position)
+                continue
+
+            pkg_index = self._positions_by_in_pkg[event.to_release]
+            for pkg in event.in_pkgs:
+                pkg_index[pkg].append(position)
+
+    def get_release_events(self, release, pkgs=None):
+        """
+        Get events with the given to_release.
+
+        :param release: The to_release of the events, a tuple in format (major, minor)
+        :param pkgs: If given, only events having at least one of their in_pkgs in pkgs (or no in_pkgs at all)
+                     are returned, as no other event can have any effect on pkgs
+        :return: A list of events in the same order they have been indexed
+        """
+        release_events = self._events_by_release.get(release, [])
+        if pkgs is None:
+            return list(release_events)
+
+        positions = set(self._positions_without_in_pkgs.get(release, ()))
+        pkg_index = self._positions_by_in_pkg.get(release, {})
+        # Iterate over the smaller of the two collections
+        if len(pkgs) < len(pkg_index):
+            for pkg in pkgs:
+                positions.update(pkg_index.get(pkg, ()))
+        else:
+            for pkg, pkg_positions in pkg_index.items():
+                if pkg in pkgs:
+                    positions.update(pkg_positions)
+
+        return [release_events[position] for position in sorted(positions)]
+
+
 def compute_pkg_changes_between_consequent_releases(source_installed_pkgs,
                                                     events,
                                                     release,
                                                     seen_pkgs,
                                                     pkgs_to_demodularize):
+    """
+    Apply events with the given to_release to the source_installed_pkgs.
+
+    :param events: A list of events or an EventIndex. In case of the EventIndex, only the events having
+                   at least one of their in_pkgs in seen_pkgs are processed - source_installed_pkgs as well as
+                   pkgs_to_demodularize are subsets of seen_pkgs, so no other event can have an effect.
+    """
     logger = api.current_logger()
     # Start with the installed packages and modify the set according to release events
     target_pkgs = set(source_installed_pkgs)
     pkgs_to_reinstall = set()
 
-    release_events = [e for e in events if e.to_release == release]
+    if isinstance(events, EventIndex):
+        release_events = events.get_release_events(release, seen_pkgs)
+    else:
+        release_events = [e for e in events if e.to_release == release]
 
     for event in release_events:
         # PRESENCE events have a different semantics than the other events - they add a package to a target state
@@ -237,6 +309,7 @@ def compute_packages_on_target_system(source_pkgs, events, releases):
     source_major_version = int(version.get_source_major_version())
     did_processing_cross_major_version = False
     pkgs_to_demodularize = set()  # Modified by compute_pkg_changes
+    event_index = EventIndex(events)
 
     for release in releases:
         if not did_processing_cross_major_version and release[0] > source_major_version:
@@ -244,7 +317,7 @@ def compute_packages_on_target_system(source_pkgs, events, releases):
             pkgs_to_demodularize = {pkg for pkg in target_pkgs if pkg.modulestream}
 
         target_pkgs, pkgs_to_demodularize, pkgs_to_reinstall = compute_pkg_changes_between_consequent_releases(
-            target_pkgs, events,
+            target_pkgs, event_index,
             release, seen_pkgs,
             pkgs_to_demodularize
         )
@@ -505,8 +578,12 @@ def remove_leapp_related_events(events):
 
 def process():
     # Retrieve data - installed_pkgs, transaction configuration, pes events
-    events = get_pes_events('/etc/leapp/files', 'pes-events.json')
-    if not events:
+    # Events for irrelevant releases are dropped already during the parsing to save the time and memory
+    relevant_releases_match_list = get_relevant_releases_match_list()
+    events = get_pes_events('/etc/leapp/files', 'pes-events.json', relevant_releases_match_list)
+    if events is None:
+        # The data file could not be used, e.g. it is outdated. NOTE: an empty list just means that there are no
+        # relevant events in the data file, events of vendors are still applied in such a case
         return
 
     active_vendors = []
@@ -519,7 +596,7 @@ def process():
 
         for pesfile in vendor_pesfiles:
             if pesfile[:-len(pes_json_suffix)] in active_vendors:
-                vendor_events = get_pes_events(VENDORS_DIR, pesfile)
+                vendor_events = get_pes_events(VENDORS_DIR, pesfile, relevant_releases_match_list)
                 events.extend(vendor_events)
 
     releases = get_relevant_releases(events)
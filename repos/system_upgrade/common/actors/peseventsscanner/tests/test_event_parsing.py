@@ -1,21 +1,26 @@
+import json
 import os.path
+import shutil
 from collections import namedtuple
 
 import pytest
 
 from leapp import reporting
 from leapp.exceptions import StopActorExecution
+from leapp.libraries.actor import pes_event_parsing
 from leapp.libraries.actor.pes_event_parsing import (
     Action,
     Event,
     get_pes_events,
+    is_entry_relevant,
     Package,
+    parse_entries_incrementally,
     parse_entry,
     parse_packageset,
     parse_pes_events
 )
 from leapp.libraries.common import fetch
-from leapp.libraries.common.testutils import create_report_mocked, CurrentActorMocked
+from leapp.libraries.common.testutils import create_report_mocked, CurrentActorMocked, produce_mocked
 from leapp.libraries.stdlib import api
 from leapp.models import ConsumedDataAsset
 
@@ -168,3 +173,108 @@ def test_get_pes_events_invalid_data_reported(monkeypatch):
         get_pes_events("doesn't", "matter")
 
     assert created_reports.called
+
+
+def test_get_pes_events_uses_cache(monkeypatch, tmpdir):
+    data_dir = tmpdir.mkdir('files')
+    shutil.copy(os.path.join(CUR_DIR, 'files/sample01.json'), str(data_dir.join('pes-events.json')))
+
+    load_data_asset_calls = []
+    leapp_repository_version = ['leapp-upgrade-el7toel8-0.20.0-1.el7.noarch']
+
+    def load_data_asset_mocked(actor, filename, asset_directory, **dummy_kwargs):
+        load_data_asset_calls.append(filename)
+        with open(os.path.join(asset_directory, filename)) as f:
+            return json.load(f)
+
+    actor = CurrentActorMocked()
+    actor.produces = (ConsumedDataAsset,)
+    monkeypatch.setattr(pes_event_parsing, 'PES_EVENTS_CACHE_DIR', str(tmpdir.join('cache')))
+    monkeypatch.setattr(pes_event_parsing, '_get_leapp_repository_version', lambda: leapp_repository_version)
+    monkeypatch.setattr(fetch, 'load_data_asset', load_data_asset_mocked)
+    monkeypatch.setattr(api, 'current_actor', actor)
+    monkeypatch.setattr(api, 'produce', produce_mocked())
+
+    parsed_events = get_pes_events(str(data_dir), 'pes-events.json')
+    assert len(load_data_asset_calls) == 1
+    assert not api.produce.called
+    cache_files = os.listdir(str(tmpdir.join('cache')))
+    assert len(cache_files) == 1
+    with open(str(tmpdir.join('cache', cache_files[0]))) as f:
+        assert json.load(f)['key'][1] == leapp_repository_version
+
+    cached_events = get_pes_events(str(data_dir), 'pes-events.json')
+    assert len(load_data_asset_calls) == 1
+    assert cached_events == parsed_events
+    assert len(api.produce.model_instances) == 1
+    assert isinstance(api.produce.model_instances[0], ConsumedDataAsset)
+    assert api.produce.model_instances[0].filename == 'pes-events.json'
+
+    # An update of leapp-repository invalidates the cache
+    leapp_repository_version[0] = 'leapp-upgrade-el7toel8-0.21.0-1.el7.noarch'
+    assert get_pes_events(str(data_dir), 'pes-events.json') == parsed_events
+    assert len(load_data_asset_calls) == 2
+
+    # Any change of the data file invalidates the cache
+    shutil.copy(os.path.join(CUR_DIR, 'files/sample04.json'), str(data_dir.join('pes-events.json')))
+    updated_events = get_pes_events(str(data_dir), 'pes-events.json')
+    assert len(load_data_asset_calls) == 3
+    assert len(updated_events) == 5
+
+
+def test_get_pes_events_no_cache_without_package(monkeypatch, tmpdir):
+    data_dir = tmpdir.mkdir('files')
+    shutil.copy(os.path.join(CUR_DIR, 'files/sample01.json'), str(data_dir.join('pes-events.json')))
+
+    def load_data_asset_mocked(actor, filename, asset_directory, **dummy_kwargs):
+        with open(os.path.join(asset_directory, filename)) as f:
+            return json.load(f)
+
+    monkeypatch.setattr(pes_event_parsing, 'PES_EVENTS_CACHE_DIR', str(tmpdir.join('cache')))
+    monkeypatch.setattr(pes_event_parsing, '_get_leapp_repository_version', lambda: None)
+    monkeypatch.setattr(fetch, 'load_data_asset', load_data_asset_mocked)
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked())
+
+    assert get_pes_events(str(data_dir), 'pes-events.json')
+    assert not tmpdir.join('cache').exists()
+
+
+@pytest.mark.parametrize(
+    ('entry', 'relevant_releases_match_list', 'expected_relevance'),
+    (
+        ({'architectures': []}, None, True),
+        ({'architectures': ['x86_64', 's390x']}, None, True),
+        ({'architectures': ['s390x']}, None, False),
+        ({'architectures': ['invalid-arch']}, None, True),
+        ({'release': {'major_version': 8, 'minor_version': 2}}, ['> 7.9', '<= 8.4'], True),
+        ({'release': {'major_version': 8, 'minor_version': 6}}, ['> 7.9', '<= 8.4'], False),
+        ({'release': {'major_version': 7, 'minor_version': 9}}, ['> 7.9', '<= 8.4'], False),
+        ({'architectures': ['s390x'], 'release': {'major_version': 8, 'minor_version': 2}}, ['> 7.9'], False),
+    )
+)
+def test_is_entry_relevant(entry, relevant_releases_match_list, expected_relevance):
+    assert is_entry_relevant(entry, 'x86_64', relevant_releases_match_list) == expected_relevance
+
+
+def test_parse_entries_incrementally():
+    def make_entry(event_id, minor_version, architectures):
+        return {
+            'id': event_id,
+            'action': Action.REMOVED,
+            'in_packageset': {'package': [{'name': 'pkg{}'.format(event_id), 'repository': 'repo'}]},
+            'release': {'major_version': 8, 'minor_version': minor_version},
+            'architectures': architectures,
+        }
+
+    entries = [
+        make_entry(1, 1, []),
+        make_entry(2, 1, ['s390x']),
+        make_entry(3, 6, []),
+        make_entry(4, 2, ['x86_64']),
+        make_entry(5, 0, ['x86_64', 's390x']),
+    ]
+
+    events = parse_entries_incrementally(entries, 'x86_64', ['> 7.9', '<= 8.4'])
+
+    assert [event.id for event in events] == [1, 4, 5]
+    assert not entries
@@ -1,3 +1,4 @@
+import random
 from functools import partial
 
 import pytest
@@ -8,7 +9,9 @@ from leapp.libraries.actor.pes_events_scanner import (
     Action,
     api,
     compute_packages_on_target_system,
+    compute_pkg_changes_between_consequent_releases,
     compute_rpm_tasks_from_pkg_set_diff,
+    EventIndex,
     get_installed_pkgs,
     Package,
     process,
@@ -17,6 +20,7 @@ from leapp.libraries.actor.pes_events_scanner import (
 )
 from leapp.libraries.common.testutils import create_report_mocked, CurrentActorMocked, produce_mocked
 from leapp.models import (
+    ActiveVendorList,
     DistributionSignedRPM,
     EnabledModules,
     PESIDRepositoryEntry,
@@ -225,7 +229,7 @@ def test_actor_performs(monkeypatch):
               (8, 0), (8, 1), []),
     ]
 
-    monkeypatch.setattr(pes_events_scanner, 'get_pes_events', lambda data_folder, json_filename: events)
+    monkeypatch.setattr(pes_events_scanner, 'get_pes_events', lambda data_folder, json_filename, *args: events)
 
     _RPM = partial(RPM, epoch='', packager='', version='', release='', arch='', pgpsig='')
 
@@ -274,6 +278,30 @@ def test_actor_performs(monkeypatch):
     assert produced_rpm_tasks[0].modules_to_reset == expected_rpm_tasks.modules_to_reset
 
 
+def test_vendor_events_loaded_without_relevant_main_events(monkeypatch, tmpdir):
+    vendor_event = Event(1, Action.REMOVED, {Package('vendor-pkg', 'vendor-repo', None)}, set(), (7, 9), (8, 0), [])
+    tmpdir.join('vendor_pes.json').write('{}')
+    tmpdir.join('inactive_pes.json').write('{}')
+    loaded_events = []
+
+    def get_pes_events_mocked(folder, filename, *args):
+        return [vendor_event] if filename == 'vendor_pes.json' else []
+
+    def get_relevant_releases_mocked(events):
+        loaded_events.extend(events)
+        raise StopIteration()  # Stop the processing, only the loaded events are checked here
+
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=[ActiveVendorList(data=['vendor'])],
+                                                                 src_ver='7.9', dst_ver='8.2'))
+    monkeypatch.setattr(pes_events_scanner, 'VENDORS_DIR', str(tmpdir))
+    monkeypatch.setattr(pes_events_scanner, 'get_pes_events', get_pes_events_mocked)
+    monkeypatch.setattr(pes_events_scanner, 'get_relevant_releases', get_relevant_releases_mocked)
+
+    with pytest.raises(StopIteration):
+        pes_events_scanner.process()
+    assert loaded_events == [vendor_event]
+
+
 def test_transaction_configuration_has_effect(monkeypatch):
     _Pkg = partial(Package, repository=None, modulestream=None)
 
@@ -331,7 +359,7 @@ def test_blacklisted_repoid_is_not_produced(monkeypatch):
     ]
 
     monkeypatch.setattr(pes_events_scanner, 'get_installed_pkgs', lambda: installed_pkgs)
-    monkeypatch.setattr(pes_events_scanner, 'get_pes_events', lambda folder, filename: events)
+    monkeypatch.setattr(pes_events_scanner, 'get_pes_events', lambda folder, filename, *args: events)
     monkeypatch.setattr(pes_events_scanner, 'apply_transaction_configuration', lambda pkgs: pkgs)
     monkeypatch.setattr(pes_events_scanner, 'get_blacklisted_repoids', lambda: {'blacklisted-rhel8'})
     monkeypatch.setattr(pes_events_scanner, 'replace_pesids_with_repoids_in_packages',
@@ -467,3 +495,62 @@ def test_remove_leapp_related_events(monkeypatch):
 
     out_events = pes_events_scanner.remove_leapp_related_events(in_events)
     assert out_events == expected_out_events
+
+
+def test_event_index_lookup():
+    events = [
+        Event(1, Action.REMOVED, {Package('a', 'repo', None)}, set(), (7, 9), (8, 0), []),
+        Event(2, Action.MOVED, {Package('b', 'repo', None)}, {Package('b', 'repo8', None)}, (7, 9), (8, 0), []),
+        Event(3, Action.PRESENT, set(), {Package('c', 'repo8', None)}, (7, 9), (8, 0), []),
+        Event(4, Action.MERGED,
+              {Package('a', 'repo', None), Package('b', 'repo', None)}, {Package('ab', 'repo8', None)},
+              (7, 9), (8, 0), []),
+        Event(5, Action.REMOVED, {Package('a', 'repo', ('m', 's'))}, set(), (7, 9), (8, 0), []),
+        Event(6, Action.REMOVED, {Package('a', 'repo', None)}, set(), (8, 0), (8, 1), []),
+    ]
+
+    event_index = EventIndex(events)
+
+    assert [e.id for e in event_index.get_release_events((8, 0))] == [1, 2, 3, 4, 5]
+    assert [e.id for e in event_index.get_release_events((8, 0), {Package('a', 'repo', None)})] == [1, 3, 4]
+    assert [e.id for e in event_index.get_release_events((8, 0), {Package('b', 'other-repo', None)})] == [2, 3, 4]
+    assert [e.id for e in event_index.get_release_events((8, 1), set())] == []
+    assert not event_index.get_release_events((9, 0), {Package('a', 'repo', None)})
+
+
+def test_indexed_event_application_matches_linear_scan(monkeypatch):
+    """Check that applying events through the EventIndex gives the same results as scanning all events."""
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(src_ver='7.9', dst_ver='8.2'))
+
+    rand = random.Random(42)
+    releases = [(8, 0), (8, 1), (8, 2)]
+    pkg_names = ['pkg{}'.format(i) for i in range(400)]
+    modulestreams = (None, ('module', 'stream'))
+
+    def random_pkgs(count):
+        return {Package(rand.choice(pkg_names), 'repo', rand.choice(modulestreams)) for dummy in range(count)}
+
+    events = []
+    for event_id in range(2000):
+        action = rand.choice(list(Action))
+        in_pkgs = random_pkgs(rand.randint(0, 3)) if action != Action.PRESENT else random_pkgs(1)
+        out_pkgs = random_pkgs(rand.randint(0, 3))
+        events.append(Event(event_id, action, in_pkgs, out_pkgs, (7, 9), rand.choice(releases), []))
+
+    event_index = EventIndex(events)
+    installed_pkgs = random_pkgs(150)
+
+    linear_state = (set(installed_pkgs), set(installed_pkgs), set(installed_pkgs))
+    indexed_state = (set(installed_pkgs), set(installed_pkgs), set(installed_pkgs))
+    for release in releases:
+        linear_result = compute_pkg_changes_between_consequent_releases(
+            linear_state[0], events, release, linear_state[1], linear_state[2]
+        )
+        indexed_result = compute_pkg_changes_between_consequent_releases(
+            indexed_state[0], event_index, release, indexed_state[1], indexed_state[2]
+        )
+
+        assert [pkgs_into_tuples(pkgs) for pkgs in linear_result] == [pkgs_into_tuples(p) for p in indexed_result]
+
+        linear_state = (linear_result[0], linear_state[1].union(linear_result[0]), linear_result[1])
+        indexed_state = (indexed_result[0], indexed_state[1].union(indexed_result[0]), indexed_result[1])
@@ -1,6 +1,6 @@
 from leapp.actors import Actor
 from leapp.libraries.actor.repositoriesmapping import scan_repositories
-from leapp.models import ConsumedDataAsset, RepositoriesMapping
+from leapp.models import ConsumedDataAsset, RepositoriesMapping, RHUIInfo
 from leapp.tags import FactsPhaseTag, IPUWorkflowTag
 
 
@@ -9,11 +9,13 @@ class RepositoriesMappingScanner(Actor):
     Produces message containing repository mapping based on provided file.
 
     The actor filters out data irrelevant to the current IPU (data with different
-    source/target major versions) from the raw repository mapping data.
+    source/target major versions, architectures or cloud providers) from the raw
+    repository mapping data. The filtered data are kept in /var/lib/leapp/repomap
+    and reused while the repository mapping file does not change.
     """
 
     name = 'repository_mapping'
-    consumes = ()
+    consumes = (RHUIInfo,)
     produces = (ConsumedDataAsset, RepositoriesMapping,)
     tags = (IPUWorkflowTag, FactsPhaseTag)
 
@@ -1,12 +1,16 @@
+import hashlib
+import json
 import os
 
+import six
+
 from leapp.exceptions import StopActorExecutionError
 from leapp.libraries.common.config.version import get_source_major_version, get_target_major_version
 from leapp.libraries.common.repomaputils import RepoMapData
 from leapp.libraries.common.fetch import load_data_asset
 from leapp.libraries.common.rpms import get_leapp_packages, LeappComponents
 from leapp.libraries.stdlib import api
-from leapp.models import RepositoriesMapping
+from leapp.models import RepositoriesMapping, RHUIInfo
 from leapp.models.fields import ModelViolationError
 
 OLD_REPOMAP_FILE = 'repomap.csv'
@@ -15,6 +19,18 @@ OLD_REPOMAP_FILE = 'repomap.csv'
 REPOMAP_FILE = 'repomap.json'
 """The name of the new repository mapping file."""
 
+REPOMAP_CACHE_DIR = '/var/lib/leapp/repomap'
+"""
+The directory with the compact repository mapping file.
+
+The compact file contains only the data relevant for the current upgrade path,
+architecture and cloud provider, and it is used instead of the full file
+as long as the full file and the system properties do not change.
+"""
+
+REPOMAP_CACHE_KEY = 'leapp_cache_key'
+"""The field of the compact repository mapping file identifying the data it has been created from."""
+
 
 def _inhibit_upgrade(msg):
     local_path = os.path.join('/etc/leapp/file', REPOMAP_FILE)
@@ -32,15 +48,118 @@ def _inhibit_upgrade(msg):
     raise StopActorExecutionError(msg, details={'hint': hint})
 
 
+def _get_cloud_provider():
+    rhui_info = next(api.consume(RHUIInfo), None)
+    return rhui_info.provider if rhui_info else ''
+
+
+def _is_relevant_repository(entry, major_versions, arch, cloud_provider):
+    if not isinstance(entry, dict):
+        # keep the invalid data for the validation
+        return True
+    rhui = entry.get('rhui', '')
+    # cloud providers might have multiple variants, e.g. aws: (aws, aws-sap-e4s)
+    matches_rhui = not rhui or not isinstance(rhui, six.string_types) or cloud_provider.startswith(rhui)
+    return (
+        entry.get('major_version', major_versions[0]) in major_versions
+        and entry.get('arch', arch) == arch
+        and matches_rhui
+    )
+
+
+def get_compact_repomap(json_data, source_major_version, target_major_version, arch, cloud_provider=''):
+    """
+    Return the repository mapping data containing only the data relevant for the upgrade
+
+    The mapping for other upgrade paths and the repositories of other major versions, architectures
+    and cloud providers are dropped, so they are not deserialized and stored in the produced message.
+    Data with invalid structure are kept, so they are reported by the validation of the data.
+    """
+    if not isinstance(json_data, dict):
+        return json_data
+    major_versions = (source_major_version, target_major_version)
+    compact_data = dict(json_data)
+    if isinstance(json_data.get('mapping'), list):
+        compact_data['mapping'] = [
+            mapping for mapping in json_data['mapping']
+            if not isinstance(mapping, dict) or (
+                mapping.get('source_major_version', source_major_version) == source_major_version
+                and mapping.get('target_major_version', target_major_version) == target_major_version
+            )
+        ]
+    if isinstance(json_data.get('repositories'), list):
+        compact_data['repositories'] = []
+        for repo_family in json_data['repositories']:
+            if isinstance(repo_family, dict) and isinstance(repo_family.get('entries'), list):
+                repo_family = dict(repo_family)
+                repo_family['entries'] = [
+                    entry for entry in repo_family['entries']
+                    if _is_relevant_repository(entry, major_versions, arch, cloud_provider)
+                ]
+            # keep the families without relevant repositories for the validation of the mapping
+            compact_data['repositories'].append(repo_family)
+    return compact_data
+
+
+def _get_repomap_cache_key(repofile):
+    """
+    Return the identification of the repository mapping data and the system properties it is filtered by
+
+    Return None when the repository mapping file cannot be read.
+    """
+    try:
+        with open(os.path.join('/etc/leapp/files', repofile), 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    except (OSError, IOError):
+        return None
+    return '{}:{}:{}:{}:{}:{}'.format(digest, RepoMapData.VERSION_FORMAT, get_source_major_version(),
+                                      get_target_major_version(), api.current_actor().configuration.architecture,
+                                      _get_cloud_provider())
+
+
+def _get_cached_repomap_key(repofile):
+    try:
+        with open(os.path.join(REPOMAP_CACHE_DIR, repofile)) as f:
+            data = json.load(f)
+    except (OSError, IOError, ValueError):
+        return None
+    return data.get(REPOMAP_CACHE_KEY) if isinstance(data, dict) else None
+
+
+def _store_compact_repomap(repofile, json_data, cache_key):
+    compact_data = get_compact_repomap(json_data, get_source_major_version(), get_target_major_version(),
+                                       api.current_actor().configuration.architecture, _get_cloud_provider())
+    compact_data[REPOMAP_CACHE_KEY] = cache_key
+    path = os.path.join(REPOMAP_CACHE_DIR, repofile)
+    try:
+        if not os.path.isdir(REPOMAP_CACHE_DIR):
+            os.makedirs(REPOMAP_CACHE_DIR)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(compact_data, f)
+        os.rename(path + '.tmp', path)
+    except (OSError, IOError) as err:
+        # the compact data are just an optimization
+        api.current_logger().debug('Cannot store the compact repository mapping data: {}'.format(err))
+
+
 def _read_repofile(repofile):
     # NOTE(pstodulk): load_data_assert raises StopActorExecutionError, see
     # the code for more info. Keeping the handling on the framework in such
     # a case as we have no work to do in such a case here.
+    cache_key = _get_repomap_cache_key(repofile)
+    if cache_key and _get_cached_repomap_key(repofile) == cache_key:
+        api.current_logger().debug('Using the compact repository mapping data from {}'.format(REPOMAP_CACHE_DIR))
+        asset_directory = REPOMAP_CACHE_DIR
+    else:
+        asset_directory = '/etc/leapp/files'
     repofile_data = load_data_asset(api.current_actor(),
                                     repofile,
                                     asset_fulltext_name='Repositories mapping',
                                     docs_url='',
-                                    docs_title='')
+                                    docs_title='',
+                                    asset_directory=asset_directory)
+    if cache_key and asset_directory != REPOMAP_CACHE_DIR and isinstance(repofile_data, dict):
+        _store_compact_repomap(repofile, repofile_data, cache_key)
     return repofile_data
 
 
@@ -50,7 +169,6 @@ def scan_repositories(read_repofile_func=_read_repofile):
 
     See the description of the actor for more details.
     """
-    # TODO: add filter based on the current arch
     # TODO: deprecate the product type and introduce the "channels" ?.. more or less
     # NOTE: product type is changed, now it's channel: eus,e4s,aus,tus,ga,beta
 
@@ -64,6 +182,8 @@ def scan_repositories(read_repofile_func=_read_repofile):
 
     json_data = read_repofile_func(REPOMAP_FILE)
     try:
+        json_data = get_compact_repomap(json_data, get_source_major_version(), get_target_major_version(),
+                                        api.current_actor().configuration.architecture, _get_cloud_provider())
         repomap_data = RepoMapData.load_from_dict(json_data)
         mapping = repomap_data.get_mappings(get_source_major_version(), get_target_major_version())
 
@@ -10,7 +10,7 @@ from leapp.libraries.common import fetch
 from leapp.libraries.common.config import architecture, version
 from leapp.libraries.common.testutils import CurrentActorMocked, produce_mocked
 from leapp.libraries.stdlib import api
-from leapp.models import ConsumedDataAsset, PESIDRepositoryEntry, RPM
+from leapp.models import ConsumedDataAsset, PESIDRepositoryEntry, RHUIInfo, RPM
 
 CUR_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -298,3 +298,103 @@ def test_scan_repositories_with_repo_entry_mapping_target_not_a_list(monkeypatch
         repositoriesmapping.scan_repositories(lambda dummy: json_data)
 
     assert 'repository mapping file is invalid' in error_info.value.message
+
+
+def _make_repomap_repo(major_version, repoid, arch='x86_64', rhui=''):
+    entry = {'major_version': major_version, 'repoid': repoid, 'arch': arch, 'repo_type': 'rpm', 'channel': 'ga'}
+    if rhui:
+        entry['rhui'] = rhui
+    return entry
+
+
+@pytest.fixture
+def repomap_multiarch_data():
+    return {
+        'datetime': '202107141655Z',
+        'version_format': repositoriesmapping.RepoMapData.VERSION_FORMAT,
+        'mapping': [
+            {'source_major_version': '7', 'target_major_version': '8',
+             'entries': [{'source': 'pesid7', 'target': ['pesid8']}]},
+            {'source_major_version': '8', 'target_major_version': '9',
+             'entries': [{'source': 'pesid8', 'target': ['pesid9']}]},
+        ],
+        'repositories': [
+            {'pesid': 'pesid7', 'entries': [
+                _make_repomap_repo('7', 'rhel7'),
+                _make_repomap_repo('7', 'rhel7-power', arch='ppc64le'),
+                _make_repomap_repo('7', 'rhel7-aws', rhui='aws'),
+                _make_repomap_repo('7', 'rhel7-azure', rhui='azure'),
+            ]},
+            {'pesid': 'pesid8', 'entries': [
+                _make_repomap_repo('8', 'rhel8'),
+                _make_repomap_repo('8', 'rhel8-power', arch='ppc64le'),
+                _make_repomap_repo('8', 'rhel8-aws', rhui='aws'),
+            ]},
+            {'pesid': 'pesid9', 'entries': [_make_repomap_repo('9', 'rhel9')]},
+        ]
+    }
+
+
+@pytest.mark.parametrize('arch,provider,expected_repoids', [
+    ('x86_64', '', ['rhel7', 'rhel8']),
+    ('ppc64le', '', ['rhel7-power', 'rhel8-power']),
+    ('x86_64', 'aws', ['rhel7', 'rhel7-aws', 'rhel8', 'rhel8-aws']),
+    ('x86_64', 'aws-sap-e4s', ['rhel7', 'rhel7-aws', 'rhel8', 'rhel8-aws']),
+    ('x86_64', 'azure', ['rhel7', 'rhel7-azure', 'rhel8']),
+])
+def test_scan_repositories_filters_data(monkeypatch, repomap_multiarch_data, arch, provider, expected_repoids):
+    msgs = [RHUIInfo(provider=provider)] if provider else []
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(arch=arch, src_ver='7.9', dst_ver='8.4', msgs=msgs))
+    monkeypatch.setattr(api, 'produce', produce_mocked())
+    monkeypatch.setattr(repositoriesmapping, '_get_cloud_provider', lambda: provider)
+
+    repositoriesmapping.scan_repositories(lambda dummy: repomap_multiarch_data)
+
+    repo_mapping = api.produce.model_instances[0]
+    assert [(entry.source, entry.target) for entry in repo_mapping.mapping] == [('pesid7', ['pesid8'])]
+    assert sorted(repo.repoid for repo in repo_mapping.repositories) == expected_repoids
+
+
+def test_read_repofile_uses_compact_data(monkeypatch, tmp_path, repomap_multiarch_data):
+    files_dir = tmp_path / 'files'
+    files_dir.mkdir()
+    (files_dir / 'repomap.json').write_text(u'{}'.format(json.dumps(repomap_multiarch_data)))
+    cache_dir = str(tmp_path / 'cache')
+    loaded_from = []
+
+    def load_data_asset_mocked(actor, asset_filename, asset_directory='/etc/leapp/files', **kwargs):
+        directory = str(files_dir) if asset_directory == '/etc/leapp/files' else asset_directory
+        loaded_from.append(directory)
+        with open(os.path.join(directory, asset_filename)) as f:
+            return json.load(f)
+
+    orig_open = open
+
+    def open_mocked(path, *args, **kwargs):
+        if path == '/etc/leapp/files/repomap.json':
+            path = str(files_dir / 'repomap.json')
+        return orig_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(src_ver='7.9', dst_ver='8.4'))
+    monkeypatch.setattr(repositoriesmapping, 'REPOMAP_CACHE_DIR', cache_dir)
+    monkeypatch.setattr(repositoriesmapping, 'load_data_asset', load_data_asset_mocked)
+    monkeypatch.setattr(repositoriesmapping, '_get_cloud_provider', lambda: '')
+    monkeypatch.setattr(repositoriesmapping, 'open', open_mocked, raising=False)
+
+    full_data = repositoriesmapping._read_repofile('repomap.json')
+    assert full_data == repomap_multiarch_data
+    compact_data = repositoriesmapping._read_repofile('repomap.json')
+    assert loaded_from == [str(files_dir), cache_dir]
+    assert len(compact_data['mapping']) == 1
+    assert [repo['repoid'] for family in compact_data['repositories'] for repo in family['entries']] == [
+        'rhel7', 'rhel8'
+    ]
+
+    # the compact data are created again when the repository mapping file changes
+    repomap_multiarch_data['repositories'][2]['entries'].append(_make_repomap_repo('8', 'rhel8-new'))
+    (files_dir / 'repomap.json').write_text(u'{}'.format(json.dumps(repomap_multiarch_data)))
+    del loaded_from[:]
+    repositoriesmapping._read_repofile('repomap.json')
+    compact_data = repositoriesmapping._read_repofile('repomap.json')
+    assert loaded_from == [str(files_dir), cache_dir]
+    assert 'rhel8-new' in [repo['repoid'] for family in compact_data['repositories'] for repo in family['entries']]
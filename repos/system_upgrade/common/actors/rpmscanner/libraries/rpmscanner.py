@@ -28,7 +28,8 @@ def _get_package_repository_data_yum():
     pkg_repos = {}
 
     try:
-        for pkg in yum_base.doPackageLists().installed:
+        # NOTE: work just with the rpmdb, doPackageLists() would load also all enabled repositories
+        for pkg in yum_base.rpmdb.returnPackages():
             pkg_repos[pkg.name] = pkg.ui_from_repo.lstrip('@')
     except ValueError as e:
         if 'locale' not in str(e):  # reraise if error is not related to locales
@@ -43,6 +44,36 @@ def _get_package_repository_data_yum():
     return pkg_repos
 
 
+def _get_nevra(name, epoch, version, release, arch):
+    """ Return NEVRA of the package in the format used by the DNF history database """
+    if epoch and epoch != '0':
+        return '{}-{}:{}-{}.{}'.format(name, epoch, version, release, arch)
+    return '{}-{}-{}.{}'.format(name, version, release, arch)
+
+
+def _get_package_repository_data_dnf_history(installed_rpms):
+    """
+    Return dictionary mapping package name with repository from which it was installed.
+
+    The repositories are read from the DNF history database for the given
+    installed rpms, so the sack does not need to be filled. Returns None if
+    the database cannot be read this way.
+
+    :param installed_rpms: list of (name, epoch, version, release, arch) tuples
+    """
+    try:
+        history = dnf.Base().history
+        pkg_repos = {}
+        for name, epoch, version, release, arch in installed_rpms:
+            # installed packages missing in the history are reported as @System by DNF
+            pkg_repos[name] = history.repo(_get_nevra(name, epoch, version, release, arch)) or 'System'
+        return pkg_repos
+    except Exception as e:  # pylint: disable=broad-except
+        # the API of the history database differs between DNF versions, just use the slower way
+        api.current_logger().debug('Cannot read the DNF history database directly: {}'.format(e))
+        return None
+
+
 def _get_package_repository_data_dnf():
     dnf_base = dnf.Base()
     pkg_repos = {}
@@ -66,8 +97,11 @@ def _get_package_repository_data_dnf():
     return pkg_repos
 
 
-def get_package_repository_data():
+def get_package_repository_data(installed_rpms=None):
     """ Return dictionary mapping package name with repository from which it was installed.
+
+    :param installed_rpms: list of (name, epoch, version, release, arch) tuples of installed rpms.
+                           If set, repositories are read just for these rpms without filling the DNF sack.
     Note:
         There's no yum module for py3. The dnf module can be used only on RHEL 8+,
         on RHEL 7 there's a bug in dnf preventing us to do so:
@@ -76,7 +110,12 @@ def get_package_repository_data():
     if not no_yum:
         return _get_package_repository_data_yum()
     if not no_dnf:
-        return _get_package_repository_data_dnf()
+        pkg_repos = None
+        if installed_rpms is not None:
+            pkg_repos = _get_package_repository_data_dnf_history(installed_rpms)
+        if pkg_repos is None:
+            pkg_repos = _get_package_repository_data_dnf()
+        return pkg_repos
     raise StopActorExecutionError(message=no_yum_warning_msg)
 
 
@@ -106,16 +145,19 @@ def map_modular_rpms_to_modules():
 
 # TODO(drehak) unit tests
 def process():
-    output = rpms.get_installed_rpms()
-    pkg_repos = get_package_repository_data()
+    entries = []
+    for entry in rpms.get_installed_rpms():
+        entry = entry.strip()
+        if entry:
+            entries.append(entry.split('|'))
+    pkg_repos = get_package_repository_data([
+        (name, epoch, version, release, arch)
+        for name, version, release, epoch, dummy_packager, arch, dummy_pgpsig in entries
+    ])
     rpm_streams = map_modular_rpms_to_modules()
 
     result = InstalledRPM()
-    for entry in output:
-        entry = entry.strip()
-        if not entry:
-            continue
-        name, version, release, epoch, packager, arch, pgpsig = entry.split('|')
+    for name, version, release, epoch, packager, arch, pgpsig in entries:
         repository = pkg_repos.get(name, '')
         rpm_key = (name, epoch, version, release, arch)
         module, stream = rpm_streams.get(rpm_key, (None, None))
@@ -154,7 +154,7 @@ PACKAGE_REPOS = {
 
 def test_process(monkeypatch):
     monkeypatch.setattr(module_lib, 'get_modules', lambda: MODULES)
-    monkeypatch.setattr(rpmscanner, 'get_package_repository_data', lambda: PACKAGE_REPOS)
+    monkeypatch.setattr(rpmscanner, 'get_package_repository_data', lambda *args: PACKAGE_REPOS)
     monkeypatch.setattr(rpms, 'get_installed_rpms', lambda: INSTALLED_RPMS)
     monkeypatch.setattr(api, 'produce', testutils.produce_mocked())
 
@@ -192,3 +192,69 @@ def test_process(monkeypatch):
     assert items['passwd'].arch == 'x86_64'
     assert not items['passwd'].module
     assert not items['passwd'].stream
+
+
+@pytest.mark.parametrize('epoch,expected', [
+    ('0', 'tcpdump-4.9.3-2.fc31.x86_64'),
+    ('14', 'tcpdump-14:4.9.3-2.fc31.x86_64'),
+])
+def test_get_nevra(epoch, expected):
+    assert rpmscanner._get_nevra('tcpdump', epoch, '4.9.3', '2.fc31', 'x86_64') == expected
+
+
+class _HistoryMocked(object):
+    def __init__(self, repos):
+        self.repos = repos
+
+    def repo(self, nevra):
+        return self.repos.get(nevra)
+
+
+class _DnfBaseMocked(object):
+    def __init__(self, history):
+        self._history = history
+        self.sack_filled = False
+
+    @property
+    def history(self):
+        if isinstance(self._history, Exception):
+            raise self._history
+        return self._history
+
+    def fill_sack(self, **dummy_kwargs):
+        self.sack_filled = True
+
+    @property
+    def sack(self):
+        return self
+
+    def query(self):
+        return []
+
+
+class _DnfMocked(object):
+    def __init__(self, base):
+        self.base = base
+
+    def Base(self):  # pylint: disable=invalid-name
+        return self.base
+
+
+@pytest.mark.parametrize('history,expected_repos,sack_filled', [
+    (_HistoryMocked({'tcpdump-14:4.9.3-2.fc31.x86_64': 'repo2'}), {'tcpdump': 'repo2', 'passwd': 'System'}, False),
+    # the history database cannot be read directly, fill the sack instead
+    (AttributeError('no history'), {}, True),
+])
+def test_get_package_repository_data_dnf(monkeypatch, history, expected_repos, sack_filled):
+    dnf_base = _DnfBaseMocked(history)
+    monkeypatch.setattr(rpmscanner, 'no_yum', True)
+    monkeypatch.setattr(rpmscanner, 'no_dnf', False)
+    monkeypatch.setattr(rpmscanner, 'dnf', _DnfMocked(dnf_base), raising=False)
+    monkeypatch.setattr(api, 'current_logger', testutils.logger_mocked())
+
+    pkg_repos = rpmscanner.get_package_repository_data([
+        ('tcpdump', '14', '4.9.3', '2.fc31', 'x86_64'),
+        ('passwd', '0', '0.80', '7.fc31', 'x86_64'),
+    ])
+    assert pkg_repos == expected_repos
+    assert dnf_base.sack_filled == sack_filled
@@ -1,6 +1,7 @@
 import re
 
 from leapp.libraries.common.config import architecture
+from leapp.libraries.common.devicedriverdeprecation import get_deprecation_index
 from leapp.libraries.stdlib import api, CalledProcessError, run
 from leapp.models import CPUInfo, DetectedDeviceOrDriver, DeviceDriverDeprecationData
 
@@ -23,6 +24,9 @@ def _get_cpu_flags(lscpu):
 
 
 def _get_cpu_entries_for(arch_prefix):
+    index = get_deprecation_index()
+    if index:
+        return index.get_cpu_entries(arch_prefix)
     result = []
     for message in api.consume(DeviceDriverDeprecationData):
         result.extend([
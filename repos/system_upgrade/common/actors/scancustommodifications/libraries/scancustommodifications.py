@@ -1,5 +1,6 @@
 import ast
 import os
+from multiprocessing.pool import ThreadPool
 
 from leapp.exceptions import StopActorExecution
 from leapp.libraries.common import rpms
@@ -9,6 +10,8 @@ from leapp.models import CustomModifications
 LEAPP_REPO_DIRS = ['/usr/share/leapp-repository']
 LEAPP_PACKAGES_TO_IGNORE = ['snactor']
 
+_actor_names_cache = {}
+
 
 def _get_dirs_to_check(component):
     if component == 'repository':
@@ -29,7 +32,15 @@ def deduce_actor_name(a_file):
     A helper to map an actor/library to the actor name
     If a_file is an actor or an actor library, the name of the actor (name attribute of actor class) will be returned.
     Empty string is returned if the file could not be associated with any actor.
+
+    Results are memoized, so every actor.py file is parsed just once.
     """
+    if a_file not in _actor_names_cache:
+        _actor_names_cache[a_file] = _deduce_actor_name(a_file)
+    return _actor_names_cache[a_file]
+
+
+def _deduce_actor_name(a_file):
     if not os.path.exists(a_file):
         return ''
     # NOTE(ivasilev) Actors reside only in actor.py files, so AST processing any other file can be skipped.
@@ -95,6 +106,18 @@ def _modification_model(filename, change_type, component, rpm_checks_str=''):
                                actor_name=deduce_actor_name(filename), rpm_checks_str=rpm_checks_str)
 
 
+def _get_installed_files(rpms):
+    """
+    Return the list of files installed by given rpms.
+
+    All rpms are queried at once.
+    """
+    return _run_command(
+        ['rpm', '-ql'] + rpms,
+        'Could not get a list of installed files from rpms {}'.format(', '.join(rpms))
+    )
+
+
 def check_for_modifications(component):
     """
     This will return a list of any untypical files or changes to shipped leapp files discovered on the system.
@@ -102,25 +125,25 @@ def check_for_modifications(component):
     """
     rpms = _get_rpms_to_check(component)
     dirs = _get_dirs_to_check(component)
-    source_of_truth = []
     leapp_files = []
-    # Let's collect data about what should have been installed from rpm
-    for rpm in rpms:
-        res = _run_command(['rpm', '-ql', rpm], 'Could not get a list of installed files from rpm {}'.format(rpm))
-        source_of_truth.extend(res)
     # Let's collect data about what's really on the system
     for directory in dirs:
         res = _run_command(['find', directory, '-type', 'f'],
                            'Could not get a list of leapp files from {}'.format(directory))
         leapp_files.extend(res)
-    # Let's check for unexpected additions
-    custom_files = sorted(set(leapp_files) - set(source_of_truth))
+    # Let's check for unexpected additions (against what should have been installed from rpms).
+    # The list of installed files is needed only when there are some files to check.
+    custom_files = []
+    if leapp_files and rpms:
+        custom_files = sorted(set(leapp_files) - set(_get_installed_files(rpms)))
     # Now let's check for modifications
     modified_files = []
     modified_configs = []
-    for rpm in rpms:
+    if rpms:
+        # Verify all rpms by one rpm invocation
         res = _run_command(
-                ['rpm', '-V', '--nomtime', rpm], 'Could not check authenticity of the files from {}'.format(rpm),
+                ['rpm', '-V', '--nomtime'] + rpms,
+                'Could not check authenticity of the files from {}'.format(', '.join(rpms)),
                 # NOTE(ivasilev) check is False here as in case of any changes found exit code will be 1
                 checked=False)
         if res:
@@ -144,4 +167,12 @@ def check_for_modifications(component):
 
 
 def scan():
-    return check_for_modifications('framework') + check_for_modifications('repository')
+    components = ['framework', 'repository']
+    # The verification of rpms is dominated by the checksumming of files, so check components concurrently
+    pool = ThreadPool(len(components))
+    try:
+        modifications = pool.map(check_for_modifications, components)
+    finally:
+        pool.close()
+        pool.join()
+    return [modification for component_modifications in modifications for modification in component_modifications]
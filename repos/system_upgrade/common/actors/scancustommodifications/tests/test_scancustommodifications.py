@@ -1,3 +1,5 @@
+import os
+
 import pytest
 
 from leapp.libraries.actor import scancustommodifications
@@ -87,3 +89,41 @@ def test_check_for_modifications(monkeypatch):
     assert len(configurations) == 1
     assert configurations[0].filename == 'etc/leapp/files/pes-events.json'
     assert configurations[0].rpm_checks_str == 'S.5....T.'
+
+
+def test_scan_batches_rpm_calls(monkeypatch):
+    calls = []
+
+    def run_command_mocked(list_of_args, log_message, checked=True):
+        calls.append(list_of_args)
+        return mocked__run_command(list_of_args, log_message, checked)
+
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(arch='x86_64', src_ver='8.9', dst_ver='9.3'))
+    monkeypatch.setattr(scancustommodifications, '_run_command', run_command_mocked)
+
+    modifications = scancustommodifications.scan()
+
+    assert len(modifications) == 6
+    rpm_calls = sorted(call for call in calls if call[0] == 'rpm')
+    assert rpm_calls == [
+        ['rpm', '-V', '--nomtime', 'leapp', 'python3-leapp'],
+        ['rpm', '-V', '--nomtime', 'leapp-upgrade-el8toel9'],
+        ['rpm', '-ql', 'leapp-upgrade-el8toel9'],
+    ]
+
+
+def test_deduce_actor_name_memoized(monkeypatch):
+    parsed_files = []
+    orig_parse = scancustommodifications.ast.parse
+
+    def parse_mocked(source, *args, **kwargs):
+        parsed_files.append(source)
+        return orig_parse(source, *args, **kwargs)
+
+    monkeypatch.setattr(scancustommodifications, '_actor_names_cache', {})
+    monkeypatch.setattr(scancustommodifications.ast, 'parse', parse_mocked)
+    actor_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../setuptargetrepos')
+    for lib in ('setuptargetrepos.py', 'setuptargetrepos_repomap.py'):
+        name = scancustommodifications.deduce_actor_name(os.path.join(actor_dir, 'libraries', lib))
+        assert name == 'setuptargetrepos'
+    assert len(parsed_files) == 1
@@ -3,8 +3,8 @@ import logging
 
 import pytest
 
-from leapp.libraries.actor import setuptargetrepos_repomap
 from leapp.libraries.actor.setuptargetrepos_repomap import get_default_repository_channels, RepoMapDataHandler
+from leapp.libraries.common import repomaputils
 from leapp.libraries.common.testutils import CurrentActorMocked, produce_mocked
 from leapp.libraries.stdlib import api
 from leapp.models import PESIDRepositoryEntry, RepoMapEntry, RepositoriesMapping
@@ -154,7 +154,7 @@ def test_get_source_pesid_repos(monkeypatch, repomap_data_for_pesid_repo_retriev
     fail_description = (
         'The get_source_pesid_repos method does not take into account the source system version correctly.'
     )
-    monkeypatch.setattr(setuptargetrepos_repomap, 'get_source_major_version', lambda: '10')
+    monkeypatch.setattr(repomaputils, 'get_source_major_version', lambda: '10')
 
     # Repeat the same test as above to make sure it respects the source OS major version
     assert [] == handler.get_source_pesid_repos('pesid1'), fail_description
@@ -682,3 +682,34 @@ def test_multiple_repoids_in_repomapping(monkeypatch, rhui):
 
     assert 'rhel8-rhui' in target_repoids
     assert target_repoids['rhel8-rhui'].repoid == 'repoid8-rhui{0}'.format(expected_suffixes[rhui])
+
+
+def test_get_expected_target_pesid_repos_large_repomap(monkeypatch):
+    """
+    Tests that the lookups work on a repository mapping of a size comparable to the shipped one.
+
+    The repositories are indexed by the handler, so the same results as with the plain lists are expected.
+    """
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(arch='x86_64', src_ver='8.8', dst_ver='9.2'))
+
+    repositories = []
+    for i in range(100):
+        for major_version in ('8', '9'):
+            for arch in ('x86_64', 'aarch64', 'ppc64le', 's390x'):
+                for channel in ('ga', 'eus', 'beta'):
+                    for rhui in ('', 'aws'):
+                        repoid = 'repo{}-{}-{}-{}{}'.format(i, major_version, arch, channel, rhui and '-' + rhui)
+                        repositories.append(make_pesid_repo('pesid{}-{}'.format(i, major_version), major_version,
+                                                            repoid, arch=arch, channel=channel, rhui=rhui))
+    mapping = [RepoMapEntry(source='pesid{}-8'.format(i), target=['pesid{}-9'.format(i)]) for i in range(100)]
+    handler = RepoMapDataHandler(RepositoriesMapping(mapping=mapping, repositories=repositories))
+
+    assert len(handler.get_source_pesid_repos('pesid42-8')) == 24
+    assert handler.get_target_pesids('pesid42-8') == ['pesid42-9']
+    assert handler.get_target_pesids('pesid42-9') == []
+
+    target_repos = handler.get_expected_target_pesid_repos(['repo42-8-x86_64-eus', 'repo7-8-x86_64-ga-aws'])
+    assert {pesid: repo.repoid for pesid, repo in target_repos.items()} == {
+        'pesid42-9': 'repo42-9-x86_64-eus',
+        'pesid7-9': 'repo7-9-x86_64-ga-aws',
+    }
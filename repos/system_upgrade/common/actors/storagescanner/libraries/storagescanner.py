@@ -1,6 +1,7 @@
 import functools
 import os
 import subprocess
+from multiprocessing.pool import ThreadPool
 
 import pyudev
 
@@ -168,14 +169,23 @@ def _get_mount_info(path):
 def _get_lsblk_info():
     """ Collect storage info from lsblk command """
     cmd = ['lsblk', '-pbnr', '--output', 'NAME,MAJ:MIN,RM,SIZE,RO,TYPE,MOUNTPOINT']
-    for entry in _get_cmd_output(cmd, ' ', 7):
+    entries = list(_get_cmd_output(cmd, ' ', 7))
+    # Get names and human readable sizes of all devices at once instead of calling lsblk for each device.
+    # Devices are listed in the same order by both calls, MAJ:MIN is used to verify it.
+    names_cmd = ['lsblk', '-nr', '--output', 'NAME,KNAME,SIZE,MAJ:MIN']
+    names = list(_get_cmd_output(names_cmd, ' ', 4)) if entries else []
+    for index, entry in enumerate(entries):
         dev_path, maj_min, rm, bsize, ro, tp, mountpoint = entry
-        lsblk_cmd = ['lsblk', '-nr', '--output', 'NAME,KNAME,SIZE', dev_path]
-        lsblk_info_for_devpath = next(_get_cmd_output(lsblk_cmd, ' ', 3), None)
-        if not lsblk_info_for_devpath:
-            return
+        if index < len(names) and names[index][3] == maj_min:
+            name, kname, size = names[index][:3]
+        else:
+            # block devices have changed in between the calls
+            lsblk_cmd = ['lsblk', '-nr', '--output', 'NAME,KNAME,SIZE', dev_path]
+            lsblk_info_for_devpath = next(_get_cmd_output(lsblk_cmd, ' ', 3), None)
+            if not lsblk_info_for_devpath:
+                return
+            name, kname, size = lsblk_info_for_devpath
 
-        name, kname, size = lsblk_info_for_devpath
         yield LsblkEntry(
             name=name,
             kname=kname,
@@ -261,14 +271,36 @@ def _get_systemd_mount_info():
         )
 
 
+def _collect_concurrently(collectors):
+    """
+    Call the given collectors in parallel and return the list of their results
+
+    The collectors spend most of the time waiting for external commands and udev,
+    so they do not need to wait for each other.
+    """
+    pool = ThreadPool(len(collectors))
+    try:
+        return pool.map(lambda collector: collector(), collectors)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def get_storage_info():
     """ Collect multiple info about storage and return it """
+    lsblk, pvs, vgs, lvdisplay, systemdmount = _collect_concurrently([
+        _get_lsblk_info,
+        _get_pvs_info,
+        _get_vgs_info,
+        _get_lvdisplay_info,
+        _get_systemd_mount_info,
+    ])
     return StorageInfo(
         partitions=_get_partitions_info('/proc/partitions'),
         fstab=_get_fstab_info('/etc/fstab'),
         mount=_get_mount_info('/proc/mounts'),
-        lsblk=_get_lsblk_info(),
-        pvs=_get_pvs_info(),
-        vgs=_get_vgs_info(),
-        lvdisplay=_get_lvdisplay_info(),
-        systemdmount=_get_systemd_mount_info())
+        lsblk=lsblk,
+        pvs=pvs,
+        vgs=vgs,
+        lvdisplay=lvdisplay,
+        systemdmount=systemdmount)
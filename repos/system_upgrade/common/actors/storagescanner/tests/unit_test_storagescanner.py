@@ -1,6 +1,7 @@
 import functools
 import os
 
+import pytest
 import pyudev
 
 from leapp import reporting
@@ -251,8 +252,28 @@ def test_get_mount_info(monkeypatch):
     assert expected == storagescanner._get_mount_info(os.path.join(CUR_DIR, 'files/mounts'))
 
 
-def test_get_lsblk_info(monkeypatch):
+@pytest.mark.parametrize('names_output,expected_device_calls', [
+    # all devices are listed by a single call
+    ([
+        ['vda', 'vda', '40G', '252:0'],
+        ['vda1', 'vda1', '1G', '252:1'],
+        ['vda2', 'vda2', '39G', '252:2'],
+        ['rhel_ibm--p8--kvm--03--guest--02-root', 'kname1', '38G', '253:0'],
+        ['rhel_ibm--p8--kvm--03--guest--02-swap', 'kname2', '1G', '253:1'],
+    ], []),
+    # devices have changed in between the calls, the changed ones are queried separately
+    ([
+        ['vda', 'vda', '40G', '252:0'],
+        ['vda1', 'vda1', '1G', '252:1'],
+        ['vda3', 'vda3', '1G', '252:3'],
+        ['rhel_ibm--p8--kvm--03--guest--02-root', 'kname1', '38G', '253:0'],
+    ], ['vda2', 'rhel_ibm--p8--kvm--03--guest--02-swap']),
+    # lsblk failed
+    ([], ['vda', 'vda1', 'vda2', 'rhel_ibm--p8--kvm--03--guest--02-root', 'rhel_ibm--p8--kvm--03--guest--02-swap']),
+])
+def test_get_lsblk_info(monkeypatch, names_output, expected_device_calls):
     bytes_per_gb = 1 << 30
+    device_calls = []
 
     def get_cmd_output_mocked(cmd, delim, expected_len):
         if cmd == ['lsblk', '-pbnr', '--output', 'NAME,MAJ:MIN,RM,SIZE,RO,TYPE,MOUNTPOINT']:
@@ -265,6 +286,9 @@ def test_get_lsblk_info(monkeypatch):
             ]
             for output_line_parts in output_lines_split_on_whitespace:
                 yield output_line_parts
+        elif cmd == ['lsblk', '-nr', '--output', 'NAME,KNAME,SIZE,MAJ:MIN']:
+            for output_line_parts in names_output:
+                yield output_line_parts
         elif len(cmd) == 5 and cmd[:4] == ['lsblk', '-nr', '--output', 'NAME,KNAME,SIZE']:
             # We cannot have the output in a list, since the command is called per device. Therefore, we have to map
             # each device path to its output.
@@ -276,6 +300,7 @@ def test_get_lsblk_info(monkeypatch):
                 'rhel_ibm--p8--kvm--03--guest--02-swap': ['rhel_ibm--p8--kvm--03--guest--02-swap', 'kname2', '1G']
             }
             dev_path = cmd[4]
+            device_calls.append(dev_path)
             if dev_path not in output_lines_split_on_whitespace_per_device:
                 raise ValueError('Attempting to call lsblk on an unexpected device: {}'.format(dev_path))
             yield output_lines_split_on_whitespace_per_device[dev_path]
@@ -338,6 +363,7 @@ def test_get_lsblk_info(monkeypatch):
 
     actual = storagescanner._get_lsblk_info()
     assert expected == actual
+    assert device_calls == expected_device_calls
 
 
 def test_get_pvs_info(monkeypatch):
@@ -498,3 +524,24 @@ def test_get_systemd_mount_info(monkeypatch):
             label='n/a',
             uuid='c3890bf3-9273-4877-ad1f-68144e1eb858')]
     assert expected == storagescanner._get_systemd_mount_info()
+
+
+def test_get_storage_info(monkeypatch):
+    collectors = (
+        '_get_lsblk_info', '_get_pvs_info', '_get_vgs_info', '_get_lvdisplay_info', '_get_systemd_mount_info'
+    )
+    for collector in collectors:
+        monkeypatch.setattr(storagescanner, collector, functools.partial(lambda name: [name], collector))
+    monkeypatch.setattr(storagescanner, '_get_partitions_info', lambda path: [])
+    monkeypatch.setattr(storagescanner, '_get_fstab_info', lambda path: [])
+    monkeypatch.setattr(storagescanner, '_get_mount_info', lambda path: [])
+    monkeypatch.setattr(storagescanner, 'StorageInfo', lambda **kwargs: kwargs)
+
+    storage_info = storagescanner.get_storage_info()
+
+    # every result of the concurrently called collectors is stored in the right field
+    assert storage_info['lsblk'] == ['_get_lsblk_info']
+    assert storage_info['pvs'] == ['_get_pvs_info']
+    assert storage_info['vgs'] == ['_get_vgs_info']
+    assert storage_info['lvdisplay'] == ['_get_lvdisplay_info']
+    assert storage_info['systemdmount'] == ['_get_systemd_mount_info']
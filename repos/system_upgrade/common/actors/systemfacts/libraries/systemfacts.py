@@ -5,6 +5,7 @@ import logging
 import os
 import pwd
 import re
+from multiprocessing.pool import ThreadPool
 
 import six
 
@@ -33,6 +34,10 @@ from leapp.models import (
     UsersFacts
 )
 
+PROC_MODULES = '/proc/modules'
+SYS_MODULE_DIR = '/sys/module'
+SYSFS_READ_WORKERS = 8
+
 
 def aslist(f):
     """ Decorator used to convert generator to list """
@@ -115,48 +120,128 @@ def get_system_groups_status():
     return GroupsFacts(groups=_get_system_groups())
 
 
-@aslist
-def _get_active_kernel_modules(logger):
-    lines = run(['lsmod'], split=True)['stdout']
-    for l in lines[1:]:
-        name = l.split(' ')[0]
-
-        # Read parameters of the given module as exposed by the
-        # `/sys` VFS, if there are no parameters exposed we just
-        # take the name of the module
-        base_path = '/sys/module/{module}'.format(module=name)
-        parameters_path = os.path.join(base_path, 'parameters')
-        if not os.path.exists(parameters_path):
-            yield ActiveKernelModule(filename=name, parameters=[])
+def _get_loaded_kernel_modules():
+    """
+    Return names of loaded kernel modules in the order listed by /proc/modules
+
+    That's the same file lsmod reads the information from.
+    """
+    with open(PROC_MODULES, mode='r') as fp:
+        return [line.split(' ')[0] for line in fp if line.strip()]
+
+
+def _parse_modinfo_signatures(lines):
+    """
+    Parse signatures of kernel modules from the output of the `modinfo` command
+
+    The output can contain information about multiple modules, each starting
+    with the `filename` field. Signatures are printed on multiple lines, with
+    continuation lines starting with a whitespace.
+
+    :return: A dict mapping names of modules to their signatures
+    """
+    signatures = {}
+    modules = []
+    in_signature = False
+    for line in lines:
+        if line[:1].isspace():
+            if in_signature:
+                modules[-1]['signature'].append(line)
+            continue
+        in_signature = False
+        field, dummy_sep, value = line.partition(':')
+        value = value.strip()
+        if field == 'filename':
+            modules.append({'filename': value, 'name': None, 'signature': []})
+        elif not modules:
             continue
+        elif field == 'name':
+            modules[-1]['name'] = value
+        elif field == 'signature':
+            modules[-1]['signature'].append(value)
+            in_signature = True
+
+    for module in modules:
+        name = module['name']
+        if not name:
+            # the name of module is derived from its file name,
+            # e.g. /lib/modules/<kver>/kernel/fs/nfs/blocklayout/blocklayoutdriver.ko.xz
+            name = os.path.basename(module['filename']).split('.ko')[0].replace('-', '_')
+        # Remove whitespace from the signature string
+        signatures[name] = re.sub(r"\s+", "", ''.join(module['signature']), flags=re.UNICODE) or None
+    return signatures
+
+
+def _get_kernel_modules_signatures(names, logger):
+    """
+    Get signatures of given kernel modules by one `modinfo` call
 
-        # Use `modinfo` to probe for signature information
-        parameter_dict = {}
+    Modules without any signature are missing in the returned dict.
+    """
+    if not names:
+        return {}
+    # modinfo continues with other modules when a module cannot be found, only
+    # the exit code is nonzero then
+    result = run(['modinfo'] + list(names), split=True, checked=False)
+    if result['exit_code']:
+        logger.debug('Could not get information about some kernel modules: {}'.format(result['stderr']))
+    signatures = _parse_modinfo_signatures(result['stdout'])
+    return dict((name, signatures[name]) for name in names if signatures.get(name))
+
+
+def _get_kernel_module_parameters(name, logger):
+    """
+    Read parameters of the given module as exposed by the `/sys` VFS
+
+    :return: A dict mapping names of parameters to their values or None if the module exposes no parameters
+    """
+    parameters_path = os.path.join(SYS_MODULE_DIR, name, 'parameters')
+    if not os.path.exists(parameters_path):
+        return None
+
+    parameter_dict = {}
+    # Since we're using the `/sys` VFS we need to use `os.listdir()` to get
+    # all the property names and then just read from all the listed paths
+    parameters = sorted(os.listdir(parameters_path))
+    for param in parameters:
         try:
-            signature = run(['modinfo', '-F', 'signature', name], split=False)['stdout']
-        except CalledProcessError:
-            signature = None
+            with open(os.path.join(parameters_path, param), mode='r') as fp:
+                parameter_dict[param] = fp.read().strip()
+        except IOError as exc:
+            # Some parameters are write-only, in that case we just log the name of parameter
+            # and the module and continue
+            if exc.errno in (errno.EACCES, errno.EPERM):
+                msg = 'Unable to read parameter "{param}" of kernel module "{name}"'
+                logger.warning(msg.format(param=param, name=name))
+            else:
+                raise exc
+    return parameter_dict
 
-        signature_string = None
-        if signature:
-            # Remove whitespace from the signature string
-            signature_string = re.sub(r"\s+", "", signature, flags=re.UNICODE)
 
-        # Since we're using the `/sys` VFS we need to use `os.listdir()` to get
-        # all the property names and then just read from all the listed paths
-        parameters = sorted(os.listdir(parameters_path))
-        for param in parameters:
-            try:
-                with open(os.path.join(parameters_path, param), mode='r') as fp:
-                    parameter_dict[param] = fp.read().strip()
-            except IOError as exc:
-                # Some parameters are write-only, in that case we just log the name of parameter
-                # and the module and continue
-                if exc.errno in (errno.EACCES, errno.EPERM):
-                    msg = 'Unable to read parameter "{param}" of kernel module "{name}"'
-                    logger.warning(msg.format(param=param, name=name))
-                else:
-                    raise exc
+@aslist
+def _get_active_kernel_modules(logger):
+    names = _get_loaded_kernel_modules()
+
+    # Reading of the /sys VFS blocks on the kernel, so read parameters of modules concurrently
+    pool = ThreadPool(SYSFS_READ_WORKERS)
+    try:
+        modules_parameters = pool.map(lambda name: _get_kernel_module_parameters(name, logger), names)
+    finally:
+        pool.close()
+        pool.join()
+
+    # Use `modinfo` to probe for signature information of modules with parameters,
+    # all of them are queried at once
+    signatures = _get_kernel_modules_signatures(
+        [name for name, parameter_dict in zip(names, modules_parameters) if parameter_dict is not None],
+        logger
+    )
+
+    for name, parameter_dict in zip(names, modules_parameters):
+        # if there are no parameters exposed we just take the name of the module
+        if parameter_dict is None:
+            yield ActiveKernelModule(filename=name, parameters=[])
+            continue
 
         # Project the dictionary as a list of key values
         items = [
@@ -167,7 +252,7 @@ def _get_active_kernel_modules(logger):
         yield ActiveKernelModule(
             filename=name,
             parameters=items,
-            signature=signature_string
+            signature=signatures.get(name)
         )
 
 
@@ -3,6 +3,7 @@ import pwd
 
 import pytest
 
+from leapp.libraries.actor import systemfacts
 from leapp.libraries.actor.systemfacts import _get_system_groups, _get_system_users, anyendswith, anyhasprefix, aslist
 from leapp.libraries.common.testutils import logger_mocked
 from leapp.libraries.stdlib import api
@@ -116,3 +117,76 @@ def test_get_system_groups(monkeypatch, etc_group_names, skipped_group_names):
                 assert group_name not in api.current_logger().dbgmsg[0]
     else:
         assert not api.current_logger().dbgmsg
+
+
+MODINFO_OUTPUT = """
+filename:       /lib/modules/4.18.0-477.el8.x86_64/kernel/fs/xfs/xfs.ko.xz
+license:        GPL
+name:           xfs
+signer:         Red Hat Enterprise Linux kernel signing key
+sig_key:        5A:27:E1:D8:8D:52:64:3E
+signature:      2F:95:0A:DB:3C:22:1B:05:72:F4:A3:28:A0:19:9A:BB:
+\t\t12:C6:38:6E:8F:E4:9D:2E
+parm:           debug:int
+filename:       /lib/modules/4.18.0-477.el8.x86_64/extra/dummy-mod.ko
+license:        GPL
+parm:           verbose:bool
+filename:       /lib/modules/4.18.0-477.el8.x86_64/kernel/drivers/virtio/virtio-pci.ko.xz
+signature:      AA:BB:
+\t\tCC:DD
+"""
+
+
+def test_parse_modinfo_signatures():
+    signatures = systemfacts._parse_modinfo_signatures(MODINFO_OUTPUT.strip().split('\n'))
+    assert signatures == {
+        'xfs': '2F:95:0A:DB:3C:22:1B:05:72:F4:A3:28:A0:19:9A:BB:12:C6:38:6E:8F:E4:9D:2E',
+        'dummy_mod': None,
+        'virtio_pci': 'AA:BB:CC:DD',
+    }
+
+
+def _create_fake_kernel_modules(tmp_path, modules):
+    proc_modules = tmp_path / 'modules'
+    proc_modules.write_text(u''.join(
+        u'{} 16384 0 - Live 0x0000000000000000\n'.format(name) for name, dummy_parameters in modules
+    ))
+    sys_module = tmp_path / 'sys_module'
+    for name, parameters in modules:
+        module_dir = sys_module / name
+        module_dir.mkdir(parents=True)
+        if parameters is None:
+            continue
+        (module_dir / 'parameters').mkdir()
+        for param, value in parameters.items():
+            (module_dir / 'parameters' / param).write_text(u'{}\n'.format(value))
+    return str(proc_modules), str(sys_module)
+
+
+def test_get_active_kernel_modules(monkeypatch, tmp_path):
+    # the list keeps the order of modules in /proc/modules
+    modules = [('xfs', {'debug': 0}), ('dummy_mod', {'verbose': 'N'}), ('virtio_pci', None), ('loop', {})]
+    proc_modules, sys_module = _create_fake_kernel_modules(tmp_path, modules)
+    commands = []
+
+    def run_mocked(cmd, **kwargs):
+        commands.append(cmd)
+        return {'stdout': MODINFO_OUTPUT.strip().split('\n'), 'stderr': '', 'exit_code': 0}
+
+    monkeypatch.setattr(systemfacts, 'PROC_MODULES', proc_modules)
+    monkeypatch.setattr(systemfacts, 'SYS_MODULE_DIR', sys_module)
+    monkeypatch.setattr(systemfacts, 'run', run_mocked)
+
+    kernel_modules = systemfacts._get_active_kernel_modules(logger_mocked())
+
+    # only modules with parameters are probed for signature, all of them by one call
+    assert commands == [['modinfo', 'xfs', 'dummy_mod', 'loop']]
+    assert [module.filename for module in kernel_modules] == [name for name, dummy_parameters in modules]
+    xfs, dummy_mod, virtio_pci, loop = kernel_modules
+    assert [(p.name, p.value) for p in xfs.parameters] == [('debug', '0')]
+    assert xfs.signature == '2F:95:0A:DB:3C:22:1B:05:72:F4:A3:28:A0:19:9A:BB:12:C6:38:6E:8F:E4:9D:2E'
+    assert [(p.name, p.value) for p in dummy_mod.parameters] == [('verbose', 'N')]
+    assert dummy_mod.signature is None
+    # signature is not probed for modules without parameters
+    assert not virtio_pci.parameters and virtio_pci.signature is None
+    assert not loop.parameters and loop.signature is None
@@ -1,12 +1,17 @@
+import errno
+import hashlib
 import itertools
+import json
 import os
 import re
 import shutil
+import stat
+from multiprocessing.pool import ThreadPool
 
 from leapp import reporting
 from leapp.exceptions import StopActorExecution, StopActorExecutionError
 from leapp.libraries.actor import constants
-from leapp.libraries.common import dnfplugin, mounting, overlaygen, repofileutils, rhsm, utils
+from leapp.libraries.common import dnfplugin, mounting, overlaygen, repofileutils, rhsm, rpms, utils
 from leapp.libraries.common.config import get_env, get_product_type
 from leapp.libraries.common.config.version import get_target_major_version
 from leapp.libraries.common.gpg import get_path_to_gpg_certs, is_nogpgcheck_set
@@ -58,6 +63,10 @@ from leapp.utils.deprecation import suppress_deprecation
 PROD_CERTS_FOLDER = 'prod-certs'
 PERSISTENT_PACKAGE_CACHE_DIR = '/var/lib/leapp/persistent_package_cache'
 DEDICATED_LEAPP_PART_URL = 'https://access.redhat.com/solutions/7011704'
+# NOTE: Copying of small files (like certificates) does not benefit from
+# multiple threads, so the files are copied sequentially by default
+COPY_DECOUPLE_WORKERS = 1
+USERSPACE_FINGERPRINT_FORMAT_VERSION = 2
 
 
 def _check_deprecated_rhsm_skip():
@@ -243,6 +252,106 @@ def enable_spacewalk_module(context):
         )
 
 
+def _is_userspace_reuse_enabled():
+    return get_env('LEAPP_REUSE_TARGET_USERSPACE', '0') == '1'
+
+
+def _get_file_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _get_files_digests(dirpath):
+    """
+    Return a dict mapping paths of regular files inside dirpath (non-recursively) to their digests.
+    """
+    if not os.path.isdir(dirpath):
+        return {}
+    digests = {}
+    for fname in sorted(os.listdir(dirpath)):
+        fpath = os.path.join(dirpath, fname)
+        if os.path.isfile(fpath):
+            digests[fpath] = _get_file_digest(fpath)
+    return digests
+
+
+def _get_target_userspace_fingerprint(context, enabled_repos, packages, files):
+    """
+    Return the fingerprint of all inputs affecting the content of the target userspace container.
+
+    The fingerprint covers the target version, enabled repositories, requested packages,
+    repository and DNF configuration used inside the scratch container (including
+    custom repofiles), the GPG keys imported into the container and the list of files
+    copied into the container. The content of the copied files is not covered, as the files
+    are copied into the container again when it is reused.
+    """
+    gpg_keys = {}
+    if not is_nogpgcheck_set():
+        for trusted_dir in get_path_to_gpg_certs():
+            gpg_keys.update(_get_files_digests(trusted_dir))
+
+    dnf_config = _get_files_digests(context.full_path('/etc/yum.repos.d'))
+    dnf_conf_path = context.full_path('/etc/dnf/dnf.conf')
+    if os.path.isfile(dnf_conf_path):
+        dnf_config[dnf_conf_path] = _get_file_digest(dnf_conf_path)
+
+    inputs = {
+        'format_version': USERSPACE_FINGERPRINT_FORMAT_VERSION,
+        'target_version': api.current_actor().configuration.version.target,
+        'architecture': api.current_actor().configuration.architecture,
+        'enabled_repos': sorted(enabled_repos),
+        'packages': sorted(packages),
+        'files': sorted([copy_file.src, copy_file.dst or copy_file.src] for copy_file in files),
+        'dnf_config': dnf_config,
+        'gpg_keys': gpg_keys,
+        'nogpgcheck': is_nogpgcheck_set(),
+        'skip_rhsm': rhsm.skip_rhsm(),
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _get_rpmdb_digest(userspace_dir):
+    """
+    Return the digest of packages installed in the target userspace container.
+
+    The digest changes whenever any package is installed, removed or reinstalled
+    in the container. None is returned when the rpmdb cannot be queried or
+    when it is empty.
+    """
+    cmd = ['rpm', '-qa', '--queryformat', '%{NEVRA} %{INSTALLTIME}\n']
+    try:
+        with mounting.NspawnActions(base_dir=userspace_dir) as target_context:
+            installed = target_context.call(cmd, split=True)['stdout']
+    except (CalledProcessError, OSError) as e:
+        api.current_logger().info('Cannot query the rpmdb of the target userspace container: {}'.format(e))
+        return None
+    if not installed:
+        return None
+    return hashlib.sha256('\n'.join(sorted(installed)).encode('utf-8')).hexdigest()
+
+
+def _can_reuse_target_userspace(userspace_dir, fingerprint):
+    metadata = overlaygen.get_userspace_metadata(userspace_dir)
+    if not metadata:
+        api.current_logger().debug('No reusable target userspace container found.')
+        return False
+    if metadata['fingerprint'] != fingerprint:
+        api.current_logger().info(
+            'Inputs of the target userspace container have been changed, the container will be created again.'
+        )
+        return False
+    if _get_rpmdb_digest(userspace_dir) != metadata['rpmdb_digest']:
+        api.current_logger().info(
+            'Packages in the target userspace container have been changed since its creation,'
+            ' the container will be created again.'
+        )
+        return False
+    return True
+
+
 def prepare_target_userspace(context, userspace_dir, enabled_repos, packages):
     """
     Implement the creation of the target userspace.
@@ -331,6 +440,22 @@ def prepare_target_userspace(context, userspace_dir, enabled_repos, packages):
             raise StopActorExecutionError(message=message, details=details)
 
 
+def _store_target_userspace_metadata(userspace_dir, fingerprint):
+    rpmdb_digest = _get_rpmdb_digest(userspace_dir)
+    if not rpmdb_digest:
+        # Not fatal, the container will be just created again next time
+        api.current_logger().warning(
+            'Cannot store metadata of the target userspace container without its rpmdb digest.'
+        )
+        return
+    try:
+        size = overlaygen.get_container_size(userspace_dir)
+        overlaygen.store_userspace_metadata(userspace_dir, fingerprint, rpmdb_digest, size)
+    except (OSError, IOError, CalledProcessError) as e:
+        # Not fatal, the container will be just created again next time
+        api.current_logger().warning('Cannot store metadata of the target userspace container: {}'.format(e))
+
+
 def _query_rpm_for_pkg_files(context, pkgs):
     files_owned_by_rpm = set()
     rpm_query_result = context.call(['rpm', '-ql'] + pkgs, split=True)
@@ -365,13 +490,15 @@ def _get_files_owned_by_rpms(context, dirpath, pkgs=None, recursive=False):
     else:
         file_list = os.listdir(searchdir)
 
+    # Resolve owners of all files at once instead of running rpm for every file
+    files_owners = rpms.get_files_owners([os.path.join(dirpath, fname) for fname in file_list], context=context)
+
     for fname in file_list:
-        try:
-            result = context.call(['rpm', '-qf', os.path.join(dirpath, fname)])
-        except CalledProcessError:
+        owners = files_owners.get(os.path.join(dirpath, fname))
+        if not owners:
             api.current_logger().debug('SKIP the {} file: not owned by any rpm'.format(fname))
             continue
-        if pkgs and not [pkg for pkg in pkgs if pkg in result['stdout']]:
+        if pkgs and not [pkg for pkg in pkgs if pkg in '\n'.join(owners)]:
             api.current_logger().debug('SKIP the {} file: not owned by any searched rpm:'.format(fname))
             continue
         api.current_logger().debug('Found the file owned by an rpm: {}.'.format(fname))
@@ -387,13 +514,48 @@ def _mkdir_with_copied_mode(path, mode_from):
     :param path: The directory path to create.
     :param mode_from: A file or directory whose mode we will copy to the
         newly created directory.
-    :raises subprocess.CalledProcessError: mkdir or chmod fails. For instance,
-        the directory already exists, the file to get permissions from does
-        not exist, a parent directory does not exist.
+    :raises OSError: The directory cannot be created or its mode cannot be
+        set. For instance, the file to get permissions from does not exist.
     """
+    parent_dir = os.path.dirname(path)
+    if parent_dir and not os.path.isdir(parent_dir):
+        os.makedirs(parent_dir)
     # Create with maximally restrictive permissions
-    run(['mkdir', '-m', '0', '-p', path])
-    run(['chmod', '--reference={}'.format(mode_from), path])
+    if not os.path.isdir(path):
+        os.mkdir(path, 0)
+    # Follow symlinks, the same as chmod --reference does
+    os.chmod(path, stat.S_IMODE(os.stat(mode_from).st_mode))
+
+
+def _can_copy_in_process():
+    # Extended attributes (e.g. SELinux labels) are preserved by `cp -a`,
+    # but shutil can copy them only on Python 3
+    return hasattr(os, 'listxattr')
+
+
+def _copy_file(src, dst):
+    """
+    Copy the regular file preserving its attributes the same way as `cp -a`.
+
+    The mode, ownership, timestamps and extended attributes (including
+    SELinux labels) are preserved. The copy is done without spawning
+    a process if possible, otherwise `cp -a` is used.
+    """
+    if not _can_copy_in_process():
+        run(['cp', '-a', src, dst])
+        return
+
+    shutil.copyfile(src, dst)
+    src_stat = os.lstat(src)
+    try:
+        # Change the ownership first as it can drop the setuid/setgid bits
+        os.lchown(dst, src_stat.st_uid, src_stat.st_gid)
+    except OSError as e:
+        # cp -a silently ignores the ownership when it cannot be changed
+        if e.errno != errno.EPERM:
+            raise
+    # Copies mode, timestamps, flags and extended attributes
+    shutil.copystat(src, dst)
 
 
 def _choose_copy_or_link(symlink, srcdir):
@@ -521,17 +683,20 @@ def _copy_symlinks(symlinks_to_process, srcdir):
             continue
 
         if action == "copy":
-            # Note: source_path could be a directory, so '-a' or '-r' must be
-            # given to cp.
-            run(['cp', '-a', source_path, target_linkpath])
+            if os.path.isdir(source_path):
+                # Note: source_path could be a directory, so '-a' or '-r' must be
+                # given to cp.
+                run(['cp', '-a', source_path, target_linkpath])
+            else:
+                _copy_file(source_path, target_linkpath)
         elif action == 'link':
-            run(["ln", "-s", source_path, target_linkpath])
+            os.symlink(source_path, target_linkpath)
         else:
             # This will not happen unless _copy_or_link() has a bug.
             raise RuntimeError("Programming error: _copy_or_link() returned an unknown action:{}".format(action))
 
 
-def _copy_decouple(srcdir, dstdir):
+def _copy_decouple(srcdir, dstdir, workers=COPY_DECOUPLE_WORKERS):
     """
     Copy files inside of `srcdir` to `dstdir` while decoupling symlinks.
 
@@ -541,9 +706,27 @@ def _copy_decouple(srcdir, dstdir):
     symlinks. Any symlink (or symlink chains) within the directory will be
     preserved.
 
+    Regular files are copied in parallel when more than one worker thread
+    is requested. All files are copied when the function returns.
+
     .. warning::
         `dstdir` must already exist.
     """
+    pool = ThreadPool(workers) if workers > 1 else None
+    pending_copies = []
+    try:
+        _copy_decouple_tree(srcdir, dstdir, pool, pending_copies)
+        # Wait for all copies in the order they have been scheduled, so the first
+        # error is reported deterministically
+        for pending_copy in pending_copies:
+            pending_copy.get()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+def _copy_decouple_tree(srcdir, dstdir, pool, pending_copies):
     for root, directories, files in os.walk(srcdir):
         # relative path from srcdir because srcdir is replaced with dstdir for
         # the copy.
@@ -581,7 +764,10 @@ def _copy_decouple(srcdir, dstdir):
                 continue
 
             # Not a symlink so we can copy it now too
-            run(['cp', '-a', source_filepath, target_filepath])
+            if pool:
+                pending_copies.append(pool.apply_async(_copy_file, (source_filepath, target_filepath)))
+            else:
+                _copy_file(source_filepath, target_filepath)
 
         _copy_symlinks(symlinks_to_process, srcdir)
 
@@ -1161,9 +1347,31 @@ def _get_target_userspace():
 
 
 def _create_target_userspace(context, packages, files, target_repoids):
-    """Create the target userspace."""
+    """
+    Create the target userspace.
+
+    In case the LEAPP_REUSE_TARGET_USERSPACE envar is set to 1 and the previously
+    created container has been created from the same inputs (see
+    _get_target_userspace_fingerprint) and its installed packages have not
+    been changed since then (see _get_rpmdb_digest), the packages are not
+    installed into the container again. The rest of the setup is always done.
+    Changes of the container done by later actors are detected only when they
+    change installed packages; the configuration of the container is expected
+    to be set up again by these actors on every run.
+    """
     target_path = _get_target_userspace()
-    prepare_target_userspace(context, target_path, target_repoids, list(packages))
+    fingerprint = None
+    reuse = False
+    if _is_userspace_reuse_enabled():
+        fingerprint = _get_target_userspace_fingerprint(context, target_repoids, list(packages), files)
+        reuse = _can_reuse_target_userspace(target_path, fingerprint)
+
+    # Invalidate the container first, so it's not reused if its setup fails
+    overlaygen.remove_userspace_metadata(target_path)
+    if reuse:
+        api.current_logger().info('Reusing the existing target userspace container: {}'.format(target_path))
+    else:
+        prepare_target_userspace(context, target_path, target_repoids, list(packages))
     _prep_repository_access(context, target_path)
 
     with mounting.NspawnActions(base_dir=target_path) as target_context:
@@ -1179,6 +1387,10 @@ def _create_target_userspace(context, packages, files, target_repoids):
     with mounting.NspawnActions(_get_target_userspace()) as target_context:
         rhsm.set_container_mode(target_context)
 
+    # The container is complete now, the metadata is validated against its rpmdb when it is reused
+    if fingerprint:
+        _store_target_userspace_metadata(target_path, fingerprint)
+
 
 def install_target_rhui_client_if_needed(context, indata):
     if not indata.rhui_info:
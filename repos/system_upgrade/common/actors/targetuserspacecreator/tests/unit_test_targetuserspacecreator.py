@@ -1,5 +1,6 @@
 from __future__ import division, print_function
 
+import hashlib
 import os
 import subprocess
 import sys
@@ -13,6 +14,7 @@ from leapp.libraries.actor import userspacegen
 from leapp.libraries.common import overlaygen, repofileutils, rhsm
 from leapp.libraries.common.config import architecture
 from leapp.libraries.common.testutils import CurrentActorMocked, logger_mocked, produce_mocked
+from leapp.libraries.stdlib import CalledProcessError
 from leapp.utils.deprecation import suppress_deprecation
 
 if sys.version_info < (2, 8):
@@ -859,6 +861,176 @@ def test_copy_decouple(monkeypatch, temp_directory_layout, initial_structure, ex
         raise
 
 
+@pytest.mark.parametrize('workers', (1, 4))
+def test_copy_decouple_preserves_attributes(monkeypatch, tmp_path, workers):
+    srcdir = tmp_path / 'src'
+    (srcdir / 'private').mkdir(parents=True)
+    (srcdir / 'private').chmod(0o700)
+    for idx in range(20):
+        filepath = srcdir / 'private' / 'key{}.pem'.format(idx)
+        filepath.write_text(u'key{}'.format(idx))
+        filepath.chmod(0o600)
+        os.utime(str(filepath), (1000000000, 1000000000 + idx))
+    (srcdir / 'cert.pem').write_text(u'cert')
+    (srcdir / 'cert.pem').chmod(0o644)
+
+    def run_mocked(command):
+        subprocess.check_call(command)
+
+    monkeypatch.setattr(userspacegen, 'run', run_mocked)
+    dstdir = tmp_path / 'dst'
+    dstdir.mkdir()
+    userspacegen._copy_decouple(str(srcdir), str(dstdir), workers=workers)
+
+    assert (dstdir / 'private').stat().st_mode & 0o777 == 0o700
+    assert (dstdir / 'cert.pem').read_text() == u'cert'
+    assert (dstdir / 'cert.pem').stat().st_mode & 0o777 == 0o644
+    for idx in range(20):
+        filepath = dstdir / 'private' / 'key{}.pem'.format(idx)
+        assert filepath.read_text() == u'key{}'.format(idx)
+        assert filepath.stat().st_mode & 0o777 == 0o600
+        assert filepath.stat().st_mtime == 1000000000 + idx
+
+
+@pytest.mark.parametrize('pkgs,recursive,expected_files', [
+    (None, False, ['owned.repo', 'rhui.repo']),
+    (['rhui-client'], False, ['rhui.repo']),
+    (None, True, ['owned.repo', 'rhui.repo', 'subdir/owned-nested.repo']),
+])
+def test_get_files_owned_by_rpms(monkeypatch, tmp_path, pkgs, recursive, expected_files):
+    searchdir = tmp_path / 'etc' / 'yum.repos.d'
+    (searchdir / 'subdir').mkdir(parents=True)
+    for fname in ('owned.repo', 'rhui.repo', 'custom.repo', 'subdir/owned-nested.repo'):
+        (searchdir / fname).touch()
+
+    files_owners = {
+        '/etc/yum.repos.d/owned.repo': ['owner-1.0-1.el8.noarch'],
+        '/etc/yum.repos.d/rhui.repo': ['rhui-client-1.0-1.el8.noarch'],
+        '/etc/yum.repos.d/subdir/owned-nested.repo': ['owner-1.0-1.el8.noarch'],
+    }
+    queried_paths = []
+
+    def get_files_owners_mocked(paths, context=None):
+        queried_paths.append(sorted(paths))
+        return {path: owners for path, owners in files_owners.items() if path in paths}
+
+    class MockedContext(MockedMountingBase):
+        def full_path(self, path):
+            return str(tmp_path) + path
+
+    monkeypatch.setattr(userspacegen.rpms, 'get_files_owners', get_files_owners_mocked)
+    monkeypatch.setattr(userspacegen.api, 'current_logger', logger_mocked())
+
+    files = userspacegen._get_files_owned_by_rpms(MockedContext(), '/etc/yum.repos.d', pkgs=pkgs, recursive=recursive)
+
+    assert sorted(files) == expected_files
+    # The owners of all files are resolved at once
+    assert len(queried_paths) == 1
+
+
+def test_target_userspace_fingerprint(monkeypatch, tmp_path):
+    repos_dir = tmp_path / 'etc' / 'yum.repos.d'
+    repos_dir.mkdir(parents=True)
+    repofile = repos_dir / 'custom.repo'
+    repofile.write_text(u'[custom]\nbaseurl=http://example.com/a\n')
+
+    class MockedContext(MockedMountingBase):
+        def full_path(self, path):
+            return str(tmp_path) + path
+
+    monkeypatch.setattr(userspacegen.api, 'current_actor', CurrentActorMocked())
+    monkeypatch.setattr(userspacegen, 'get_path_to_gpg_certs', lambda: [str(tmp_path / 'gpg')])
+    monkeypatch.setattr(userspacegen, 'is_nogpgcheck_set', lambda: False)
+    monkeypatch.setattr(userspacegen.rhsm, 'skip_rhsm', lambda: True)
+
+    def fingerprint(repos=('repo1', 'repo2'), pkgs=('dnf', 'pkg'), files=('/etc/custom.conf',)):
+        copy_files = [models.CopyFile(src=path, dst=path) for path in files]
+        return userspacegen._get_target_userspace_fingerprint(MockedContext(), list(repos), list(pkgs), copy_files)
+
+    orig = fingerprint()
+    assert orig == fingerprint(repos=('repo2', 'repo1'), pkgs=('pkg', 'dnf'))
+    assert orig != fingerprint(repos=('repo1',))
+    assert orig != fingerprint(pkgs=('dnf',))
+    assert orig != fingerprint(files=())
+
+    repofile.write_text(u'[custom]\nbaseurl=http://example.com/b\n')
+    assert orig != fingerprint()
+
+
+@pytest.mark.parametrize('reuse_envar,stored_fingerprint,rpmdb_digest,reused', [
+    ('1', 'fp', 'digest', True),
+    ('1', 'fp', 'other-digest', False),
+    ('1', 'fp', None, False),
+    ('1', 'other-fp', 'digest', False),
+    ('1', None, 'digest', False),
+    ('0', 'fp', 'digest', False),
+])
+def test_create_target_userspace_reuse(monkeypatch, reuse_envar, stored_fingerprint, rpmdb_digest, reused):
+    steps = []
+
+    def step(name):
+        return lambda *args, **kwargs: steps.append(name)
+
+    metadata = None
+    if stored_fingerprint:
+        metadata = {'fingerprint': stored_fingerprint, 'rpmdb_digest': 'digest', 'size': 1000}
+    monkeypatch.setattr(userspacegen.api, 'current_actor', CurrentActorMocked(
+        envars={'LEAPP_REUSE_TARGET_USERSPACE': reuse_envar}))
+    monkeypatch.setattr(userspacegen.api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(userspacegen, '_get_target_userspace', lambda: '/path/userspace')
+    monkeypatch.setattr(userspacegen, '_get_target_userspace_fingerprint', lambda *args: 'fp')
+    monkeypatch.setattr(userspacegen, '_get_rpmdb_digest', lambda path: rpmdb_digest)
+    monkeypatch.setattr(userspacegen.overlaygen, 'get_userspace_metadata', lambda path: metadata)
+    monkeypatch.setattr(userspacegen.overlaygen, 'remove_userspace_metadata', step('remove_metadata'))
+    monkeypatch.setattr(userspacegen, '_store_target_userspace_metadata', step('store_metadata'))
+    monkeypatch.setattr(userspacegen, 'prepare_target_userspace', step('install_packages'))
+    monkeypatch.setattr(userspacegen, '_prep_repository_access', step('prep_repository_access'))
+    monkeypatch.setattr(userspacegen, '_copy_files', step('copy_files'))
+    monkeypatch.setattr(userspacegen.dnfplugin, 'install', step('install_dnfplugin'))
+    monkeypatch.setattr(userspacegen, 'override_channel', step('override_channel'))
+    monkeypatch.setattr(userspacegen.rhsm, 'set_container_mode', step('set_container_mode'))
+    monkeypatch.setattr(userspacegen.mounting, 'NspawnActions', lambda *args, **kwargs: MockedMountingBase())
+
+    userspacegen._create_target_userspace(MockedMountingBase(), ['pkg'], [], ['repo'])
+
+    expected_steps = ['remove_metadata']
+    if not reused:
+        expected_steps.append('install_packages')
+    expected_steps += ['prep_repository_access', 'copy_files', 'install_dnfplugin', 'override_channel',
+                       'set_container_mode']
+    # the metadata is stored only when the container is complete
+    if reuse_envar == '1':
+        expected_steps.append('store_metadata')
+    assert steps == expected_steps
+
+
+@pytest.mark.parametrize('rpm_stdout,rpm_error,expected', [
+    (['pkg-1.0-1.el9.noarch 1700000001', 'dnf-4.14.0-9.el9.noarch 1700000000'], False,
+     hashlib.sha256(b'dnf-4.14.0-9.el9.noarch 1700000000\npkg-1.0-1.el9.noarch 1700000001').hexdigest()),
+    (['dnf-4.14.0-9.el9.noarch 1700000000'], True, None),
+    ([], False, None),
+])
+def test_get_rpmdb_digest(monkeypatch, rpm_stdout, rpm_error, expected):
+    calls = []
+
+    class MockedNspawnActions(MockedMountingBase):
+        def __init__(self, base_dir):
+            super(MockedNspawnActions, self).__init__()
+            self.base_dir = base_dir
+
+        def call(self, cmd, *args, **kwargs):
+            calls.append((self.base_dir, cmd))
+            if rpm_error:
+                raise CalledProcessError('rpm failed', cmd, {'exit_code': 1, 'stdout': rpm_stdout})
+            return {'stdout': rpm_stdout}
+
+    monkeypatch.setattr(userspacegen.api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(userspacegen.mounting, 'NspawnActions', MockedNspawnActions)
+
+    assert userspacegen._get_rpmdb_digest('/path/userspace') == expected
+    assert calls == [('/path/userspace', ['rpm', '-qa', '--queryformat', '%{NEVRA} %{INSTALLTIME}\n'])]
+
+
 @pytest.mark.parametrize('result,dst_ver,arch,prod_type', [
     (os.path.join(_CERTS_PATH, '8.1', '479.pem'), '8.1', architecture.ARCH_X86_64, 'ga'),
     (os.path.join(_CERTS_PATH, '8.1', '419.pem'), '8.1', architecture.ARCH_ARM64, 'ga'),
@@ -1,7 +1,12 @@
 import os
 
 from leapp.exceptions import StopActorExecutionError
-from leapp.libraries.common.gpg import get_gpg_fp_from_file, get_path_to_gpg_certs, get_pubkeys_from_rpms
+from leapp.libraries.common.gpg import (
+    get_gpg_fp_from_file,
+    get_path_to_gpg_certs,
+    get_pubkeys_from_rpms,
+    save_gpg_fp_cache
+)
 from leapp.libraries.stdlib import api
 from leapp.models import GpgKey, InstalledRPM, TrustedGpgKeys
 
@@ -21,6 +26,7 @@ def _get_pubkeys(installed_rpms):
                 if fp not in db_pubkeys:
                     pubkeys.append(GpgKey(fingerprint=fp, rpmdb=False, filename=key_file))
                     db_pubkeys += fp
+    save_gpg_fp_cache()
     return pubkeys
 
 
@@ -1,13 +1,23 @@
 # plugin inspired by "system_upgrade.py" from rpm-software-management
 from __future__ import print_function
 
+import hashlib
 import json
 import logging
+import os
 import sys
+import time
 
 import dnf
 import dnf.cli
 import dnf.module.module_base
+import dnf.selector
+
+try:
+    from dnf import transaction_sr
+except ImportError:
+    # older DNF versions cannot serialize transactions
+    transaction_sr = None
 
 CMDS = ['check', 'download', 'dry-run', 'upgrade']
 """
@@ -27,6 +37,12 @@ Basic subcommands for the plugin.
 """
 
 
+GLOB_CHARS = '*?[]'
+"""
+Characters of globs in package specs, such specs are never resolved in bulk.
+"""
+
+
 class DoNotDownload(Exception):
     pass
 
@@ -42,6 +58,18 @@ class RhelUpgradeCommand(dnf.cli.Command):
     def __init__(self, cli):
         super(RhelUpgradeCommand, self).__init__(cli)
         self.plugin_data = {}
+        self._stage_start = None
+        self._transaction_replayed = False
+        self._transaction_replay_failed = False
+
+    def _log_stage_time(self, stage):
+        """
+        Print how long the given stage took since the end of the previous one
+        """
+        now = time.time()
+        if self._stage_start is not None:
+            print('rhel-upgrade: {} took {:.2f}s'.format(stage, now - self._stage_start))
+        self._stage_start = now
 
     @staticmethod
     def set_argparser(parser):
@@ -68,6 +96,183 @@ class RhelUpgradeCommand(dnf.cli.Command):
                        'in repositories metadata: '.format(entity_name, op.__name__) + ' '.join(entities_notfound))
             print('Warning: ' + err_str, file=sys.stderr)
 
+    def _time_download(self):
+        """
+        Log the time spent by the download of packages separately from the rest of the transaction
+        """
+        download_packages = self.base.download_packages
+
+        def _download_packages(*args, **kwargs):
+            self._log_stage_time('transaction preparation')
+            result = download_packages(*args, **kwargs)
+            self._log_stage_time('download')
+            return result
+
+        self.base.download_packages = _download_packages
+
+    def _split_bulk_specs(self, entities):
+        """
+        Split package specs to those which are plain names of packages and the rest
+
+        All specs are checked by one query. Only specs matching names of existing
+        packages are returned as plain names, so the resolution of the rest
+        (globs, provides, NEVRAs, ...) is left on DNF.
+        """
+        candidates = [spec for spec in entities if not any(c in spec for c in GLOB_CHARS) and '/' not in spec]
+        names = set(pkg.name for pkg in self.base.sack.query().filterm(name=candidates))
+        return [spec for spec in entities if spec in names], [spec for spec in entities if spec not in names]
+
+    def _remove_bulk(self, entities):
+        """
+        Adds packages to remove to the transaction, equivalent to base.remove() for each spec
+        """
+        names, rest = self._split_bulk_specs(entities)
+        installed = self.base.sack.query().installed().filterm(name=names)
+        clean_deps = self.base.conf.clean_requirements_on_remove
+        for pkg in installed:
+            self.base._goal.erase(pkg, clean_deps=clean_deps)  # pylint: disable=protected-access
+        # packages which are not installed are reported as not found by the regular way
+        installed_names = set(pkg.name for pkg in installed)
+        rest.extend(name for name in names if name not in installed_names)
+        self._process_entities(entities=rest, op=self.base.remove, entity_name='Package')
+
+    def _install_bulk(self, entities):
+        """
+        Adds packages to install to the transaction, equivalent to base.install() for each spec
+
+        The best available package of the name or a package obsoleting it is installed.
+        """
+        names, rest = self._split_bulk_specs(entities)
+        available = self.base.sack.query().available().filterm(name=names, arch__neq=['src', 'nosrc'])
+        pkgs_by_name = {}
+        for pkg in available:
+            pkgs_by_name.setdefault(pkg.name, []).append(pkg)
+        if self.base.conf.obsoletes:
+            for obsoleter in self.base.sack.query().available().filterm(obsoletes=available):
+                # the obsoleter is selected only for names it obsoletes (name and version range)
+                for reldep in obsoleter.obsoletes:
+                    name = str(reldep).split(' ', 1)[0]
+                    if name not in pkgs_by_name or obsoleter in pkgs_by_name[name]:
+                        continue
+                    if available.filter(name=name, provides=reldep):
+                        pkgs_by_name[name].append(obsoleter)
+        for name in names:
+            if name not in pkgs_by_name:
+                # only installed packages exist, let DNF report it
+                rest.append(name)
+                continue
+            sltr = dnf.selector.Selector(self.base.sack)
+            sltr.set(pkg=pkgs_by_name[name])
+            self.base._goal.install(select=sltr, optional=False)  # pylint: disable=protected-access
+        self._process_entities(entities=rest, op=self.base.install, entity_name='Package')
+
+    def _get_transaction_file(self):
+        """
+        Return path to the file with the resolved transaction shared between stages or None
+
+        The transaction is shared by the check, download and dry-run stages only.
+        """
+        if transaction_sr is None or self.opts.tid[0] not in ('check', 'download', 'dry-run'):
+            return None
+        return self.plugin_data['dnf_conf'].get('transaction_file')
+
+    def _get_transaction_key(self):
+        """
+        Return hash of all the inputs of the transaction resolution
+
+        That is the plugin data (apart from options not affecting the resolution),
+        the state of the RPM DB and revisions of the repositories metadata.
+        """
+        dnf_conf = dict(self.plugin_data['dnf_conf'])
+        for option in ('debugsolver', 'test_flag'):
+            dnf_conf.pop(option, None)
+        data = {
+            'pkgs_info': self.plugin_data['pkgs_info'],
+            'dnf_conf': dnf_conf,
+            'rpmdb': self.base.sack._rpmdb_version(),  # pylint: disable=protected-access
+            'repos': sorted(
+                # pylint: disable=protected-access
+                [repo.id, repo._repo.getRevision(), repo._repo.getTimestamp()]
+                for repo in self.base.repos.iter_enabled()
+            ),
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _store_transaction(self):
+        """
+        Store the resolved transaction, so following stages do not have to resolve it again
+        """
+        transaction_file = self._get_transaction_file()
+        if not transaction_file or self._transaction_replayed:
+            return
+        try:
+            data = {
+                'key': self._get_transaction_key(),
+                'transaction': transaction_sr.serialize_transaction(self.base.history.get_current()),
+            }
+            with open(transaction_file, 'w') as fo:
+                json.dump(data, fo, sort_keys=True)
+        except (AttributeError, EnvironmentError, dnf.exceptions.Error) as e:
+            print('Warning: Cannot store the resolved transaction: {}'.format(e), file=sys.stderr)
+            if os.path.exists(transaction_file):
+                os.unlink(transaction_file)
+
+    def _replay_transaction(self):
+        """
+        Add the transaction resolved by a previous stage into the goal
+
+        Return True on success. Return False when the transaction cannot be
+        replayed (e.g. the metadata changed meanwhile), so it has to be
+        resolved again.
+        """
+        transaction_file = self._get_transaction_file()
+        if not transaction_file or not os.path.exists(transaction_file) or self.opts.tid[0] == 'check':
+            return False
+        try:
+            with open(transaction_file) as fo:
+                data = json.load(fo)
+            if data.get('key') != self._get_transaction_key():
+                print('The stored transaction is outdated, resolving the transaction again.')
+                return False
+            replay = transaction_sr.TransactionReplay(self.base, data=data['transaction'])
+            replay.run()
+        except (AttributeError, KeyError, ValueError, EnvironmentError,
+                transaction_sr.TransactionError, dnf.exceptions.Error) as e:
+            print('Warning: Cannot replay the stored transaction, resolving it again: {}'.format(e),
+                  file=sys.stderr)
+            self.base.reset(goal=True)
+            self._transaction_replay_failed = True
+            return False
+        print('Replaying the transaction resolved by the previous stage.')
+        self._transaction_replayed = True
+        return True
+
+    def _process_package_tasks(self):
+        """
+        Adds all package tasks to the transaction
+        """
+        # Package tasks
+        to_install = self.plugin_data['pkgs_info']['to_install']
+        to_remove = self.plugin_data['pkgs_info']['to_remove']
+        to_upgrade = self.plugin_data['pkgs_info']['to_upgrade']
+        to_reinstall = self.plugin_data['pkgs_info']['to_reinstall']
+
+        if self.plugin_data['dnf_conf'].get('bulk_ops'):
+            # Resolve plain package names by a few combined queries instead of one query per package
+            self._remove_bulk(to_remove)
+            self._install_bulk(to_install)
+        else:
+            # Packages to be removed
+            self._process_entities(entities=to_remove, op=self.base.remove, entity_name='Package')
+            # Packages to be installed
+            self._process_entities(entities=to_install, op=self.base.install, entity_name='Package')
+        # Packages to be upgraded
+        self._process_entities(entities=to_upgrade, op=self.base.upgrade, entity_name='Package')
+        # Packages to be reinstalled
+        self._process_entities(entities=to_reinstall, op=self.base.reinstall, entity_name='Package')
+
+        self.base.distro_sync()
+
     def _save_aws_region(self, region):
         self.plugin_data['rhui']['aws']['region'] = region
         with open(self.opts.filename, 'w+') as fo:
@@ -161,13 +366,13 @@ class RhelUpgradeCommand(dnf.cli.Command):
         if aws_region and self.opts.tid[0] == 'download':
             self._save_aws_region(aws_region)
 
+        self._log_stage_time('configuration')
+
     def run(self):
+        self._log_stage_time('sack load')
         # takes local rpms, creates Package objects from them, and then adds them to the sack as virtual repository
         local_rpm_objects = self.base.add_remote_rpms(self.plugin_data['pkgs_info']['local_rpms'])
 
-        for pkg in local_rpm_objects:
-            self.base.package_install(pkg)
-
         module_base = dnf.module.module_base.ModuleBase(self.base)
 
         # Module tasks
@@ -185,27 +390,21 @@ class RhelUpgradeCommand(dnf.cli.Command):
             msg = 'The following modules were requested to be enabled, but they are unavailable: %s'
             dnf_plugin_logger.warning(msg, ', '.join(unavailable_modules))
 
-        # Package tasks
-        to_install = self.plugin_data['pkgs_info']['to_install']
-        to_remove = self.plugin_data['pkgs_info']['to_remove']
-        to_upgrade = self.plugin_data['pkgs_info']['to_upgrade']
-        to_reinstall = self.plugin_data['pkgs_info']['to_reinstall']
-
         # Modules to enable
         self._process_entities(entities=[available_modules_to_enable],
                                op=module_base.enable,
                                entity_name='Module stream')
 
-        # Packages to be removed
-        self._process_entities(entities=to_remove, op=self.base.remove, entity_name='Package')
-        # Packages to be installed
-        self._process_entities(entities=to_install, op=self.base.install, entity_name='Package')
-        # Packages to be upgraded
-        self._process_entities(entities=to_upgrade, op=self.base.upgrade, entity_name='Package')
-        # Packages to be reinstalled
-        self._process_entities(entities=to_reinstall, op=self.base.reinstall, entity_name='Package')
-
-        self.base.distro_sync()
+        if not self._replay_transaction():
+            if self._transaction_replay_failed:
+                # the reset of the goal after the failed replay resets also enabled modules
+                self._process_entities(entities=[available_modules_to_enable],
+                                       op=module_base.enable,
+                                       entity_name='Module stream')
+            for pkg in local_rpm_objects:
+                self.base.package_install(pkg)
+            self._process_package_tasks()
+        self._log_stage_time('goal setup')
 
         if self.opts.tid[0] == 'check':
             try:
@@ -214,6 +413,8 @@ class RhelUpgradeCommand(dnf.cli.Command):
                 print('Transaction check: ', file=sys.stderr)
                 print(str(e), file=sys.stderr)
                 raise
+            self._log_stage_time('resolve')
+            self._store_transaction()
 
             # We are doing this to avoid downloading the packages in the check phase
             self.base.download_packages = _do_not_download_packages
@@ -224,6 +425,17 @@ class RhelUpgradeCommand(dnf.cli.Command):
                 self.base.do_transaction(display=displays)
             except DoNotDownload:
                 print('Check completed.')
+        else:
+            self._time_download()
+
+    def run_resolved(self):
+        # the transaction is resolved by DNF after the run() unless in the check stage
+        self._log_stage_time('resolve')
+        self._store_transaction()
+
+    def run_transaction(self):
+        # packages are downloaded and the transaction performed by DNF after the run_resolved()
+        self._log_stage_time('transaction')
 
 
 class RhelUpgradePlugin(dnf.Plugin):
@@ -0,0 +1,125 @@
+import json
+import os
+
+from leapp.libraries.common.config import get_env
+from leapp.libraries.common.config.version import get_source_major_version, get_target_major_version
+from leapp.libraries.stdlib import api
+from leapp.models import DeviceDriverDeprecationEntry
+
+DEPRECATION_INDEX = '/var/lib/leapp/device_driver_deprecation_index.json'
+"""
+Index of the device and driver deprecation data loaded for the current upgrade.
+
+The index is created by the actor loading the deprecation data, together with
+the DeviceDriverDeprecationData message. Actors looking for particular devices
+or drivers can query it instead of deserializing all entries of the message.
+"""
+
+
+def _get_index_key():
+    """
+    Return the identification of the current upgrade the index is created for
+
+    None is returned when the leapp execution is not known, the index is not used in such a case.
+    """
+    execution_id = get_env('LEAPP_EXECUTION_ID')
+    if not execution_id:
+        return None
+    return [execution_id, get_source_major_version(), get_target_major_version()]
+
+
+def store_deprecation_index(entries):
+    """
+    Create the index of the given deprecation data entries for the current upgrade
+
+    :param entries: All loaded device and driver deprecation entries
+    :type entries: List[DeviceDriverDeprecationEntry]
+    """
+    key = _get_index_key()
+    if not key:
+        return
+    # NOTE: All entries are indexed the same way as in lookups built by consumers from the message,
+    # so the last entry wins when the data contains duplicates
+    index = {'key': key, 'devices': {}, 'drivers': {}, 'cpu': []}
+    for entry in entries:
+        data = entry.dump()
+        index['devices'][entry.device_id.replace('0x', '')] = data
+        if not entry.device_id:
+            index['drivers'][entry.driver_name] = data
+        if entry.device_type == 'cpu':
+            index['cpu'].append(data)
+    try:
+        with open(DEPRECATION_INDEX + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.rename(DEPRECATION_INDEX + '.tmp', DEPRECATION_INDEX)
+    except (OSError, IOError) as err:
+        # consumers fall back to the DeviceDriverDeprecationData message
+        api.current_logger().debug('Cannot store the device and driver deprecation index: {}'.format(err))
+        try:
+            os.unlink(DEPRECATION_INDEX)
+        except OSError:
+            pass
+
+
+class DeviceDriverDeprecationIndex(object):
+    """
+    Provide lookups of the device and driver deprecation data loaded for the current upgrade.
+    """
+
+    def __init__(self, index):
+        self._devices = index['devices']
+        self._drivers = index['drivers']
+        self._cpu = index['cpu']
+
+    def get_pci_device_entry(self, pci_id):
+        """
+        Return the DeviceDriverDeprecationEntry of the PCI device with given ID or None
+
+        :param pci_id: PCI ID of the device without the '0x' prefixes, e.g. '10df:f180'
+        :type pci_id: str
+        """
+        data = self._devices.get(pci_id)
+        return DeviceDriverDeprecationEntry(**data) if data else None
+
+    def get_driver_entry(self, driver_name):
+        """
+        Return the DeviceDriverDeprecationEntry of the driver with given name or None
+
+        :param driver_name: Name of the kernel driver
+        :type driver_name: str
+        """
+        data = self._drivers.get(driver_name)
+        return DeviceDriverDeprecationEntry(**data) if data else None
+
+    def get_cpu_entries(self, arch_prefix):
+        """
+        Return the list of DeviceDriverDeprecationEntry of CPUs with given architecture
+
+        :param arch_prefix: The architecture the device IDs start with, e.g. 'x86_64'
+        :type arch_prefix: str
+        """
+        return [
+            DeviceDriverDeprecationEntry(**data) for data in self._cpu if data['device_id'].startswith(arch_prefix)
+        ]
+
+
+def get_deprecation_index():
+    """
+    Return the DeviceDriverDeprecationIndex for the current upgrade or None if it is not available
+
+    When None is returned, the DeviceDriverDeprecationData message has to be used instead.
+    """
+    key = _get_index_key()
+    if not key:
+        return None
+    try:
+        with open(DEPRECATION_INDEX) as f:
+            index = json.load(f)
+    except (OSError, IOError, ValueError):
+        return None
+    if not isinstance(index, dict) or index.get('key') != key:
+        return None
+    try:
+        return DeviceDriverDeprecationIndex(index)
+    except (KeyError, TypeError):
+        return None
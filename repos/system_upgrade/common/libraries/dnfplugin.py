@@ -54,6 +54,14 @@ DNF_PLUGIN_DATA_NAME = 'dnf-plugin-data.txt'
 DNF_PLUGIN_DATA_PATH = os.path.join('/var/lib/leapp', DNF_PLUGIN_DATA_NAME)
 DNF_PLUGIN_DATA_LOG_PATH = os.path.join('/var/log/leapp', DNF_PLUGIN_DATA_NAME)
 DNF_DEBUG_DATA_PATH = '/var/log/leapp/dnf-debugdata/'
+DNF_TRANSACTION_PATH = '/var/lib/leapp/dnf-transaction.json'
+"""
+Path to the transaction resolved by the DNF plugin inside the target userspace container.
+
+With LEAPP_DNF_REUSE_TRANSACTION=1 the transaction resolved in the check stage is
+stored there and replayed in the download and dry-run stages, unless the plugin
+data, RPM DB or repositories metadata changed meanwhile.
+"""
 
 
 def install(target_basedir):
@@ -98,6 +106,8 @@ def build_plugin_data(target_repoids, debug, test, tasks, on_aws):
         'dnf_conf': {
             'allow_erasing': True,
             'best': True,
+            # resolve plain package names to install/remove in bulk by the plugin
+            'bulk_ops': get_env('LEAPP_DNF_BULK_OPS', '0') == '1',
             'debugsolver': debug,
             'disable_repos': True,
             'enable_repos': target_repoids,
@@ -105,7 +115,8 @@ def build_plugin_data(target_repoids, debug, test, tasks, on_aws):
             'platform_id': 'platform:el{}'.format(get_target_major_version()),
             'releasever': get_target_version(),
             'installroot': '/installroot',
-            'test_flag': test
+            'test_flag': test,
+            'transaction_file': DNF_TRANSACTION_PATH if get_env('LEAPP_DNF_REUSE_TRANSACTION', '0') == '1' else None,
         },
         'rhui': {
             'aws': {
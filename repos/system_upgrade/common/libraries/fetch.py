@@ -1,3 +1,5 @@
+import errno
+import hashlib
 import io  # Python2/Python3 compatible IO (open etc.)
 import json
 import os
@@ -14,6 +16,16 @@ SERVICE_HOST_DEFAULT = "https://cert.cloud.redhat.com"
 REQUEST_TIMEOUT = (5, 30)
 MAX_ATTEMPTS = 3
 ASSET_PROVIDED_DATA_STREAMS_FIELD = 'provided_data_streams'
+CONSUMER_CERT = ("/etc/pki/consumer/cert.pem", "/etc/pki/consumer/key.pem")
+FETCH_CACHE_DIR = '/var/lib/leapp/fetch_cache'
+"""
+Directory with data files downloaded from the online service.
+
+Downloaded files are revalidated using the ETag and Last-Modified headers
+provided by the service, so the content is downloaded again only when it changes.
+"""
+
+_session = None
 
 
 def _get_hint(local_path):
@@ -41,13 +53,82 @@ def _raise_error(local_path, details):
     raise StopActorExecutionError(summary, details={'details': details, 'hint': _get_hint(local_path)})
 
 
-def _request_data(service_path, cert, proxies, timeout=REQUEST_TIMEOUT):
+def _get_session():
+    """
+    Return the HTTP session shared by all requests to the online service.
+
+    The session keeps the connection alive, so the TLS handshake is not
+    repeated for each requested file.
+    """
+    global _session  # pylint: disable=global-statement
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+
+def _get_cache_paths(service_path):
+    key = hashlib.sha256(service_path.encode('utf-8')).hexdigest()
+    base_path = os.path.join(FETCH_CACHE_DIR, key)
+    return '{}.data'.format(base_path), '{}.json'.format(base_path)
+
+
+def _load_cached_response(service_path):
+    """
+    Return a tuple (content, metadata) of the previously downloaded file or (None, None).
+    """
+    data_path, metadata_path = _get_cache_paths(service_path)
+    try:
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        if metadata.get('url') != service_path:
+            return None, None
+        with open(data_path, 'rb') as f:
+            return f.read(), metadata
+    except (OSError, IOError, ValueError, AttributeError):
+        return None, None
+
+
+def _store_cached_response(service_path, response):
+    metadata = {
+        'url': service_path,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+    if not metadata['etag'] and not metadata['last_modified']:
+        # the content cannot be revalidated, so there is no reason to keep it
+        return
+    data_path, metadata_path = _get_cache_paths(service_path)
+    try:
+        try:
+            os.makedirs(FETCH_CACHE_DIR)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        with open(data_path, 'wb') as f:
+            f.write(response.content)
+        # store the metadata as the last one, so the cached content is complete when it exists
+        with open(metadata_path, 'w') as f:
+            json.dump(metadata, f)
+    except (OSError, IOError) as e:
+        api.current_logger().warning('Cannot cache the content of {}: {}'.format(service_path, e))
+
+
+def _get_revalidation_headers(metadata):
+    headers = {}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+    return headers
+
+
+def _request_data(service_path, cert, proxies, timeout=REQUEST_TIMEOUT, headers=None):
     logger = api.current_logger()
     attempt = 0
     while True:
         attempt += 1
         try:
-            return requests.get(service_path, cert=cert, proxies=proxies, timeout=REQUEST_TIMEOUT)
+            return _get_session().get(service_path, cert=cert, proxies=proxies, timeout=timeout, headers=headers)
         except requests.exceptions.Timeout as e:
             etype_msg = 'Connection timeout'
             if isinstance(e, requests.exceptions.ReadTimeout):
@@ -77,6 +158,9 @@ def read_or_fetch(filename,
     """
     Return the contents of a text file or fetch them from an online service if the file does not exist.
 
+    Files fetched from the online service are cached in FETCH_CACHE_DIR and downloaded
+    again only when the service reports they have been modified.
+
     :param str filename: The name of the file to read or fetch.
     :param str directory: Directory that should contain the file.
     :param str service: URL to the service providing the data if the file is missing.
@@ -117,10 +201,11 @@ def read_or_fetch(filename,
 
     proxy = get_env("LEAPP_PROXY_HOST")
     proxies = {"https": proxy} if proxy else None
-    cert = ("/etc/pki/consumer/cert.pem", "/etc/pki/consumer/key.pem")
+    cached_content, cached_metadata = _load_cached_response(service_path)
+    headers = _get_revalidation_headers(cached_metadata) if cached_metadata else None
     response = None
     try:
-        response = _request_data(service_path, cert=cert, proxies=proxies)
+        response = _request_data(service_path, cert=CONSUMER_CERT, proxies=proxies, headers=headers)
     except requests.exceptions.RequestException as e:
         logger.error(e)
         _raise_error(local_path, "Could not fetch {f} from {sp} (unreachable address).".format(
@@ -130,16 +215,22 @@ def read_or_fetch(filename,
         logger.error(e)
         _raise_error(local_path, ("Could not fetch {f} from {sp} (missing certificates). Is the machine"
                                   " registered?".format(f=filename, sp=service_path)))
-    if response.status_code != 200:
+    if response.status_code == 304 and cached_content is not None:
+        content = cached_content
+        logger.debug("File {sp} has not been modified, using the cached content".format(sp=service_path))
+    elif response.status_code != 200:
         _raise_error(local_path, "Could not fetch {f} from {sp} (error code: {e}).".format(
             f=filename, sp=service_path, e=response.status_code))
+    else:
+        content = response.content
+        _store_cached_response(service_path, response)
 
-    if not allow_empty and not response.content:
+    if not allow_empty and not content:
         _raise_error(local_path, "File {lp} successfully retrieved but it's empty".format(lp=local_path))
     logger.warning("File {sp} successfully retrieved and read ({l} bytes)".format(
-        sp=service_path, l=len(response.content)))
+        sp=service_path, l=len(content)))
 
-    return response.content.decode(encoding)
+    return content.decode(encoding)
 
 
 def load_data_asset(actor_requesting_asset,
@@ -199,10 +290,34 @@ def load_data_asset(actor_requesting_asset,
     if provided_data_streams and not isinstance(provided_data_streams, list):
         provided_data_streams = []  # The asset will be later reported as malformed
 
+    produce_consumed_data_asset(actor_requesting_asset, asset_filename, asset_fulltext_name, docs_url, docs_title,
+                                provided_data_streams)
+
+    return asset_contents
+
+
+def produce_consumed_data_asset(actor_requesting_asset,
+                                asset_filename,
+                                asset_fulltext_name,
+                                docs_url,
+                                docs_title,
+                                provided_data_streams):
+    """
+    Produce :class:`leapp.model.ConsumedDataAsset` message for the asset with given asset_filename.
+
+    Intended for actors using the data of the asset without loading it by :func:`load_data_asset`,
+    e.g. from a cache, so the asset is reported the same way as when it is loaded.
+    See :func:`load_data_asset` for the description of parameters.
+
+    :param list provided_data_streams: Data streams provided by the asset (its `provided_data_streams` field).
+    :raises StopActorExecutionError: If ConsumedDataAsset is not specified in the produces tuple
+                                     of the actor_requesting_asset actor.
+    """
+    if models.ConsumedDataAsset not in actor_requesting_asset.produces:
+        raise StopActorExecutionError('The supplied `actor_requesting_asset` does not produce ConsumedDataAsset.')
+
     api.produce(models.ConsumedDataAsset(filename=asset_filename,
                                          fulltext_name=asset_fulltext_name,
                                          docs_url=docs_url,
                                          docs_title=docs_title,
                                          provided_data_streams=provided_data_streams))
-
-    return asset_contents
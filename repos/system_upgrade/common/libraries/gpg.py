@@ -1,4 +1,11 @@
+import base64
+import binascii
+import errno
+import hashlib
+import json
 import os
+import struct
+import tempfile
 
 from leapp.libraries.common import config
 from leapp.libraries.common.config.version import get_source_major_version, get_target_major_version
@@ -6,6 +13,22 @@ from leapp.libraries.stdlib import api, run
 from leapp.models import GpgKey
 
 GPG_CERTS_FOLDER = 'rpm-gpg'
+GPG_FP_CACHE = '/var/lib/leapp/gpg_fingerprints.json'
+"""
+File with fingerprints of already processed key files.
+
+The cache is shared by all actors and leapp runs. An entry is valid while the
+key file keeps its inode and mtime, or its sha256 checksum when these differ.
+Only key files in directories with trusted keys (see get_path_to_gpg_certs)
+are cached, as other key files (e.g. downloaded ones) do not persist.
+"""
+
+_ARMOR_BEGIN = b'-----BEGIN PGP PUBLIC KEY BLOCK-----'
+_ARMOR_END = b'-----END PGP PUBLIC KEY BLOCK-----'
+_PUBLIC_KEY_PACKET_TAG = 6
+
+_fp_cache = None
+_fp_cache_modified = False
 
 
 def get_pubkeys_from_rpms(installed_rpms):
@@ -85,23 +108,257 @@ def _parse_fp_from_gpg(output):
     return gpg_fps
 
 
+def _dearmor_keys(data):
+    """
+    Return the list of binary OpenPGP data of all ASCII armored key blocks in data
+
+    Data not containing any armored key block are considered to be binary.
+    """
+    if _ARMOR_BEGIN not in data:
+        return [data]
+    blocks = []
+    for block in data.split(_ARMOR_BEGIN)[1:]:
+        block = block.split(_ARMOR_END)[0]
+        # armor headers are separated from the base64 data by an empty line
+        lines = block.strip().splitlines()
+        if any(b':' in line for line in lines):
+            lines = lines[[line.strip() for line in lines].index(b'') + 1:]
+        # the last line starting with '=' is the checksum
+        lines = [line.strip() for line in lines if not line.startswith(b'=')]
+        blocks.append(base64.b64decode(b''.join(lines)))
+    return blocks
+
+
+def _iter_packets(data):
+    """
+    Yield tuples (tag, body) of OpenPGP packets in given binary data
+
+    Raise ValueError if the data are not valid OpenPGP packets.
+    """
+    data = bytearray(data)
+    pos = 0
+    while pos < len(data):
+        ctb = data[pos]
+        if not ctb & 0x80:
+            raise ValueError('Invalid OpenPGP packet header')
+        if ctb & 0x40:
+            # new packet format
+            tag = ctb & 0x3f
+            first = data[pos + 1]
+            if first < 192:
+                length, pos = first, pos + 2
+            elif first < 224:
+                length, pos = ((first - 192) << 8) + data[pos + 2] + 192, pos + 3
+            elif first == 255:
+                length, pos = struct.unpack('>I', bytes(data[pos + 2:pos + 6]))[0], pos + 6
+            else:
+                # partial body lengths are not allowed for key packets
+                raise ValueError('Unsupported OpenPGP packet length')
+        else:
+            # old packet format
+            tag = (ctb >> 2) & 0x0f
+            length_type = ctb & 0x03
+            if length_type == 3:
+                length, pos = len(data) - pos - 1, pos + 1
+            else:
+                size = 1 << length_type
+                length = int(binascii.hexlify(bytes(data[pos + 1:pos + 1 + size])), 16)
+                pos += 1 + size
+        if pos + length > len(data):
+            raise ValueError('Truncated OpenPGP packet')
+        yield tag, bytes(data[pos:pos + length])
+        pos += length
+
+
+def _get_key_id(body):
+    """
+    Return the key ID of the public key packet body as hex string
+
+    Raise ValueError in case of unsupported version of the key.
+    """
+    version = bytearray(body[:1])[0]
+    if version == 4:
+        fingerprint = hashlib.sha1(b'\x99' + struct.pack('>H', len(body)) + body).hexdigest()
+        return fingerprint[-16:]
+    if version in (2, 3):
+        # the key ID are the low 64 bits of the RSA modulus following
+        # the version, creation time, validity and algorithm fields
+        bits = struct.unpack('>H', body[8:10])[0]
+        modulus = body[10:10 + (bits + 7) // 8]
+        return binascii.hexlify(modulus[-8:]).decode('ascii')
+    raise ValueError('Unsupported OpenPGP key version {}'.format(version))
+
+
+def _read_fp_from_key_file(key_path):
+    """
+    Return the list of 8 characters fingerprints of public keys in the given file
+
+    This is the in-process equivalent of parsing the gpg output. Return None
+    if the file cannot be read or parsed, so the caller can use gpg instead.
+    """
+    try:
+        with open(key_path, 'rb') as f:
+            data = f.read()
+        fps = []
+        for block in _dearmor_keys(data):
+            for tag, body in _iter_packets(block):
+                if tag == _PUBLIC_KEY_PACKET_TAG:
+                    fps.append(_get_key_id(body)[8:].lower())
+    except (IOError, OSError, ValueError, TypeError, IndexError, struct.error, binascii.Error) as err:
+        api.current_logger().debug('Cannot read OpenPGP keys from {} directly: {}'.format(key_path, err))
+        return None
+    return fps or None
+
+
+def _get_fp_cache():
+    """
+    Return the dict mapping paths of key files to cached fingerprints, loaded just once
+    """
+    global _fp_cache  # pylint: disable=global-statement
+    if _fp_cache is None:
+        try:
+            with open(GPG_FP_CACHE) as f:
+                _fp_cache = json.load(f)
+            if not isinstance(_fp_cache, dict):
+                raise ValueError('Unexpected format of the cache')
+        except (OSError, IOError, ValueError) as err:
+            if not isinstance(err, (OSError, IOError)) or err.errno != errno.ENOENT:
+                api.current_logger().debug('Ignoring invalid gpg fingerprints cache: {}'.format(err))
+            _fp_cache = {}
+    return _fp_cache
+
+
+def _store_fp_cache():
+    """
+    Store the cache atomically, so concurrent readers never see a partial file
+    """
+    cache_dir = os.path.dirname(GPG_FP_CACHE)
+    try:
+        try:
+            os.makedirs(cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.gpg_fingerprints')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(_get_fp_cache(), f)
+        os.rename(tmp_path, GPG_FP_CACHE)
+    except (OSError, IOError) as e:
+        api.current_logger().debug('Cannot store the gpg fingerprints cache: {}'.format(e))
+
+
+def _get_key_file_id(key_path):
+    """
+    Return a tuple (inode, mtime) identifying the content of the key file or None if it does not exist
+    """
+    try:
+        stat = os.stat(key_path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime
+
+
+def _get_key_file_checksum(key_path):
+    try:
+        with open(key_path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except (OSError, IOError):
+        return None
+
+
+def _get_cached_fp(key_path):
+    """
+    Return cached fingerprints of the key file or None if the file changed since cached
+    """
+    entry = _get_fp_cache().get(os.path.abspath(key_path))
+    file_id = _get_key_file_id(key_path)
+    if not entry or not file_id:
+        return None
+    try:
+        if (entry['inode'], entry['mtime']) == file_id:
+            return list(entry['fingerprints'])
+        if entry['sha256'] == _get_key_file_checksum(key_path):
+            # e.g. the file has been reinstalled with the same content
+            entry['inode'], entry['mtime'] = file_id
+            _set_fp_cache_modified()
+            return list(entry['fingerprints'])
+    except (KeyError, TypeError, ValueError):
+        pass
+    return None
+
+
+def _cache_fp(key_path, fps):
+    file_id = _get_key_file_id(key_path)
+    checksum = _get_key_file_checksum(key_path)
+    if not file_id or not checksum:
+        return
+    _get_fp_cache()[os.path.abspath(key_path)] = {
+        'inode': file_id[0],
+        'mtime': file_id[1],
+        'sha256': checksum,
+        'fingerprints': fps,
+    }
+    _set_fp_cache_modified()
+
+
+def _set_fp_cache_modified():
+    global _fp_cache_modified  # pylint: disable=global-statement
+    _fp_cache_modified = True
+
+
+def _is_persistent_key_path(key_path):
+    """
+    Return True if the key file is in a directory with trusted keys, which persist between leapp runs
+    """
+    key_path = os.path.abspath(key_path)
+    return any(key_path.startswith(os.path.join(os.path.abspath(d), '')) for d in get_path_to_gpg_certs())
+
+
+def save_gpg_fp_cache():
+    """
+    Store fingerprints cached by get_gpg_fp_from_file for next actors and leapp runs
+
+    Call it once all key files are processed, so the cache is written just once
+    per process. Entries of key files which do not exist anymore are dropped.
+    """
+    global _fp_cache_modified  # pylint: disable=global-statement
+    if _fp_cache is None:
+        return
+    removed_paths = [path for path in _fp_cache if not os.path.exists(path)]
+    for path in removed_paths:
+        del _fp_cache[path]
+    if _fp_cache_modified or removed_paths:
+        _store_fp_cache()
+        _fp_cache_modified = False
+
+
 def get_gpg_fp_from_file(key_path):
     """
     Return the list of public key fingerprints from the given file
 
     Log warning in case no OpenPGP data found in the given file or it is not
-    readable for some reason.
+    readable for some reason. Fingerprints of unchanged files in directories
+    with trusted keys are taken from the persistent cache, see save_gpg_fp_cache.
 
     :param key_path: Path to the file with GPG key(s)
     :type key_path: str
     :return: List of public key fingerprints from the given file
     :rtype: list(str)
     """
-    res = _gpg_show_keys(key_path)
-    fp = _parse_fp_from_gpg(res)
+    cacheable = _is_persistent_key_path(key_path)
+    fp = _get_cached_fp(key_path) if cacheable else None
+    if fp:
+        return fp
+    fp = _read_fp_from_key_file(key_path)
     if not fp:
-        error_msg = 'Unable to read OpenPGP keys from {}: {}'.format(key_path, res['stderr'])
-        api.current_logger().warning(error_msg)
+        res = _gpg_show_keys(key_path)
+        fp = _parse_fp_from_gpg(res)
+        if not fp:
+            error_msg = 'Unable to read OpenPGP keys from {}: {}'.format(key_path, res['stderr'])
+            api.current_logger().warning(error_msg)
+            return fp
+    if cacheable:
+        _cache_fp(key_path, fp)
     return fp
 
 
@@ -2,9 +2,11 @@ import errno
 import itertools
 import os
 import shutil
+import subprocess
+import time
 from collections import namedtuple
 
-from leapp.libraries.common.config import get_all_envs
+from leapp.libraries.common.config import get_all_envs, get_env
 from leapp.libraries.common.config.version import get_source_major_version
 from leapp.libraries.stdlib import api, CalledProcessError, run
 
@@ -15,6 +17,18 @@ ALWAYS_BIND = []
 
 ErrorData = namedtuple('ErrorData', ['summary', 'details'])
 
+NSPAWN_SESSION_TIMEOUT = 30
+""" Maximal time (in seconds) to wait for a persistent systemd-nspawn container to start """
+
+_NSPAWN_DEFAULT_PATH = '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
+
+_MOUNTINFO = '/proc/self/mountinfo'
+_CGROUP_ROOT = '/sys/fs/cgroup'
+
+_NSENTER_NAMESPACES = (
+    ('mnt', '--mount'), ('uts', '--uts'), ('ipc', '--ipc'), ('net', '--net'), ('pid', '--pid'), ('cgroup', '--cgroup')
+)
+
 
 class MountingMode(object):
     """
@@ -51,6 +65,136 @@ def _makedirs(path, mode=0o777, exists_ok=True):
             raise
 
 
+def _get_process_tree():
+    """
+    Return a dict mapping PIDs to the list of (pid, comm) tuples of their child processes.
+    """
+    tree = {}
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(pid)) as f:
+                stat = f.read()
+        except (OSError, IOError):
+            # the process does not exist anymore
+            continue
+        # the comm field is in parentheses and it can contain spaces and parentheses too
+        comm_start, comm_end = stat.index('('), stat.rindex(')')
+        ppid = int(stat[comm_end + 1:].split()[1])
+        tree.setdefault(ppid, []).append((int(pid), stat[comm_start + 1:comm_end]))
+    return tree
+
+
+def _find_descendant(tree, pid, comm):
+    """ Return PID of the first descendant process of the pid with the given comm or None """
+    queue = [pid]
+    while queue:
+        for child_pid, child_comm in tree.get(queue.pop(0), []):
+            if child_comm == comm:
+                return child_pid
+            queue.append(child_pid)
+    return None
+
+
+def _wait_for_descendant(process, comm, timeout):
+    """ Wait for a descendant process of the process with the given comm and return its PID """
+    deadline = time.time() + timeout
+    while process.poll() is None and time.time() < deadline:
+        pid = _find_descendant(_get_process_tree(), process.pid, comm)
+        if pid:
+            return pid
+        time.sleep(0.05)
+    return None
+
+
+def _get_mounts_under(path):
+    """
+    Return the list of (mount ID, mountpoint) of all mounts on the path or under it
+
+    Return None if the mounts cannot be detected.
+    """
+    path = os.path.join(os.path.abspath(path), '')
+    try:
+        with open(_MOUNTINFO) as f:
+            return [
+                (fields[0], fields[4]) for fields in (line.split() for line in f)
+                if os.path.join(fields[4], '').startswith(path)
+            ]
+    except (OSError, IOError):
+        return None
+
+
+def _get_cgroups(pid):
+    """ Return a dict mapping cgroup hierarchies (by their controllers) to cgroups of the process """
+    with open('/proc/{}/cgroup'.format(pid)) as f:
+        return dict(line.rstrip('\n').split(':', 2)[1:] for line in f if line.strip())
+
+
+def _get_cgroup_procs_path(controllers, cgroup):
+    """ Return path to the cgroup.procs file of the cgroup in the hierarchy with the given controllers """
+    if controllers:
+        root = os.path.join(_CGROUP_ROOT, controllers.replace('name=', ''))
+    elif os.path.exists(os.path.join(_CGROUP_ROOT, 'cgroup.controllers')):
+        root = _CGROUP_ROOT
+    else:
+        # cgroup v2 hierarchy in the hybrid mode
+        root = os.path.join(_CGROUP_ROOT, 'unified')
+    return os.path.join(root, cgroup.lstrip('/'), 'cgroup.procs')
+
+
+def _get_session_cgroup_procs(pid):
+    """
+    Return paths to cgroup.procs files of cgroups of the process that differ from cgroups of the current process
+
+    Raise OSError if any of these files cannot be written.
+    """
+    own_cgroups = _get_cgroups('self')
+    paths = []
+    for controllers, cgroup in sorted(_get_cgroups(pid).items()):
+        if own_cgroups.get(controllers) == cgroup:
+            continue
+        path = _get_cgroup_procs_path(controllers, cgroup)
+        if not os.access(path, os.W_OK):
+            error = errno.EACCES if os.path.exists(path) else errno.ENOENT
+            raise OSError(error, os.strerror(error), path)
+        paths.append(path)
+    return paths
+
+
+def _get_capability_bounding_set(pid):
+    """ Return the capability bounding set of the process as a hex string """
+    with open('/proc/{}/status'.format(pid)) as f:
+        for line in f:
+            if line.startswith('CapBnd:'):
+                return line.split()[1]
+    raise IOError(errno.ENOENT, 'Missing CapBnd of the process {}'.format(pid))
+
+
+def _get_session_namespaces(pid):
+    """ Return nsenter options for namespaces of the process that differ from namespaces of the current process """
+    options = []
+    for namespace, option in _NSENTER_NAMESPACES:
+        try:
+            if os.readlink('/proc/{}/ns/{}'.format(pid, namespace)) != os.readlink('/proc/self/ns/' + namespace):
+                options.append(option)
+        except OSError as e:
+            # namespaces not supported by the kernel
+            if e.errno != errno.ENOENT:
+                raise
+    return options
+
+
+def _wait_for_exit(process, timeout):
+    """ Wait for the process to exit (Popen.wait has no timeout on Python 2) """
+    deadline = time.time() + timeout
+    while process.poll() is None:
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
 class MountError(Exception):
     """ Exception that is thrown when a mount related operation failed """
 
@@ -80,15 +224,48 @@ class IsolationType(object):
             return cmd
 
     class NSPAWN(_Implementation):
-        """ systemd-nspawn implementation """
+        """
+        systemd-nspawn implementation
+
+        By default, every command is executed in a new systemd-nspawn container.
+        In case LEAPP_NSPAWN_PERSISTENT=1, one container is started when the
+        isolation context is created and commands are executed inside it
+        using nsenter, so the container is not set up again for every command.
+        If the container cannot be started, the default behaviour is used.
+
+        Commands executed by nsenter get the namespaces, the root directory,
+        the environment and the cgroups of the container. Unlike commands
+        executed by systemd-nspawn, they are not confined by the seccomp filter
+        of the container and they skip the rest of the payload setup done by
+        systemd-nspawn (e.g. the console setup, or the SELinux context which
+        would be set only with --selinux-context). Contexts relying on these
+        restrictions should be created with persistent=False. A new container
+        is used for every command also when:
+         - the source system is RHEL 7, as its systemd-nspawn does not support
+           --as-pid2 and orphaned processes would not be reaped inside
+           the container
+         - the capability bounding set of the container differs from the one
+           of the current process
+         - cgroups of the container cannot be joined
+
+        Mounts under the target are recorded when the container starts. After
+        any mount operation performed by this library they are checked again
+        and the container is started again if they have changed, so commands
+        always see the current mounts.
+        """
 
-        def __init__(self, target, binds=(), env_vars=None):
+        def __init__(self, target, binds=(), env_vars=None, persistent=True):
             super(IsolationType.NSPAWN, self).__init__(target=target)
             self.binds = list(binds) + ALWAYS_BIND
             self.env_vars = env_vars or get_all_envs()
-
-        def make_command(self, cmd):
-            """ Transform the command to be executed with systemd-nspawn """
+            self.persistent = persistent
+            self._session = None
+            self._session_pid = None
+            self._session_mounts = None
+            self._session_mount_operations = None
+            self._session_exec = None
+
+        def _make_nspawn_command(self):
             binds = ['--bind={}'.format(bind) for bind in self.binds]
             setenvs = ['--setenv={}={}'.format(env.name, env.value) for env in self.env_vars]
             final_cmd = ['systemd-nspawn', '--register=no', '--quiet']
@@ -97,7 +274,95 @@ class IsolationType(object):
                 # in such a case, just add line into the previous solution..
                 # TODO: the same about --capability=all
                 final_cmd += ['--keep-unit', '--capability=all']
-            return final_cmd + ['-D', self.target] + binds + setenvs + cmd
+            return final_cmd + ['-D', self.target] + binds + setenvs
+
+        def _is_persistent(self):
+            """ Tell whether commands should be executed in one persistent container """
+            if not self.persistent or get_env('LEAPP_NSPAWN_PERSISTENT', '0') != '1':
+                return False
+            if get_source_major_version() == '7':
+                api.current_logger().debug(
+                    'The persistent container is not supported on RHEL 7. Using a new container for every command.'
+                )
+                return False
+            return True
+
+        def create(self):
+            """ Start the persistent container if requested """
+            self.close()
+            if not self._is_persistent():
+                return
+            # the stub init of systemd-nspawn reaps processes orphaned inside the container
+            cmd = self._make_nspawn_command() + ['--as-pid2', 'sleep', 'infinity']
+            self._session_mounts = _get_mounts_under(self.target)
+            self._session_mount_operations = MountingBase.mount_operations
+            with open(os.devnull, 'r+') as devnull:
+                try:
+                    self._session = subprocess.Popen(cmd, stdin=devnull, stdout=devnull, stderr=devnull)
+                except OSError as e:
+                    api.current_logger().warning('Cannot start the persistent container: {}'.format(e))
+                    return
+            self._session_pid = _wait_for_descendant(self._session, 'sleep', NSPAWN_SESSION_TIMEOUT)
+            if not self._session_pid:
+                api.current_logger().warning(
+                    'The persistent container in {} has not been started. Using a new container'
+                    ' for every command instead.'.format(self.target)
+                )
+                self.close()
+                return
+            try:
+                capabilities = _get_capability_bounding_set(self._session_pid)
+                own_capabilities = _get_capability_bounding_set('self')
+                cgroup_procs = _get_session_cgroup_procs(self._session_pid)
+                namespaces = _get_session_namespaces(self._session_pid)
+            except (OSError, IOError) as e:
+                api.current_logger().warning(
+                    'Cannot enter the persistent container in {}: {}. Using a new container'
+                    ' for every command instead.'.format(self.target, e)
+                )
+                self.close()
+                return
+            if capabilities != own_capabilities:
+                api.current_logger().warning(
+                    'The persistent container in {} has the capability bounding set {} instead of {}. Using'
+                    ' a new container for every command instead.'.format(self.target, capabilities, own_capabilities)
+                )
+                self.close()
+                return
+            self._session_exec = ['nsenter', '--target', str(self._session_pid)] + namespaces
+            if cgroup_procs:
+                self._session_exec = (
+                    [api.current_actor().get_common_tool_path('execincgroups')] + cgroup_procs + ['--']
+                    + self._session_exec
+                )
+
+        def close(self):
+            """ Stop the persistent container if running """
+            self._session_pid = None
+            self._session_exec = None
+            if not self._session:
+                return
+            if self._session.poll() is None:
+                # systemd-nspawn kills the whole container on SIGTERM
+                self._session.terminate()
+                if not _wait_for_exit(self._session, NSPAWN_SESSION_TIMEOUT):
+                    self._session.kill()
+                    self._session.wait()
+            self._session = None
+
+        def make_command(self, cmd):
+            """ Transform the command to be executed with systemd-nspawn """
+            if self._session_exec and self._session_mount_operations != MountingBase.mount_operations:
+                # the running container does not see mounts created or removed after its start
+                self._session_mount_operations = MountingBase.mount_operations
+                if _get_mounts_under(self.target) != self._session_mounts:
+                    self.create()
+            if self._session_exec:
+                # Set the same environment as systemd-nspawn does for the executed command
+                env = ['PATH={}'.format(_NSPAWN_DEFAULT_PATH), 'container=systemd-nspawn', 'HOME=/root']
+                env += ['{}={}'.format(env_var.name, env_var.value) for env_var in self.env_vars]
+                return self._session_exec + ['--root', '--wd', 'env', '-i'] + env + cmd
+            return self._make_nspawn_command() + cmd
 
     class CHROOT(_Implementation):
         """ chroot implementation """
@@ -273,9 +538,10 @@ class ChrootActions(IsolatedActions):
 class NspawnActions(IsolatedActions):
     """ Isolation with systemd-nspawn """
 
-    def __init__(self, base_dir, binds=(), env_vars=None):
+    def __init__(self, base_dir, binds=(), env_vars=None, persistent=True):
         super(NspawnActions, self).__init__(
-            base_dir=base_dir, implementation=IsolationType.NSPAWN, binds=binds, env_vars=env_vars)
+            base_dir=base_dir, implementation=IsolationType.NSPAWN, binds=binds, env_vars=env_vars,
+            persistent=persistent)
 
 
 class NotIsolatedActions(IsolatedActions):
@@ -302,6 +568,9 @@ class MountConfig(object):
 class MountingBase(object):
     """ Base class for all mount operations """
 
+    mount_operations = 0
+    """ Number of mount and umount calls performed by the library, used to detect changes of mounts cheaply """
+
     def __init__(self, source, target, mode,
                  config=MountConfig.Mount,
                  propagation=MountingPropagation.SHARED):
@@ -346,6 +615,7 @@ class MountingBase(object):
         if os.path.exists(self.target) and os.path.ismount(self.target):
             try:
                 run(['umount'] + self._umount_options() + [self.target], split=False)
+                MountingBase.mount_operations += 1
             except (OSError, CalledProcessError) as e:
                 api.current_logger().warning('Unmounting %s failed with: %s', self.target, str(e))
         for directory in itertools.chain(self.additional_directories, (self.target,)):
@@ -368,6 +638,7 @@ class MountingBase(object):
                 raise MountError('Failed to create mount target directory {}'.format(directory), str(e))
         try:
             run(['mount'] + self._mount_options() + [self.target], split=False)
+            MountingBase.mount_operations += 1
         except (OSError, CalledProcessError) as e:
             api.current_logger().warning('Mounting %s failed with: %s', self.target, str(e), exc_info=True)
             raise MountError(
@@ -1,7 +1,13 @@
 import contextlib
+import errno
+import json
 import os
 import shutil
+import time
 from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+import six
 
 from leapp.exceptions import StopActorExecutionError
 from leapp.libraries.common import mounting, utils
@@ -68,6 +74,51 @@ this constant.
 """
 
 
+USERSPACE_METADATA_SUFFIX = '.metadata.json'
+"""
+Suffix of the file with metadata of a reusable target userspace container.
+
+The file is stored next to the container directory (e.g.
+/var/lib/leapp/el8userspace.metadata.json) and it exists only when
+the container has been created successfully. It contains the fingerprint
+of inputs used to create the container, the digest of packages installed
+in the container when it has been created and the size of the container
+in MiBs.
+"""
+
+
+DISK_IMAGE_WORKERS = 4
+"""
+Maximal number of disk images created and formatted concurrently.
+
+The creation of disk images is dominated by the mkfs run, so the disk images
+are created concurrently to speed up the process on systems with many
+mountpoints. The number is kept low as all the disk images are created
+on the same partition.
+"""
+
+
+DISK_IMAGES_MANIFEST = 'manifest.json'
+"""
+Name of the file describing disk images that can be reused.
+
+The file is stored inside the disk images directory when the reuse of disk
+images is enabled (LEAPP_OVL_REUSE_DISK_IMGS=1).
+"""
+
+_DISK_IMAGES_MANIFEST_VERSION = 1
+
+_DISK_IMAGE_SIZE_TOLERANCE = 0.02
+"""
+Maximal relative difference of the disk image size allowing to reuse it.
+
+The free space of partitions changes a little between leapp runs, so requiring
+the same size would make the reuse of disk images hardly possible. Only disk
+images smaller than the currently calculated size are reused, so the disk
+image never represents more space than is available.
+"""
+
+
 MountPoints = namedtuple('MountPoints', ['fs_file', 'fs_vfstype'])
 
 
@@ -77,12 +128,94 @@ def _get_min_container_size():
     return _MAGICAL_CONSTANT_MIN_CONTAINER_SIZE_9
 
 
+def _get_userspace_metadata_path(userspace_path):
+    return '{}{}'.format(userspace_path.rstrip('/'), USERSPACE_METADATA_SUFFIX)
+
+
+def get_userspace_metadata(userspace_path):
+    """
+    Return metadata of the reusable target userspace container.
+
+    :param userspace_path: Path to the userspace container.
+    :type userspace_path: str
+    :return: Dict with the 'fingerprint', 'rpmdb_digest' and 'size' (in MiBs)
+             of the container or None if the container is not reusable.
+    :rtype: Optional[dict]
+    """
+    metadata_path = _get_userspace_metadata_path(userspace_path)
+    if not os.path.isdir(userspace_path) or not os.path.isfile(metadata_path):
+        return None
+    try:
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        if (
+            not isinstance(metadata.get('fingerprint'), six.string_types)
+            or not isinstance(metadata.get('rpmdb_digest'), six.string_types)
+            or not isinstance(metadata.get('size'), int)
+        ):
+            raise ValueError('Invalid structure of the metadata.')
+    except (OSError, IOError, ValueError, AttributeError) as e:
+        api.current_logger().warning(
+            'Cannot read metadata of the target userspace container {}: {}'.format(userspace_path, e)
+        )
+        return None
+    return metadata
+
+
+def store_userspace_metadata(userspace_path, fingerprint, rpmdb_digest, size):
+    """
+    Store metadata of the target userspace container, so it can be reused.
+
+    :param userspace_path: Path to the userspace container.
+    :type userspace_path: str
+    :param fingerprint: Fingerprint of inputs used to create the container.
+    :type fingerprint: str
+    :param rpmdb_digest: Digest of packages installed in the container.
+    :type rpmdb_digest: str
+    :param size: Size of the container in MiBs.
+    :type size: int
+    """
+    with open(_get_userspace_metadata_path(userspace_path), 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'rpmdb_digest': rpmdb_digest, 'size': size}, f)
+
+
+def remove_userspace_metadata(userspace_path):
+    """
+    Remove metadata of the target userspace container, so it cannot be reused.
+
+    :param userspace_path: Path to the userspace container.
+    :type userspace_path: str
+    """
+    try:
+        os.unlink(_get_userspace_metadata_path(userspace_path))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def get_container_size(userspace_path):
+    """
+    Return the size of the userspace container in MiBs.
+
+    :param userspace_path: Path to the userspace container.
+    :type userspace_path: str
+    :raises OSError, CalledProcessError: The size cannot be obtained.
+    :rtype: int
+    """
+    # ignore symlinks and other partitions to be sure we calculate the space
+    # in reasonable time
+    cont_size = run(['du', '-sPmx', userspace_path])['stdout'].split()[0]
+    # the obtained number is in KiB. But we want to work with MiBs rather.
+    return int(cont_size)
+
+
 def get_recommended_leapp_free_space(userspace_path=None):
     """
     Return recommended free space for the target container (+ pkg downloads)
 
     If the path to the container is set, the returned value is updated to
-    reflect already consumed space by the installed container. In case the
+    reflect already consumed space by the installed container. For a reusable
+    container, the size recorded in its metadata is used. In case the
     container is bigger than the minimal protected size, return at least
     `_MAGICAL_CONSTANT_MIN_PROTECTED_SIZE`.
 
@@ -108,12 +241,15 @@ def get_recommended_leapp_free_space(userspace_path=None):
     min_cont_size = _get_min_container_size()
     if not userspace_path or not os.path.exists(userspace_path):
         return min_cont_size
+    userspace_metadata = get_userspace_metadata(userspace_path)
     try:
-        # ignore symlinks and other partitions to be sure we calculate the space
-        # in reasonable time
-        cont_size = run(['du', '-sPmx', userspace_path])['stdout'].split()[0]
-        # the obtained number is in KiB. But we want to work with MiBs rather.
-        cont_size = int(cont_size)
+        if userspace_metadata:
+            # The container is reusable and its size has been recorded when it has been
+            # created. The container can only grow since then, so the estimation stays
+            # on the safe side while the expensive calculation is skipped.
+            cont_size = userspace_metadata['size']
+        else:
+            cont_size = get_container_size(userspace_path)
     except (OSError, CalledProcessError):
         # do not care about failed cmd, in such a case, just act like userspace_path
         # has not been set
@@ -167,14 +303,42 @@ def _get_fspace(path, convert_to_mibs=False, coefficient=1):
     return fspace_bytes
 
 
-def _ensure_enough_diskimage_space(space_needed, directory):
+def _get_disk_images_size(disk_images_directory):
+    """
+    Return the disk space in MiBs occupied by disk images in the given directory.
+
+    Disk images are sparse files, so the allocated space is counted instead
+    of their apparent size.
+    """
+    size = 0
+    if not os.path.isdir(disk_images_directory):
+        return 0
+    for name in os.listdir(disk_images_directory):
+        try:
+            size += os.lstat(os.path.join(disk_images_directory, name)).st_blocks * 512
+        except OSError:
+            continue
+    return int(size / 1024 / 1024)  # noqa: W1619; pylint: disable=old-division
+
+
+def _ensure_enough_diskimage_space(space_needed, directory, reclaimable_space=0):
+    """
+    Stop the actor execution if there is not enough space to create disk images.
+
+    :param space_needed: Required free space in MiBs.
+    :type space_needed: int
+    :param directory: Path to the directory hosting the disk images.
+    :type directory: str
+    :param reclaimable_space: Space in MiBs occupied by disk images from previous runs.
+    :type reclaimable_space: int
+    """
     # TODO(pstodulk): update the error msg/details
     # imagine situation we inform user we need at least 800MB,
     # so they clean /var/lib/leapp/* which can provide additional space,
     # but the calculated required free space takes the existing content under
     # /var/lib/leapp/ into account, so the next error msg could say:
     #    needed at least 3400 MiB - which could be confusing for users.
-    if _get_fspace(directory) < (space_needed * 1024 * 1024):
+    if _get_fspace(directory) + reclaimable_space * 1024 * 1024 < (space_needed * 1024 * 1024):
         message = (
             'Not enough space available on {directory}: Needed at least {space_needed} MiB.'
             .format(directory=directory, space_needed=space_needed)
@@ -250,6 +414,12 @@ def _prepare_required_mounts(scratch_dir, mounts_dir, storage_info, scratch_rese
 
     See `_create_mount_disk_image` docstring for additional more details.
 
+    In case LEAPP_OVL_REUSE_DISK_IMGS=1, disk images created previously are
+    reused when the mountpoint, its FS type and the FS type of the disk image
+    are unchanged and the size of the disk image still reflects the free space
+    of the partition (see `_DISK_IMAGE_SIZE_TOLERANCE`). Other disk images are
+    created again.
+
     :param scratch_dir: Path to the scratch directory.
     :type scratch_dir: str
     :param mounts_dir: Path to the directory supposed to be a mountpoint.
@@ -259,34 +429,77 @@ def _prepare_required_mounts(scratch_dir, mounts_dir, storage_info, scratch_rese
     :param scratch_reserve: Number of MB that should be extra reserved in a partition hosting the scratch_dir.
     :type scratch_reserve: Optional[int]
     """
-    mount_points = sorted([mp.fs_file for mp in _get_mountpoints(storage_info)])
+    fs_types = {mp.fs_file: mp.fs_vfstype for mp in _get_mountpoints(storage_info)}
+    mount_points = sorted(fs_types.keys())
     scratch_mp = _get_scratch_mountpoint(mount_points, scratch_dir)
     disk_images_directory = os.path.join(scratch_dir, 'diskimages')
 
-    # Ensure we cleanup old disk images before we check for space constraints.
-    # NOTE(pstodulk): Could we improve the process so we create imgs & calculate
-    # the required disk space just once during each leapp (pre)upgrade run?
-    run(['rm', '-rf', disk_images_directory])
-    _create_diskimages_dir(scratch_dir, disk_images_directory)
+    manifest = None
+    if _is_disk_images_reuse_enabled():
+        manifest = _load_disk_images_manifest(disk_images_directory)
+    if manifest is None:
+        # Ensure we cleanup old disk images before we check for space constraints.
+        run(['rm', '-rf', disk_images_directory])
+        _create_diskimages_dir(scratch_dir, disk_images_directory)
+        manifest = {}
+    else:
+        # Invalidate the manifest first, so disk images are not reused
+        # in case their creation fails
+        _remove_disk_images_manifest(disk_images_directory)
+
+    # Space occupied by disk images kept from previous runs is available
+    # for the new disk images as well (these are reused or overwritten).
+    diskimages_size = _get_disk_images_size(disk_images_directory)
 
     # TODO(pstodulk): update the calculation for bind mounted mount_points (skip)
     # basic check whether we have enough space at all
     space_needed = scratch_reserve + _MAGICAL_CONSTANT_OVL_SIZE * len(mount_points)
-    _ensure_enough_diskimage_space(space_needed, scratch_dir)
+    _ensure_enough_diskimage_space(space_needed, scratch_dir, diskimages_size)
 
     # free space required on this partition should not be affected by durin the
     # upgrade transaction execution by space consumed on creation of disk images
     # as disk images are cleaned in the end of this functions,
     # but we want to reserve some space in advance.
-    scratch_disk_size = _get_fspace(scratch_dir, convert_to_mibs=True) - scratch_reserve
+    scratch_disk_size = _get_fspace(scratch_dir, convert_to_mibs=True) + diskimages_size - scratch_reserve
 
-    result = {}
+    disk_sizes = []
     for mountpoint in mount_points:
         # keep the info about the free space rather 5% lower than the real value
         disk_size = _get_fspace(mountpoint, convert_to_mibs=True, coefficient=0.95)
         if mountpoint == scratch_mp:
             disk_size = scratch_disk_size
-        image = _create_mount_disk_image(disk_images_directory, mountpoint, disk_size)
+        disk_sizes.append((mountpoint, disk_size))
+
+    new_manifest = {}
+    images = {}
+    disk_images_to_create = []
+    for mountpoint, disk_size in disk_sizes:
+        new_manifest[mountpoint] = {
+            'image': _mount_name(mountpoint),
+            'size': disk_size,
+            'fs_vfstype': fs_types[mountpoint],
+            'image_fs_type': _get_disk_image_fs_type(),
+        }
+        if _is_disk_image_reusable(disk_images_directory, manifest.get(mountpoint), new_manifest[mountpoint]):
+            api.current_logger().debug('Reusing the disk image for {}'.format(mountpoint))
+            new_manifest[mountpoint] = manifest[mountpoint]
+            images[mountpoint] = os.path.join(disk_images_directory, manifest[mountpoint]['image'])
+        else:
+            disk_images_to_create.append((mountpoint, disk_size))
+
+    for mountpoint in set(manifest) - set(new_manifest):
+        # the mountpoint does not exist anymore
+        run(['rm', '-f', os.path.join(disk_images_directory, _mount_name(mountpoint))])
+
+    created_images = _create_mount_disk_images(disk_images_directory, disk_images_to_create)
+    images.update(zip([mp for mp, dummy_size in disk_images_to_create], created_images))
+
+    if _is_disk_images_reuse_enabled():
+        _store_disk_images_manifest(disk_images_directory, new_manifest)
+
+    result = {}
+    for mountpoint in mount_points:
+        image = images[mountpoint]
         result[mountpoint] = mounting.LoopMount(
             source=image,
             target=_mount_dir(mounts_dir, mountpoint)
@@ -294,6 +507,106 @@ def _prepare_required_mounts(scratch_dir, mounts_dir, storage_info, scratch_rese
     return result
 
 
+def _is_disk_images_reuse_enabled():
+    return get_env('LEAPP_OVL_REUSE_DISK_IMGS', '0') == '1'
+
+
+def _get_disk_image_fs_type():
+    return 'ext4' if get_env('LEAPP_OVL_IMG_FS_EXT4', '0') == '1' else 'xfs'
+
+
+def _load_disk_images_manifest(disk_images_directory):
+    """
+    Return the manifest of reusable disk images or None if there is none.
+
+    The manifest is a dict mapping mountpoints to the description of their
+    disk images (name of the image, its size, FS type of the original
+    mountpoint and FS type of the disk image).
+    """
+    manifest_path = os.path.join(disk_images_directory, DISK_IMAGES_MANIFEST)
+    if not os.path.isfile(manifest_path):
+        return None
+    try:
+        with open(manifest_path) as f:
+            data = json.load(f)
+        if data['version'] != _DISK_IMAGES_MANIFEST_VERSION:
+            return None
+        return data['images']
+    except (OSError, IOError, ValueError, KeyError, TypeError) as e:
+        api.current_logger().warning('Cannot read the manifest of disk images: {}'.format(e))
+        return None
+
+
+def _store_disk_images_manifest(disk_images_directory, manifest):
+    manifest_path = os.path.join(disk_images_directory, DISK_IMAGES_MANIFEST)
+    try:
+        with open(manifest_path, 'w') as f:
+            json.dump({'version': _DISK_IMAGES_MANIFEST_VERSION, 'images': manifest}, f)
+    except (OSError, IOError) as e:
+        # Not fatal, the disk images will be just created again next time
+        api.current_logger().warning('Cannot store the manifest of disk images: {}'.format(e))
+
+
+def _remove_disk_images_manifest(disk_images_directory):
+    try:
+        os.unlink(os.path.join(disk_images_directory, DISK_IMAGES_MANIFEST))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _is_disk_image_reusable(disk_images_directory, old_entry, new_entry):
+    """
+    Return True if the disk image described by old_entry can be used instead of new one.
+    """
+    if not old_entry:
+        return False
+    for key in ('image', 'fs_vfstype', 'image_fs_type'):
+        if old_entry.get(key) != new_entry[key]:
+            return False
+    if not os.path.isfile(os.path.join(disk_images_directory, old_entry['image'])):
+        return False
+    old_size = old_entry.get('size', -1)
+    return new_entry['size'] * (1 - _DISK_IMAGE_SIZE_TOLERANCE) <= old_size <= new_entry['size']
+
+
+def _create_mount_disk_images(disk_images_directory, disk_sizes, workers=DISK_IMAGE_WORKERS):
+    """
+    Create disk images for given mountpoints concurrently and return paths to them.
+
+    The paths are returned in the same order as mountpoints are provided.
+    In case the creation of multiple disk images fails, the error of the first
+    one (in the provided order) is raised, regardless of which one failed first.
+
+    :param disk_images_directory: Path to the directory where disk images should be stored.
+    :type disk_images_directory: str
+    :param disk_sizes: List of (mountpoint, disk_size) tuples - see `_create_mount_disk_image`
+    :type disk_sizes: list
+    :param workers: Maximal number of disk images created concurrently.
+    :type workers: int
+    :rtype: list
+    """
+    if not disk_sizes:
+        return []
+    workers = min(workers, len(disk_sizes))
+    if workers <= 1:
+        return [_create_mount_disk_image(disk_images_directory, mp, size) for mp, size in disk_sizes]
+
+    pool = ThreadPool(workers)
+    try:
+        pending_images = [
+            pool.apply_async(_create_mount_disk_image, (disk_images_directory, mp, size))
+            for mp, size in disk_sizes
+        ]
+        # Wait for all disk images so nothing is created behind our back
+        # when an error is raised
+        pool.close()
+        pool.join()
+        return [pending_image.get() for pending_image in pending_images]
+    finally:
+        pool.terminate()
+
+
 @contextlib.contextmanager
 def _build_overlay_mount(root_mount, mounts):
     if not root_mount:
@@ -339,11 +652,46 @@ def cleanup_scratch(scratch_dir, mounts_dir):
     if get_env('LEAPP_DEVEL_KEEP_DISK_IMGS', None) == '1':
         # NOTE(pstodulk): From time to time, it helps me with some experiments
         return
+    disk_images_directory = os.path.join(scratch_dir, 'diskimages')
+    if _is_disk_images_reuse_enabled() and _load_disk_images_manifest(disk_images_directory) is not None:
+        # Keep the disk images so they can be reused by next runs
+        api.current_logger().debug('Removing content of scratch directory %s except disk images.', scratch_dir)
+        for name in os.listdir(scratch_dir):
+            path = os.path.join(scratch_dir, name)
+            if path == disk_images_directory:
+                continue
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, onerror=utils.report_and_ignore_shutil_rmtree_error)
+            else:
+                os.unlink(path)
+        return
     api.current_logger().debug('Recursively removing scratch directory %s.', scratch_dir)
     shutil.rmtree(scratch_dir, onerror=utils.report_and_ignore_shutil_rmtree_error)
     api.current_logger().debug('Recursively removed scratch directory %s.', scratch_dir)
 
 
+def remove_disk_images(scratch_dir):
+    """
+    Remove disk images kept in the scratch directory by previous leapp runs.
+
+    Disk images are kept only when LEAPP_OVL_REUSE_DISK_IMGS=1. Call this
+    when they cannot be reused anymore, so they do not occupy the disk space.
+
+    :param scratch_dir: Path to the scratch directory.
+    :type scratch_dir: str
+    """
+    disk_images_directory = os.path.join(scratch_dir, 'diskimages')
+    if not os.path.exists(disk_images_directory):
+        return
+    api.current_logger().debug('Removing disk images directory %s.', disk_images_directory)
+    try:
+        # Remove the manifest first, so partially removed disk images are never reused
+        _remove_disk_images_manifest(disk_images_directory)
+    except OSError as e:
+        api.current_logger().warning('Cannot remove the manifest of disk images: {}'.format(e))
+    shutil.rmtree(disk_images_directory, onerror=utils.report_and_ignore_shutil_rmtree_error)
+
+
 def _format_disk_image_ext4(diskimage_path):
     """
     Format the specified disk image with Ext4 filesystem.
@@ -449,21 +797,12 @@ def _create_mount_disk_image(disk_images_directory, path, disk_size):
         )
         disk_size = 130
     diskimage_path = os.path.join(disk_images_directory, _mount_name(path))
-    cmd = [
-        '/bin/dd',
-        'if=/dev/zero', 'of={}'.format(diskimage_path),
-        'bs=1M', 'count=0', 'seek={}'.format(disk_size)
-    ]
-    hint = (
-        'Please ensure that there is enough diskspace on the partition hosting'
-        'the {} directory.'
-        .format(disk_images_directory)
-    )
-
+    start = time.time()
     api.current_logger().debug('Attempting to create disk image at %s', diskimage_path)
-    utils.call_with_failure_hint(cmd=cmd, hint=hint)
+    _create_sparse_file(diskimage_path, disk_size)
+    created = time.time()
 
-    if get_env('LEAPP_OVL_IMG_FS_EXT4', '0') == '1':
+    if _get_disk_image_fs_type() == 'ext4':
         # This is alternative to XFS in case we find some issues, to be able
         # to switch simply to Ext4, so we will be able to simple investigate
         # possible issues between overlay <-> XFS if any happens.
@@ -471,9 +810,34 @@ def _create_mount_disk_image(disk_images_directory, path, disk_size):
     else:
         _format_disk_image_xfs(diskimage_path)
 
+    api.current_logger().debug(
+        'Disk image for {path} created in {created:.2f}s and formatted in {formatted:.2f}s.'
+        .format(path=path, created=created - start, formatted=time.time() - created)
+    )
     return diskimage_path
 
 
+def _create_sparse_file(path, size):
+    """
+    Create a sparse file with the apparent size `size` MiBs.
+
+    Equivalent of `dd if=/dev/zero of=<path> bs=1M count=0 seek=<size>`.
+    """
+    try:
+        with open(path, 'wb') as f:
+            f.truncate(size * 1024 * 1024)
+    except (OSError, IOError) as e:
+        hint = (
+            'Please ensure that there is enough diskspace on the partition hosting'
+            ' the {} directory.'
+            .format(os.path.dirname(path))
+        )
+        raise StopActorExecutionError(
+            message='Failed to create the disk image {}. Error: {}'.format(path, str(e)),
+            details={'hint': hint}
+        )
+
+
 def _create_diskimages_dir(scratch_dir, diskimages_dir):
     """
     Prepares directories for disk images
@@ -555,6 +919,12 @@ def create_source_overlay(mounts_dir, scratch_dir, xfs_info, storage_info, mount
     problems, it's possible to switch to Ext4 FS using:
         LEAPP_OVL_IMG_FS_EXT4=1
 
+    Disk images are created again for each call by default. To keep them and
+    reuse them while the storage layout is unchanged, set envar:
+        LEAPP_OVL_REUSE_DISK_IMGS=1
+    Kept disk images are removed by the next call without the envar, or after
+    the upgrade transaction (see `remove_disk_images`).
+
     :param mounts_dir: Absolute path to the directory under which all mounts should happen.
     :type mounts_dir: str
     :param scratch_dir: Absolute path to the directory in which all disk and OVL images are stored.
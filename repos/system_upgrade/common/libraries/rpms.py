@@ -1,7 +1,15 @@
+import warnings
+
 from leapp.libraries import stdlib
 from leapp.libraries.common.config.version import get_source_major_version
 from leapp.models import InstalledRPM
 
+try:
+    import rpm
+except ImportError:
+    rpm = None
+    warnings.warn('Could not import the `rpm` python module.', ImportWarning)
+
 
 class LeappComponents(object):
     """
@@ -42,13 +50,48 @@ GET_LEAPP_PACKAGES_DEFAULT_COMPONENTS = frozenset((LeappComponents.FRAMEWORK,
                                                    LeappComponents.TOOLS))
 
 
+_INSTALLED_RPMS_QUERYFORMAT = (
+    r'%{NAME}|%{VERSION}|%{RELEASE}|%|EPOCH?{%{EPOCH}}:{0}||%|PACKAGER?{%{PACKAGER}}:{(none)}||%|'
+    r'ARCH?{%{ARCH}}:{}||%|DSAHEADER?{%{DSAHEADER:pgpsig}}:{%|RSAHEADER?{%{RSAHEADER:pgpsig}}:{(none)}|}|'
+)
+
+
+def _get_installed_rpms_from_rpmdb():
+    """
+    Read the installed rpms directly from the rpmdb using the rpm python bindings.
+
+    Returns None if the rpmdb cannot be read this way.
+    """
+    if not rpm:
+        return None
+    try:
+        ts = rpm.TransactionSet()
+        # the signatures are just read, there is no reason to verify them
+        ts.setVSFlags(rpm._RPMVSF_NOSIGNATURES | rpm._RPMVSF_NODIGESTS)  # pylint: disable=protected-access
+        return [hdr.format(_INSTALLED_RPMS_QUERYFORMAT) for hdr in ts.dbMatch()]
+    except (rpm.error, AttributeError) as err:
+        stdlib.api.current_logger().warning(
+            'Cannot read installed packages using the rpm python module: {}'.format(err)
+        )
+        return None
+
+
 def get_installed_rpms():
+    """
+    Return installed rpms as a list of strings in the NAME|VERSION|RELEASE|EPOCH|PACKAGER|ARCH|PGPSIG format.
+
+    The rpmdb is read using the rpm python bindings if available, as it is
+    much faster than parsing the output of the rpm command.
+    """
+    installed_rpms = _get_installed_rpms_from_rpmdb()
+    if installed_rpms is not None:
+        return installed_rpms
+
     rpm_cmd = [
         '/bin/rpm',
         '-qa',
         '--queryformat',
-        r'%{NAME}|%{VERSION}|%{RELEASE}|%|EPOCH?{%{EPOCH}}:{0}||%|PACKAGER?{%{PACKAGER}}:{(none)}||%|'
-        r'ARCH?{%{ARCH}}:{}||%|DSAHEADER?{%{DSAHEADER:pgpsig}}:{%|RSAHEADER?{%{RSAHEADER:pgpsig}}:{(none)}|}|\n'
+        _INSTALLED_RPMS_QUERYFORMAT + r'\n'
     ]
     try:
         return stdlib.run(rpm_cmd, split=True)['stdout']
@@ -59,6 +102,136 @@ def get_installed_rpms():
         return []
 
 
+def _get_files_owners_one_by_one(paths, call):
+    owners = {}
+    for path in paths:
+        try:
+            result = call(['rpm', '-qf', '--queryformat', r'%{NAME}-%{VERSION}-%{RELEASE}.%{ARCH}\n', path],
+                          split=True)
+        except stdlib.CalledProcessError:
+            continue
+        owners[path] = result['stdout']
+    return owners
+
+
+_FILES_OWNERS_BATCH_SIZE = 1000
+"""
+Maximal number of paths queried by a single rpm invocation, to not exceed the limit of the command line length.
+"""
+
+
+def _parse_rpm_qf_failures(result):
+    """
+    Get paths reported by `rpm -qf` as not owned by any package or not existing.
+    """
+    failed = set()
+    for line in result['stdout']:
+        if line.startswith('file ') and line.endswith(' is not owned by any package'):
+            failed.add(line[len('file '):-len(' is not owned by any package')])
+    for line in (result.get('stderr') or '').splitlines():
+        if line.startswith('error: file ') and ': ' in line[len('error: file '):]:
+            failed.add(line[len('error: file '):].rpartition(': ')[0])
+    return failed
+
+
+def get_files_owners(paths, context=None):
+    """
+    Get rpms owning the given files.
+
+    Instead of running `rpm -qf` for every single file, all files are
+    queried by a single rpm invocation (per _FILES_OWNERS_BATCH_SIZE files),
+    listing files of the owning rpms. Files which are not listed by their
+    owners literally (e.g. paths under a symlinked directory) are queried
+    by `rpm -qf` separately, so the result is the same as when every file
+    is queried separately.
+
+    :param paths: Iterable of absolute paths to check.
+    :param context: An instance of mounting.IsolatedActions (or an object
+                    with the compatible `call` method) to query rpms in
+                    the isolated environment. None means the host system.
+    :return: A dict mapping each path owned by any rpm to the list of rpms
+             (in the NAME-VERSION-RELEASE.ARCH format) owning it. Paths not
+             owned by any rpm are not present in the dict.
+    """
+    call = context.call if context else stdlib.run
+    paths = sorted(set(paths))
+
+    owners = {}
+    unresolved = []
+    for index in range(0, len(paths), _FILES_OWNERS_BATCH_SIZE):
+        batch = paths[index:index + _FILES_OWNERS_BATCH_SIZE]
+        # NOTE: scalar tags have to be prefixed by "=" to be repeated for every item of the FILENAMES array
+        cmd = ['rpm', '-qf', '--queryformat', r'[%{FILENAMES}\t%{=NAME}-%{=VERSION}-%{=RELEASE}.%{=ARCH}\n]'] + batch
+        # The output contains all files of the owning rpms, do not log it
+        result = call(cmd, split=True, checked=False,
+                      callback_raw=lambda fd, value: None,
+                      callback_linebuffered=lambda fd, value: None)
+
+        batch_paths = set(batch)
+        for line in result['stdout']:
+            path, sep, pkg = line.rpartition('\t')
+            if sep and path in batch_paths:
+                path_owners = owners.setdefault(path, [])
+                # rpms owning multiple of the given files are listed multiple times
+                if pkg not in path_owners:
+                    path_owners.append(pkg)
+        failed = _parse_rpm_qf_failures(result)
+        unresolved.extend(path for path in batch if path not in owners and path not in failed)
+
+    if unresolved:
+        stdlib.api.current_logger().debug(
+            'Querying the owner of {} files separately.'.format(len(unresolved))
+        )
+        owners.update(_get_files_owners_one_by_one(unresolved, call))
+    return owners
+
+
+_consumed_data_cache = {'actor': None, 'entries': {}}
+"""
+Memoized consumed messages and lookups built above them.
+
+Consumed messages do not change during the actor execution, but consuming
+a message with thousands of packages and building a lookup from it is
+expensive. So the message and lookups are memoized for the current actor
+and the callable used to consume the message.
+"""
+
+
+def _get_consumed_data_entry(model, context):
+    """
+    Return the memoized entry for the first message of the model consumed from the context.
+
+    The entry is a dict with the consumed 'message' (or None) and 'lookups'
+    built above the message.
+    """
+    actor = stdlib.api.current_actor()
+    if _consumed_data_cache['actor'] is not actor:
+        _consumed_data_cache['actor'] = actor
+        _consumed_data_cache['entries'] = {}
+    consume = getattr(context, 'consume')
+    # NOTE: the key keeps references to all objects, so their ids cannot be reused by other objects
+    key = (model, context, getattr(consume, '__func__', consume))
+    entry = _consumed_data_cache['entries'].get(key)
+    if entry is None:
+        entry = {'message': next((m for m in consume(model)), None), 'lookups': {}}
+        _consumed_data_cache['entries'][key] = entry
+    return entry
+
+
+def _get_package_index(model, context):
+    """
+    Return a dict mapping names of packages to the list of their items in the consumed model.
+    """
+    entry = _get_consumed_data_entry(model, context)
+    index = entry['lookups'].get('package_index')
+    if index is None:
+        index = {}
+        for pkg in getattr(entry['message'], 'items', None) or []:
+            index.setdefault(pkg.name, []).append(pkg)
+        entry['lookups']['package_index'] = index
+    return index
+
+
 def create_lookup(model, field, keys, context=stdlib.api):
     """
     Create a lookup list from one of the model fields.
@@ -66,12 +239,22 @@ def create_lookup(model, field, keys, context=stdlib.api):
     access this data at some point later in some form of structured
     manner. See package_data_for
 
+    The lookup is memoized, so it's built just once for the consumed message.
+
     :param model: model class
     :param field: model field, its value will be taken for lookup data
     :param key: property of the field's data that will be used to build a resulting set
     :param context: context of the execution
     """
-    data = getattr(next((m for m in context.consume(model)), model()), field)
+    entry = _get_consumed_data_entry(model, context)
+    lookup_key = ('lookup', field, tuple(keys))
+    if lookup_key not in entry['lookups']:
+        entry['lookups'][lookup_key] = _create_lookup(entry['message'] or model(), model, field, keys)
+    return list(entry['lookups'][lookup_key])
+
+
+def _create_lookup(message, model, field, keys):
+    data = getattr(message, field)
     try:
         return [tuple(getattr(obj, key) for key in keys) for obj in data] if data else list()
     except TypeError:
@@ -95,18 +278,15 @@ def has_package(model, package_name, arch=None, version=None, release=None, cont
     """
     if not (isinstance(model, type) and issubclass(model, InstalledRPM)):
         return False
-    keys = ['name']
-    if arch:
-        keys.append('arch')
-    if version:
-        keys.append('version')
-    if release:
-        keys.append('release')
-
-    attributes = [package_name]
-    attributes += [attr for attr in (arch, version, release) if attr is not None]
-    rpm_lookup = create_lookup(model, field='items', keys=keys, context=context)
-    return tuple(attributes) in rpm_lookup
+    for pkg in _get_package_index(model, context).get(package_name, []):
+        if arch and pkg.arch != arch:
+            continue
+        if version and pkg.version != version:
+            continue
+        if release and pkg.release != release:
+            continue
+        return True
+    return False
 
 
 def _read_rpm_modifications(config):
@@ -271,7 +451,6 @@ def package_data_for(model, package_name, context=stdlib.api):
     if not (isinstance(model, type) and issubclass(model, InstalledRPM)):
         return list()
 
-    lookup_keys = ['name', 'arch', 'version', 'release']
-    for (rpmName,rpmArch,rpmVersion,rpmRelease) in create_lookup(model, field='items', keys=lookup_keys, context=context):
-        if package_name == rpmName:
-            return {'name': rpmName,'arch': rpmArch, 'version': rpmVersion, 'release': rpmRelease}
+    pkgs = _get_package_index(model, context).get(package_name)
+    if pkgs:
+        return {'name': pkgs[0].name, 'arch': pkgs[0].arch, 'version': pkgs[0].version, 'release': pkgs[0].release}
@@ -0,0 +1,103 @@
+import pytest
+
+from leapp.libraries.common import devicedriverdeprecation
+from leapp.libraries.common.testutils import CurrentActorMocked, logger_mocked
+from leapp.libraries.stdlib import api
+from leapp.models import DeviceDriverDeprecationEntry
+
+
+def _make_entry(device_type, device_id='', driver_name='', available=(), maintained=()):
+    return DeviceDriverDeprecationEntry(
+        deprecation_announced='',
+        device_id=device_id,
+        device_type=device_type,
+        device_name='device {}'.format(device_id or driver_name),
+        driver_name=driver_name,
+        available_in_rhel=list(available),
+        maintained_in_rhel=list(maintained),
+    )
+
+
+ENTRIES = [
+    _make_entry('pci', device_id='0x10df:0xf180', driver_name='lpfc', available=[7], maintained=[7]),
+    _make_entry('pci', device_id='0x1000:0x0060', driver_name='megaraid_sas', available=[7, 8], maintained=[7]),
+    _make_entry('pci', device_id='0x8086:0x1234', available=[7, 8], maintained=[7, 8]),
+    _make_entry('pci', driver_name='floppy', available=[7], maintained=[7]),
+    _make_entry('pci', driver_name='e1000', available=[7, 8], maintained=[7, 8]),
+    _make_entry('cpu', device_id='x86_64:amd:21:*', available=[7]),
+    _make_entry('cpu', device_id='x86_64:intel:6:[56-57]', available=[7, 8], maintained=[7, 8]),
+    _make_entry('cpu', device_id='s390x:z13:*'),
+]
+
+
+@pytest.fixture
+def index_path(monkeypatch, tmp_path):
+    path = str(tmp_path / 'device_driver_deprecation_index.json')
+    monkeypatch.setattr(devicedriverdeprecation, 'DEPRECATION_INDEX', path)
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    return path
+
+
+def _set_actor(monkeypatch, execution_id='run1', dst_ver='8.6'):
+    envars = {'LEAPP_EXECUTION_ID': execution_id} if execution_id else {}
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(src_ver='7.9', dst_ver=dst_ver, envars=envars))
+
+
+def test_deprecation_index(monkeypatch, index_path):
+    _set_actor(monkeypatch)
+    devicedriverdeprecation.store_deprecation_index(ENTRIES)
+    index = devicedriverdeprecation.get_deprecation_index()
+
+    assert index.get_pci_device_entry('10df:f180') == ENTRIES[0]
+    assert index.get_pci_device_entry('1000:0060') == ENTRIES[1]
+    # all entries are indexed, consumers decide what is relevant for them
+    assert index.get_pci_device_entry('8086:1234') == ENTRIES[2]
+    assert index.get_pci_device_entry('ffff:ffff') is None
+
+    assert index.get_driver_entry('floppy') == ENTRIES[3]
+    assert index.get_driver_entry('e1000') == ENTRIES[4]
+    # drivers of entries describing devices are not indexed
+    assert index.get_driver_entry('lpfc') is None
+
+    assert index.get_cpu_entries('x86_64') == [ENTRIES[5], ENTRIES[6]]
+    assert index.get_cpu_entries('s390x') == [ENTRIES[7]]
+    assert index.get_cpu_entries('ppc64le') == []
+
+
+def test_deprecation_index_duplicates(monkeypatch, index_path):
+    _set_actor(monkeypatch)
+    entries = ENTRIES + [
+        _make_entry('pci', device_id='0x10df:0xf180', driver_name='lpfc', available=[7, 8], maintained=[7, 8]),
+        _make_entry('pci', driver_name='floppy', available=[7, 8], maintained=[7, 8]),
+        _make_entry('cpu', device_id='x86_64:amd:21:*', available=[7, 8]),
+    ]
+    devicedriverdeprecation.store_deprecation_index(entries)
+    index = devicedriverdeprecation.get_deprecation_index()
+
+    # the last entry wins, the same as in lookups built by consumers from the message
+    assert index.get_pci_device_entry('10df:f180') == entries[-3]
+    assert index.get_driver_entry('floppy') == entries[-2]
+    assert index.get_cpu_entries('x86_64') == [ENTRIES[5], ENTRIES[6], entries[-1]]
+
+
+@pytest.mark.parametrize('execution_id,dst_ver', [('run2', '8.6'), ('run1', '9.0'), ('', '8.6')])
+def test_deprecation_index_other_upgrade(monkeypatch, index_path, execution_id, dst_ver):
+    _set_actor(monkeypatch)
+    devicedriverdeprecation.store_deprecation_index(ENTRIES)
+    _set_actor(monkeypatch, execution_id=execution_id, dst_ver=dst_ver)
+    assert devicedriverdeprecation.get_deprecation_index() is None
+
+
+@pytest.mark.parametrize('content', ['', '{', '[]', '{"key": ["run1", "7", "8"]}'])
+def test_deprecation_index_invalid(monkeypatch, index_path, content):
+    _set_actor(monkeypatch)
+    with open(index_path, 'w') as f:
+        f.write(content)
+    assert devicedriverdeprecation.get_deprecation_index() is None
+
+
+def test_deprecation_index_not_stored_without_execution(monkeypatch, index_path):
+    _set_actor(monkeypatch, execution_id='')
+    devicedriverdeprecation.store_deprecation_index(ENTRIES)
+    _set_actor(monkeypatch)
+    assert devicedriverdeprecation.get_deprecation_index() is None
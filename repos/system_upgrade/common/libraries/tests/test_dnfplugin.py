@@ -65,6 +65,7 @@ class DATADnfPluginDataDnfConf(leapp.models.Model):
     topic = DATADnfPluginDataTopic
     allow_erasing = BooleanEnum(choices=[True])
     best = BooleanEnum(choices=[True])
+    bulk_ops = fields.Boolean()
     debugsolver = fields.Boolean()
     disable_repos = BooleanEnum(choices=[True])
     enable_repos = fields.List(fields.StringEnum(choices=TEST_ENABLE_REPOS_CHOICES))
@@ -73,6 +74,7 @@ class DATADnfPluginDataDnfConf(leapp.models.Model):
     releasever = fields.String()
     installroot = fields.StringEnum(choices=['/installroot'])
     test_flag = fields.Boolean()
+    transaction_file = fields.Nullable(fields.StringEnum(choices=['/var/lib/leapp/dnf-transaction.json']))
 
 
 class DATADnfPluginDataRHUIAWS(leapp.models.Model):
@@ -156,6 +158,36 @@ def test_build_plugin_data_variations(
     assert value == expected_value
 
 
+@pytest.mark.parametrize('bulk_ops_env, expected', [('0', False), ('1', True)])
+def test_build_plugin_data_bulk_ops(monkeypatch, bulk_ops_env, expected):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(
+        dst_ver='8.4', envars={'LEAPP_DNF_BULK_OPS': bulk_ops_env}
+    ))
+    data = dnfplugin.build_plugin_data(
+        target_repoids=['BASEOS'],
+        debug=False,
+        test=False,
+        on_aws=False,
+        tasks=leapp.models.FilteredRpmTransactionTasks(to_install=['install1'], to_remove=['remove1'])
+    )
+    assert data['dnf_conf']['bulk_ops'] is expected
+
+
+@pytest.mark.parametrize('reuse_env, expected', [('0', None), ('1', dnfplugin.DNF_TRANSACTION_PATH)])
+def test_build_plugin_data_transaction_file(monkeypatch, reuse_env, expected):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(
+        dst_ver='8.4', envars={'LEAPP_DNF_REUSE_TRANSACTION': reuse_env}
+    ))
+    data = dnfplugin.build_plugin_data(
+        target_repoids=['BASEOS'],
+        debug=False,
+        test=False,
+        on_aws=False,
+        tasks=leapp.models.FilteredRpmTransactionTasks(to_install=['install1'])
+    )
+    assert data['dnf_conf']['transaction_file'] == expected
+
+
 def test_build_plugin_data(monkeypatch):
     monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(dst_ver='8.4'))
     # Use leapp to validate format and data
@@ -176,6 +208,8 @@ def test_build_plugin_data(monkeypatch):
     )
     assert created.dnf_conf.debugsolver is True
     assert created.dnf_conf.test_flag is True
+    assert created.dnf_conf.bulk_ops is False
+    assert created.dnf_conf.transaction_file is None
     assert created.rhui.aws.on_aws is False
 
     with pytest.raises(fields.ModelViolationError):
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+from six.moves import BaseHTTPServer, socketserver
+
+from leapp.exceptions import StopActorExecutionError
+from leapp.libraries.common import fetch
+from leapp.libraries.common.testutils import CurrentActorMocked, logger_mocked
+from leapp.libraries.stdlib import api
+
+ETAG = '"v1"'
+
+
+class _DataRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    requests_log = []
+    content = b'{"data": 1}'
+    etag = ETAG
+
+    def do_GET(self):
+        self.requests_log.append((self.path, self.headers.get('If-None-Match'), self.client_address[1]))
+        if self.path.endswith('missing.json'):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header('ETag', self.etag)
+            self.send_header('Content-Length', str(len(self.content)))
+            self.end_headers()
+            self.wfile.write(self.content)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    # do not wait for kept-alive connections on shutdown
+    daemon_threads = True
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    _DataRequestHandler.protocol_version = 'HTTP/1.1'
+    _DataRequestHandler.requests_log = []
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _DataRequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    # the certificate is not used for plain HTTP, but it has to exist
+    cert = tmp_path / 'cert.pem'
+    cert.write_text(u'')
+    monkeypatch.setattr(fetch, 'CONSUMER_CERT', (str(cert), str(cert)))
+    monkeypatch.setattr(fetch, 'FETCH_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(fetch, '_session', None)
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked())
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_read_or_fetch_revalidates_cached_content(service, tmp_path):
+    directory = str(tmp_path / 'files')
+
+    assert fetch.read_or_fetch('data.json', directory=directory, service=service) == u'{"data": 1}'
+    assert fetch.read_or_fetch('data.json', directory=directory, service=service) == u'{"data": 1}'
+
+    log = _DataRequestHandler.requests_log
+    assert [path for path, dummy_etag, dummy_port in log] == ['/api/pes/data.json'] * 2
+    # the first request is not conditional, the second one is revalidated by etag
+    assert [etag for dummy_path, etag, dummy_port in log] == [None, ETAG]
+
+    # the content is downloaded again once it's changed
+    _DataRequestHandler.content = b'{"data": 2}'
+    _DataRequestHandler.etag = '"v2"'
+    try:
+        assert fetch.read_or_fetch('data.json', directory=directory, service=service) == u'{"data": 2}'
+    finally:
+        _DataRequestHandler.content = b'{"data": 1}'
+        _DataRequestHandler.etag = ETAG
+
+
+def test_read_or_fetch_reuses_session(service, tmp_path):
+    directory = str(tmp_path / 'files')
+    fetch.read_or_fetch('data.json', directory=directory, service=service)
+    fetch.read_or_fetch('other.json', directory=directory, service=service)
+    # both files are downloaded through the same connection
+    assert len({port for dummy_path, dummy_etag, port in _DataRequestHandler.requests_log}) == 1
+
+
+def test_read_or_fetch_error_status(service, tmp_path):
+    with pytest.raises(StopActorExecutionError) as err:
+        fetch.read_or_fetch('missing.json', directory=str(tmp_path), service=service)
+    assert 'error code: 404' in err.value.details['details']
@@ -6,13 +6,23 @@ import distro
 import pytest
 
 from leapp.libraries.common import gpg
-from leapp.libraries.common.testutils import CurrentActorMocked
+from leapp.libraries.common.testutils import CurrentActorMocked, logger_mocked
 from leapp.libraries.stdlib import api
 from leapp.models import GpgKey, InstalledRPM, RPM
 
 VENDORS_GPG = '/etc/leapp/files/vendors.d/rpm-gpg/'
 
 
+@pytest.fixture(autouse=True)
+def fp_cache(monkeypatch, tmp_path):
+    cache_path = str(tmp_path / 'cache' / 'gpg_fingerprints.json')
+    monkeypatch.setattr(gpg, 'GPG_FP_CACHE', cache_path)
+    monkeypatch.setattr(gpg, '_fp_cache', None)
+    monkeypatch.setattr(gpg, '_fp_cache_modified', False)
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked())
+    return cache_path
+
+
 @pytest.mark.parametrize('target, product_type, exp', [
     ('8.6', 'beta', '../../files/rpm-gpg/8beta'),
     ('8.8', 'htb', '../../files/rpm-gpg/8'),
@@ -127,6 +137,132 @@ def test_parse_fp_from_gpg(res, exp):
     assert fp == exp
 
 
+@pytest.mark.parametrize('key_file, exp', [
+    ('8/RPM-GPG-KEY-redhat-release', ['fd431d51', 'd4082792']),
+    ('8beta/RPM-GPG-KEY-redhat-beta', ['f21541eb']),
+    ('9/RPM-GPG-KEY-redhat-release', ['fd431d51', '5a6340b3']),
+])
+def test_read_fp_from_key_file(monkeypatch, tmp_path, key_file, exp):
+    def gpg_show_keys_mocked(key_path):
+        raise AssertionError('gpg should not be executed for valid keys')
+
+    monkeypatch.setattr(gpg, '_gpg_show_keys', gpg_show_keys_mocked)
+    key_path = os.path.join(os.path.dirname(__file__), '../../files/rpm-gpg', key_file)
+    assert gpg._read_fp_from_key_file(key_path) == exp
+    assert gpg.get_gpg_fp_from_file(key_path) == exp
+
+    # binary keys without the ASCII armor
+    binary_key_path = str(tmp_path / 'key.gpg')
+    with open(binary_key_path, 'wb') as f:
+        f.write(b''.join(gpg._dearmor_keys(open(key_path, 'rb').read())))
+    assert gpg._read_fp_from_key_file(binary_key_path) == exp
+
+
+def test_read_fp_from_key_file_fallback(monkeypatch, tmp_path):
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    no_key_path = str(tmp_path / 'nokey')
+    with open(no_key_path, 'w') as f:
+        f.write('test')
+    assert gpg._read_fp_from_key_file(no_key_path) is None
+    assert gpg._read_fp_from_key_file(str(tmp_path / 'nonexistent')) is None
+
+    # the gpg is used for keys that cannot be read directly
+    monkeypatch.setattr(gpg, '_gpg_show_keys', lambda key_path: {
+        'stdout': ['pub:-:4096:1:5054E4A45A6340B3:1646863006:::-:::scSC::::::23::0:'], 'stderr': '', 'exit_code': 0
+    })
+    assert gpg.get_gpg_fp_from_file(no_key_path) == ['5a6340b3']
+
+
+def test_fp_cache(monkeypatch, tmp_path, fp_cache):
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    read_files = []
+
+    def read_fp_mocked(key_path):
+        read_files.append(key_path)
+        with open(key_path) as f:
+            return f.read().split()
+
+    monkeypatch.setattr(gpg, '_read_fp_from_key_file', read_fp_mocked)
+    monkeypatch.setattr(gpg, 'get_path_to_gpg_certs', lambda: [str(tmp_path)])
+    key_path = str(tmp_path / 'key')
+    with open(key_path, 'w') as f:
+        f.write('fd431d51 5a6340b3')
+
+    assert gpg.get_gpg_fp_from_file(key_path) == ['fd431d51', '5a6340b3']
+    assert gpg.get_gpg_fp_from_file(key_path) == ['fd431d51', '5a6340b3']
+    assert read_files == [key_path]
+    # the cache is written once all key files are processed
+    assert not os.path.exists(fp_cache)
+    gpg.save_gpg_fp_cache()
+
+    # the cache is shared between processes (actors) and leapp runs
+    monkeypatch.setattr(gpg, '_fp_cache', None)
+    assert gpg.get_gpg_fp_from_file(key_path) == ['fd431d51', '5a6340b3']
+    assert read_files == [key_path]
+
+    # the same content with a different mtime is still cached
+    os.utime(key_path, (1, 1))
+    assert gpg.get_gpg_fp_from_file(key_path) == ['fd431d51', '5a6340b3']
+    assert read_files == [key_path]
+
+    # changed content is read again
+    os.unlink(key_path)
+    with open(key_path, 'w') as f:
+        f.write('d4082792')
+    os.utime(key_path, (2, 2))
+    assert gpg.get_gpg_fp_from_file(key_path) == ['d4082792']
+    assert read_files == [key_path, key_path]
+
+
+@pytest.mark.parametrize('content', ['', '{', '[]', '{"/key": {"inode": 1}}'])
+def test_fp_cache_invalid(monkeypatch, tmp_path, fp_cache, content):
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(gpg, '_read_fp_from_key_file', lambda key_path: ['fd431d51'])
+    monkeypatch.setattr(gpg, 'get_path_to_gpg_certs', lambda: [str(tmp_path)])
+    os.makedirs(os.path.dirname(fp_cache))
+    with open(fp_cache, 'w') as f:
+        f.write(content)
+    key_path = str(tmp_path / 'key')
+    with open(key_path, 'w') as f:
+        f.write('key')
+
+    assert gpg.get_gpg_fp_from_file(key_path) == ['fd431d51']
+    gpg.save_gpg_fp_cache()
+    monkeypatch.setattr(gpg, '_fp_cache', None)
+    assert gpg._get_cached_fp(key_path) == ['fd431d51']
+
+
+def test_fp_cache_persistent_keys_only(monkeypatch, tmp_path, fp_cache):
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(gpg, '_read_fp_from_key_file', lambda key_path: ['fd431d51'])
+    trusted_dir = tmp_path / 'trusted'
+    trusted_dir.mkdir()
+    monkeypatch.setattr(gpg, 'get_path_to_gpg_certs', lambda: [str(trusted_dir)])
+    key_paths = [str(trusted_dir / 'key1'), str(trusted_dir / 'key2'), str(tmp_path / 'downloaded')]
+    for key_path in key_paths:
+        with open(key_path, 'w') as f:
+            f.write('key')
+        assert gpg.get_gpg_fp_from_file(key_path) == ['fd431d51']
+
+    stored = []
+    store_fp_cache = gpg._store_fp_cache
+    monkeypatch.setattr(gpg, '_store_fp_cache', lambda: stored.append(1) or store_fp_cache())
+    gpg.save_gpg_fp_cache()
+    # nothing changed since stored
+    gpg.save_gpg_fp_cache()
+    assert len(stored) == 1
+    # keys outside of directories with trusted keys (e.g. downloaded ones) are not cached
+    assert sorted(gpg._get_fp_cache()) == key_paths[:2]
+
+    # entries of removed key files are dropped
+    os.unlink(key_paths[1])
+    monkeypatch.setattr(gpg, '_fp_cache', None)
+    assert gpg.get_gpg_fp_from_file(key_paths[0]) == ['fd431d51']
+    gpg.save_gpg_fp_cache()
+    monkeypatch.setattr(gpg, '_fp_cache', None)
+    assert sorted(gpg._get_fp_cache()) == key_paths[:1]
+
+
 def test_pubkeys_from_rpms():
     installed_rpms = InstalledRPM(
         items=[
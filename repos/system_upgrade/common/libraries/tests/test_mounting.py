@@ -0,0 +1,243 @@
+import os
+import signal
+import subprocess
+
+import pytest
+
+from leapp.libraries.common import mounting
+from leapp.libraries.common.testutils import CurrentActorMocked, logger_mocked
+from leapp.libraries.stdlib import api
+
+EXECINCGROUPS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../tools/execincgroups')
+
+
+@pytest.mark.parametrize('src_ver,expected_opts', [
+    ('7.9', []),
+    ('8.8', ['--keep-unit', '--capability=all']),
+])
+def test_nspawn_make_command(monkeypatch, src_ver, expected_opts):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(src_ver=src_ver, envars={'LEAPP_VAR': '1'}))
+    with mounting.NspawnActions('/target', binds=('/a:/b',)) as context:
+        cmd = context.type.make_command(['rpm', '-qa'])
+    assert cmd == ['systemd-nspawn', '--register=no', '--quiet'] + expected_opts + [
+        '-D', '/target', '--bind=/a:/b', '--setenv=LEAPP_VAR=1', 'rpm', '-qa'
+    ]
+
+
+def test_find_descendant():
+    tree = {
+        1: [(10, 'systemd-nspawn')],
+        10: [(11, 'systemd-nspawn'), (12, 'bash')],
+        11: [(13, 'sleep')],
+        12: [(14, 'sleep')],
+    }
+    assert mounting._find_descendant(tree, 1, 'sleep') == 13
+    assert mounting._find_descendant(tree, 12, 'sleep') == 14
+    assert mounting._find_descendant(tree, 13, 'sleep') is None
+
+
+def test_get_process_tree():
+    tree = mounting._get_process_tree()
+    assert os.getpid() in [pid for pid, dummy_comm in tree[os.getppid()]]
+
+
+@pytest.fixture
+def emulated_nspawn(monkeypatch, tmp_path):
+    # Emulate systemd-nspawn by a shell running the given command (without options) in a child process
+    monkeypatch.setattr(mounting.IsolationType.NSPAWN, '_make_nspawn_command', lambda self: [
+        'sh', '-c', 'while [ "${1#--}" != "$1" ]; do shift; done; "$@"; exit', 'sh'
+    ])
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(
+        src_ver='8.10', envars={'LEAPP_NSPAWN_PERSISTENT': '1'}
+    ))
+    mountinfo = tmp_path / 'mountinfo'
+    mountinfo.write_text(u'20 1 253:0 / / rw - xfs /dev/vda1 rw\n')
+    monkeypatch.setattr(mounting, '_MOUNTINFO', str(mountinfo))
+    session_pids = []
+    wait_for_descendant = mounting._wait_for_descendant
+
+    def wait_for_descendant_mocked(*args):
+        session_pids.append(wait_for_descendant(*args))
+        return session_pids[-1]
+
+    monkeypatch.setattr(mounting, '_wait_for_descendant', wait_for_descendant_mocked)
+    yield mountinfo, session_pids
+    # the emulated container does not kill its processes
+    for pid in session_pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def test_nspawn_persistent_session(emulated_nspawn):
+    dummy_mountinfo, session_pids = emulated_nspawn
+    context = mounting.NspawnActions('/target')
+    with context:
+        assert session_pids[0]
+        cmd = context.type.make_command(['rpm', '-qa'])
+        assert cmd[:3] == ['nsenter', '--target', str(session_pids[0])]
+        assert cmd[-3:] == ['LEAPP_NSPAWN_PERSISTENT=1', 'rpm', '-qa']
+        assert 'container=systemd-nspawn' in cmd
+        # the command is executed with the environment set by systemd-nspawn
+        assert context.call(['sh', '-c', 'echo $container'])['stdout'] == 'systemd-nspawn\n'
+    assert context.type._session is None
+    # commands are executed in a new container again once the context is closed
+    assert context.type.make_command(['rpm', '-qa'])[0] == 'sh'
+
+
+def test_nspawn_persistent_session_new_mounts(monkeypatch, emulated_nspawn, tmp_path):
+    mountinfo, session_pids = emulated_nspawn
+    target = str(tmp_path / 'target')
+    run = mounting.run
+
+    def run_mocked(cmd, *args, **kwargs):
+        if cmd[0] != 'mount':
+            return run(cmd, *args, **kwargs)
+        with mountinfo.open('a') as f:
+            f.write(u'22 20 0:6 / {} ro - iso9660 /dev/sr0 ro\n'.format(cmd[-1]))
+        return {'exit_code': 0}
+
+    monkeypatch.setattr(mounting, 'run', run_mocked)
+    get_mounts_under = mounting._get_mounts_under
+    checked_mounts = []
+
+    def get_mounts_under_mocked(path):
+        checked_mounts.append(path)
+        return get_mounts_under(path)
+
+    monkeypatch.setattr(mounting, '_get_mounts_under', get_mounts_under_mocked)
+
+    with mounting.NspawnActions(target) as context:
+        context.type.make_command(['rpm', '-qa'])
+        assert context.type._session_pid == session_pids[0]
+        # mounts are recorded just when the container starts
+        assert len(checked_mounts) == 1
+
+        # mounts out of the target do not matter
+        with mounting.BindMount('/mnt', str(tmp_path / 'mnt'), config=mounting.MountConfig.MountOnly):
+            pass
+        context.type.make_command(['rpm', '-qa'])
+        assert context.type._session_pid == session_pids[0]
+        assert len(checked_mounts) == 2
+
+        # the container is started again to see mounts created under the target after its start
+        with mounting.BindMount('/iso', os.path.join(target, 'mnt/iso'), config=mounting.MountConfig.MountOnly):
+            pass
+        cmd = context.type.make_command(['rpm', '-qa'])
+        assert context.type._session_pid == session_pids[1]
+        assert session_pids[1] not in (None, session_pids[0])
+        assert str(session_pids[1]) in cmd
+        context.type.make_command(['rpm', '-qa'])
+        assert context.type._session_pid == session_pids[1]
+        # mounts are checked only after mount operations performed by the library
+        assert len(checked_mounts) == 4
+
+
+@pytest.mark.parametrize('src_ver,envars,persistent', [
+    ('7.9', {'LEAPP_NSPAWN_PERSISTENT': '1'}, True),
+    ('8.10', {'LEAPP_NSPAWN_PERSISTENT': '1'}, False),
+    ('8.10', {}, True),
+])
+def test_nspawn_persistent_session_disabled(monkeypatch, emulated_nspawn, src_ver, envars, persistent):
+    dummy_mountinfo, session_pids = emulated_nspawn
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(src_ver=src_ver, envars=envars))
+    with mounting.NspawnActions('/target', persistent=persistent) as context:
+        assert context.type.make_command(['rpm', '-qa'])[0] == 'sh'
+    assert not session_pids
+
+
+@pytest.mark.usefixtures('emulated_nspawn')
+def test_nspawn_persistent_session_cgroups(monkeypatch, tmp_path):
+    cgroups = {'self': {'memory': '/user.slice', 'pids': '/', '': '/'}}
+    monkeypatch.setattr(mounting, '_get_cgroups', lambda pid: cgroups.get(pid, {
+        'memory': '/machine.slice/machine-1.scope', 'pids': '/', '': '/machine.slice/machine-1.scope/payload'
+    }))
+    monkeypatch.setattr(mounting, '_CGROUP_ROOT', str(tmp_path / 'cgroup'))
+    monkeypatch.setattr(api.current_actor(), 'get_common_tool_path', lambda name: EXECINCGROUPS)
+    procs_paths = [
+        str(tmp_path / 'cgroup/unified/machine.slice/machine-1.scope/payload/cgroup.procs'),
+        str(tmp_path / 'cgroup/memory/machine.slice/machine-1.scope/cgroup.procs'),
+    ]
+    for path in procs_paths:
+        os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+
+    with mounting.NspawnActions('/target') as context:
+        cmd = context.type.make_command(['rpm', '-qa'])
+        # the command is moved to cgroups of the container
+        assert cmd[:cmd.index('nsenter')] == [EXECINCGROUPS] + procs_paths + ['--']
+        pid = context.call(['sh', '-c', 'echo $$'])['stdout']
+    for path in procs_paths:
+        with open(path) as f:
+            assert f.read() == pid
+
+
+@pytest.mark.parametrize('session_capabilities,session_cgroup', [
+    # the capability bounding set of the container cannot be read
+    (None, '/user.slice'),
+    # the container has a different capability bounding set
+    ('00000000a80425fb', '/user.slice'),
+    # the cgroup of the container cannot be joined
+    ('000001ffffffffff', '/machine.slice'),
+])
+def test_nspawn_persistent_session_restrictions_fallback(monkeypatch, emulated_nspawn, tmp_path,
+                                                         session_capabilities, session_cgroup):
+    dummy_mountinfo, session_pids = emulated_nspawn
+
+    def get_capability_bounding_set_mocked(pid):
+        if pid == 'self':
+            return '000001ffffffffff'
+        if not session_capabilities:
+            raise IOError(2, 'Missing CapBnd of the process {}'.format(pid))
+        return session_capabilities
+
+    monkeypatch.setattr(mounting, '_get_capability_bounding_set', get_capability_bounding_set_mocked)
+    monkeypatch.setattr(mounting, '_get_cgroups', lambda pid: {
+        'memory': '/user.slice' if pid == 'self' else session_cgroup
+    })
+    monkeypatch.setattr(mounting, '_CGROUP_ROOT', str(tmp_path / 'cgroup'))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    with mounting.NspawnActions('/target') as context:
+        assert context.type._session is None
+        assert context.type.make_command(['rpm', '-qa'])[0] == 'sh'
+    assert session_pids
+    assert api.current_logger.warnmsg
+
+
+def test_execincgroups(tmp_path):
+    procs_paths = [str(tmp_path / 'a'), str(tmp_path / 'b')]
+    for path in procs_paths:
+        open(path, 'w').close()
+    pid = subprocess.check_output([EXECINCGROUPS] + procs_paths + ['--', 'sh', '-c', 'echo $$'])
+    for path in procs_paths:
+        with open(path, 'rb') as f:
+            assert f.read() == pid
+
+
+@pytest.mark.parametrize('args,error', [
+    (['/nonexistent/cgroup.procs', '--', 'touch', '{executed}'],
+     b'Error: Cannot move the process to the cgroup: /nonexistent/cgroup.procs\n'),
+    (['{procs}', '--'], b'Error: Missing the command to execute.\n'),
+    (['{procs}'], b'Error: Missing the command to execute.\n'),
+])
+def test_execincgroups_error(tmp_path, args, error):
+    paths = {'procs': str(tmp_path / 'cgroup.procs'), 'executed': str(tmp_path / 'executed')}
+    process = subprocess.Popen(
+        [EXECINCGROUPS] + [arg.format(**paths) for arg in args], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    dummy_stdout, stderr = process.communicate()
+    assert process.returncode == 125
+    assert stderr == error
+    assert not os.path.exists(paths['executed'])
+
+
+def test_nspawn_persistent_session_fallback(monkeypatch):
+    monkeypatch.setattr(mounting.IsolationType.NSPAWN, '_make_nspawn_command', lambda self: ['/nonexistent/nspawn'])
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(
+        src_ver='8.10', envars={'LEAPP_NSPAWN_PERSISTENT': '1'}
+    ))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    with mounting.NspawnActions('/target') as context:
+        assert context.type.make_command(['rpm', '-qa']) == ['/nonexistent/nspawn', 'rpm', '-qa']
+    assert api.current_logger.warnmsg
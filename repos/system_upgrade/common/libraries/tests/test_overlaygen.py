@@ -0,0 +1,220 @@
+import os
+import shutil
+
+import pytest
+
+from leapp.exceptions import StopActorExecutionError
+from leapp.libraries.common import overlaygen
+from leapp.libraries.common.testutils import CurrentActorMocked, logger_mocked
+from leapp.libraries.stdlib import api
+
+
+def test_userspace_metadata(monkeypatch, tmp_path):
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    userspace = tmp_path / 'el8userspace'
+    userspace.mkdir()
+
+    assert overlaygen.get_userspace_metadata(str(userspace)) is None
+
+    overlaygen.store_userspace_metadata(str(userspace), 'fingerprint', 'digest', 1234)
+    assert (tmp_path / 'el8userspace.metadata.json').is_file()
+    assert overlaygen.get_userspace_metadata(str(userspace)) == {
+        'fingerprint': 'fingerprint', 'rpmdb_digest': 'digest', 'size': 1234
+    }
+
+    overlaygen.remove_userspace_metadata(str(userspace))
+    assert overlaygen.get_userspace_metadata(str(userspace)) is None
+    # removal of missing metadata is no-op
+    overlaygen.remove_userspace_metadata(str(userspace))
+
+
+@pytest.mark.parametrize('content', [
+    '', '{', '[]', '{"fingerprint": "fp"}', '{"fingerprint": "fp", "size": 1}',
+    '{"fingerprint": 1, "rpmdb_digest": "digest", "size": 1}',
+])
+def test_userspace_metadata_invalid(monkeypatch, tmp_path, content):
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    userspace = tmp_path / 'el8userspace'
+    userspace.mkdir()
+    (tmp_path / 'el8userspace.metadata.json').write_text(u'{}'.format(content))
+
+    assert overlaygen.get_userspace_metadata(str(userspace)) is None
+    assert api.current_logger.warnmsg
+
+
+def test_recommended_free_space_uses_metadata(monkeypatch, tmp_path):
+    def get_container_size_mocked(path):
+        raise AssertionError('The size of a reusable container should not be calculated.')
+
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(dst_ver='8.6'))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(overlaygen, 'get_container_size', get_container_size_mocked)
+    userspace = tmp_path / 'el8userspace'
+    userspace.mkdir()
+    overlaygen.store_userspace_metadata(str(userspace), 'fingerprint', 'digest', 3000)
+
+    min_size = overlaygen._MAGICAL_CONSTANT_MIN_CONTAINER_SIZE_8
+    assert overlaygen.get_recommended_leapp_free_space(str(userspace)) == max(
+        min_size - 3000, overlaygen._MAGICAL_CONSTANT_MIN_PROTECTED_SIZE
+    )
+
+
+def test_create_sparse_file(tmp_path):
+    image = tmp_path / 'image'
+    overlaygen._create_sparse_file(str(image), 200)
+    assert image.stat().st_size == 200 * 1024 * 1024
+    # the image should not consume any real space
+    assert image.stat().st_blocks * 512 < 1024 * 1024
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_create_mount_disk_images(monkeypatch, tmp_path, workers):
+    formatted = []
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked())
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(overlaygen, '_format_disk_image_xfs', formatted.append)
+
+    disk_sizes = [('/', 1000), ('/var', 100), ('/home', 500)]
+    images = overlaygen._create_mount_disk_images(str(tmp_path), disk_sizes, workers=workers)
+
+    assert images == [str(tmp_path / name) for name in ('root_', 'root_var', 'root_home')]
+    assert sorted(formatted) == sorted(images)
+    for image, (dummy_mp, size) in zip(images, disk_sizes):
+        # the minimal size of the disk image is 130 MiBs
+        assert os.path.getsize(image) == max(size, 130) * 1024 * 1024
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_create_mount_disk_images_error(monkeypatch, tmp_path, workers):
+    def format_mocked(path):
+        if path.endswith(('root_var', 'root_home')):
+            raise StopActorExecutionError('Cannot format {}'.format(os.path.basename(path)))
+
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked())
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(overlaygen, '_format_disk_image_xfs', format_mocked)
+
+    disk_sizes = [('/', 1000), ('/var', 1000), ('/home', 1000)]
+    with pytest.raises(StopActorExecutionError) as err:
+        overlaygen._create_mount_disk_images(str(tmp_path), disk_sizes, workers=workers)
+    # the error of the first failed mountpoint is reported
+    assert err.value.message == 'Cannot format root_var'
+
+
+def test_prepare_required_mounts_reuse(monkeypatch, tmp_path):
+    scratch_dir = str(tmp_path / 'scratch')
+    fspace = {'/': 1000, '/var': 2000}
+    formatted = []
+
+    def run_mocked(cmd, *args, **kwargs):
+        assert cmd[:2] in (['rm', '-rf'], ['rm', '-f'])
+        if os.path.isdir(cmd[2]):
+            shutil.rmtree(cmd[2])
+        elif os.path.exists(cmd[2]):
+            os.unlink(cmd[2])
+
+    def prepare_mounts():
+        del formatted[:]
+        mounts = overlaygen._prepare_required_mounts(scratch_dir, str(tmp_path / 'mounts'), None, 0)
+        assert sorted(mounts) == sorted(fspace)
+        return sorted(os.path.basename(path) for path in formatted)
+
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(envars={'LEAPP_OVL_REUSE_DISK_IMGS': '1'}))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(overlaygen, 'run', run_mocked)
+    monkeypatch.setattr(overlaygen, '_get_mountpoints', lambda storage_info: [
+        overlaygen.MountPoints(mp, 'xfs') for mp in fspace
+    ])
+    monkeypatch.setattr(overlaygen, '_get_fspace', lambda path, **kwargs: fspace.get(path, 1000000))
+    monkeypatch.setattr(overlaygen, '_ensure_enough_diskimage_space', lambda *args: None)
+    monkeypatch.setattr(overlaygen, '_format_disk_image_xfs', formatted.append)
+
+    assert prepare_mounts() == ['root_', 'root_var']
+    # nothing changed - all disk images are reused
+    assert prepare_mounts() == []
+    # a small change of the free space does not matter
+    fspace['/var'] = 2010
+    assert prepare_mounts() == []
+    # only the disk image of the changed partition is created again
+    fspace['/var'] = 1000
+    assert prepare_mounts() == ['root_var']
+
+    overlaygen.cleanup_scratch(scratch_dir, str(tmp_path / 'mounts'))
+    assert sorted(os.listdir(scratch_dir)) == ['diskimages']
+    assert prepare_mounts() == []
+
+    # all disk images are created when the reuse is not enabled
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked())
+    assert prepare_mounts() == ['root_', 'root_var']
+    overlaygen.cleanup_scratch(scratch_dir, str(tmp_path / 'mounts'))
+    assert not os.path.exists(scratch_dir)
+
+
+def test_get_disk_images_size(tmp_path):
+    disk_images_directory = tmp_path / 'diskimages'
+    assert overlaygen._get_disk_images_size(str(disk_images_directory)) == 0
+
+    disk_images_directory.mkdir()
+    # sparse files occupy (almost) no space
+    overlaygen._create_sparse_file(str(disk_images_directory / 'root_'), 100)
+    assert overlaygen._get_disk_images_size(str(disk_images_directory)) == 0
+
+    with open(str(disk_images_directory / 'root_var'), 'wb') as f:
+        f.write(b'\x01' * 3 * 1024 * 1024)
+        f.flush()
+        os.fsync(f.fileno())
+    assert overlaygen._get_disk_images_size(str(disk_images_directory)) == 3
+
+
+@pytest.mark.parametrize('fspace, reclaimable_space, enough', [
+    (100, 0, False),
+    (100, 50, True),
+    (200, 0, True),
+])
+def test_ensure_enough_diskimage_space_reclaimable(monkeypatch, fspace, reclaimable_space, enough):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked())
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(overlaygen, '_get_fspace', lambda path, **kwargs: fspace * 1024 * 1024)
+    if enough:
+        overlaygen._ensure_enough_diskimage_space(150, '/var/lib/leapp', reclaimable_space)
+    else:
+        with pytest.raises(StopActorExecutionError):
+            overlaygen._ensure_enough_diskimage_space(150, '/var/lib/leapp', reclaimable_space)
+
+
+def test_prepare_required_mounts_counts_kept_disk_images(monkeypatch, tmp_path):
+    scratch_dir = str(tmp_path / 'scratch')
+    disk_sizes = []
+
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(envars={'LEAPP_OVL_REUSE_DISK_IMGS': '1'}))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(overlaygen, '_get_mountpoints', lambda storage_info: [overlaygen.MountPoints('/', 'xfs')])
+    monkeypatch.setattr(overlaygen, '_load_disk_images_manifest', lambda path: {})
+    monkeypatch.setattr(overlaygen, '_remove_disk_images_manifest', lambda path: None)
+    monkeypatch.setattr(overlaygen, '_store_disk_images_manifest', lambda path, manifest: None)
+    monkeypatch.setattr(overlaygen, '_get_disk_images_size', lambda path: 300)
+    monkeypatch.setattr(overlaygen, '_get_fspace', lambda path, **kwargs: 1000)
+    monkeypatch.setattr(overlaygen, '_ensure_enough_diskimage_space', lambda *args: disk_sizes.append(args))
+    monkeypatch.setattr(overlaygen, '_create_mount_disk_images', lambda path, sizes: [
+        disk_sizes.append(size) or os.path.join(path, overlaygen._mount_name(mp)) for mp, size in sizes
+    ])
+
+    overlaygen._prepare_required_mounts(scratch_dir, str(tmp_path / 'mounts'), None, 100)
+    # the space occupied by kept disk images is available for the new ones
+    assert disk_sizes == [(100 + overlaygen._MAGICAL_CONSTANT_OVL_SIZE, scratch_dir, 300), 1000 + 300 - 100]
+
+
+def test_remove_disk_images(monkeypatch, tmp_path):
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    scratch_dir = tmp_path / 'scratch'
+    # nothing to remove
+    overlaygen.remove_disk_images(str(scratch_dir))
+
+    disk_images_directory = scratch_dir / 'diskimages'
+    disk_images_directory.mkdir(parents=True)
+    (disk_images_directory / overlaygen.DISK_IMAGES_MANIFEST).write_text(u'{}')
+    (disk_images_directory / 'root_').write_text(u'')
+    (scratch_dir / 'other').write_text(u'')
+
+    overlaygen.remove_disk_images(str(scratch_dir))
+    assert os.listdir(str(scratch_dir)) == ['other']
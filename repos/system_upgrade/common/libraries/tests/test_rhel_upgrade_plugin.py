@@ -0,0 +1,197 @@
+import os
+import re
+from collections import namedtuple
+
+import pytest
+
+dnf = pytest.importorskip('dnf')
+
+PLUGIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../files/rhel_upgrade.py')
+
+
+def _load_plugin():
+    try:
+        from importlib.util import module_from_spec, spec_from_file_location  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        import imp  # pylint: disable=import-outside-toplevel,deprecated-module
+        return imp.load_source('rhel_upgrade', PLUGIN_PATH)
+    spec = spec_from_file_location('rhel_upgrade', PLUGIN_PATH)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+rhel_upgrade = _load_plugin()
+
+Conf = namedtuple('Conf', ['obsoletes', 'clean_requirements_on_remove'])
+
+
+class MockedPackage(object):
+    def __init__(self, name, version=1, arch='x86_64', installed=False, obsoletes=()):
+        self.name = name
+        self.version = version
+        self.arch = arch
+        self.installed = installed
+        self.obsoletes = list(obsoletes)
+
+    def __repr__(self):
+        return '{}-{}.{}'.format(self.name, self.version, self.arch)
+
+
+def _matches(pkg, reldep):
+    """
+    Return True if the package provides its name in a version matching the reldep (e.g. 'foo < 2')
+    """
+    name, op, version = re.match(r'^(\S+)(?: ([<>=]+) (\d+))?$', reldep).groups()
+    if name != pkg.name:
+        return False
+    if not op:
+        return True
+    return {
+        '<': pkg.version < int(version),
+        '<=': pkg.version <= int(version),
+        '=': pkg.version == int(version),
+        '>=': pkg.version >= int(version),
+        '>': pkg.version > int(version),
+    }[op]
+
+
+class MockedQuery(object):
+    def __init__(self, pkgs):
+        self.pkgs = list(pkgs)
+
+    def __iter__(self):
+        return iter(self.pkgs)
+
+    def __len__(self):
+        return len(self.pkgs)
+
+    def installed(self):
+        return MockedQuery([pkg for pkg in self.pkgs if pkg.installed])
+
+    def available(self):
+        return MockedQuery([pkg for pkg in self.pkgs if not pkg.installed])
+
+    def filter(self, **kwargs):
+        return MockedQuery(self.pkgs).filterm(**kwargs)
+
+    def filterm(self, name=None, arch__neq=(), provides=None, obsoletes=None):
+        if name is not None:
+            names = [name] if isinstance(name, str) else name
+            self.pkgs = [pkg for pkg in self.pkgs if pkg.name in names]
+        self.pkgs = [pkg for pkg in self.pkgs if pkg.arch not in arch__neq]
+        if provides is not None:
+            self.pkgs = [pkg for pkg in self.pkgs if _matches(pkg, provides)]
+        if obsoletes is not None:
+            self.pkgs = [
+                pkg for pkg in self.pkgs
+                if any(_matches(obsoleted, reldep) for reldep in pkg.obsoletes for obsoleted in obsoletes)
+            ]
+        return self
+
+
+class MockedSack(object):
+    def __init__(self, pkgs):
+        self.pkgs = pkgs
+        self.queries = 0
+
+    def query(self):
+        self.queries += 1
+        return MockedQuery(self.pkgs)
+
+
+class MockedGoal(object):
+    def __init__(self):
+        self.erased = []
+        self.installed = []
+
+    def erase(self, pkg, clean_deps=False):
+        self.erased.append((pkg, clean_deps))
+
+    def install(self, select, optional=False):
+        self.installed.append(sorted(repr(pkg) for pkg in select.pkgs))
+
+
+class MockedSelector(object):
+    def __init__(self, sack):
+        self.pkgs = []
+
+    def set(self, pkg):
+        self.pkgs = pkg
+
+
+class MockedBase(object):
+    def __init__(self, pkgs, obsoletes=True):
+        self.sack = MockedSack(pkgs)
+        self.conf = Conf(obsoletes=obsoletes, clean_requirements_on_remove=True)
+        self._goal = MockedGoal()
+        self.removed = []
+        self.installed = []
+
+    def remove(self, spec):
+        self.removed.append(spec)
+
+    def install(self, spec):
+        self.installed.append(spec)
+
+
+PKGS = [
+    MockedPackage('bash', installed=True),
+    MockedPackage('bash', version=2),
+    MockedPackage('bash', version=2, arch='src'),
+    MockedPackage('vim', installed=True),
+    MockedPackage('vim', version=2),
+    MockedPackage('foo', version=1),
+    MockedPackage('foo', version=2),
+    MockedPackage('foo-ng', version=3, obsoletes=['foo < 2']),
+    MockedPackage('foo-compat', version=1, obsoletes=['foo < 1']),
+    MockedPackage('python2', version=2),
+    MockedPackage('python3', version=3, obsoletes=['bash < 3', 'python2 < 3']),
+    MockedPackage('oldpkg', installed=True),
+]
+
+
+@pytest.fixture
+def command(monkeypatch):
+    monkeypatch.setattr(rhel_upgrade.dnf.selector, 'Selector', MockedSelector)
+    cmd = rhel_upgrade.RhelUpgradeCommand.__new__(rhel_upgrade.RhelUpgradeCommand)
+    cmd.base = MockedBase(PKGS)
+    return cmd
+
+
+def test_split_bulk_specs(command):
+    names, rest = command._split_bulk_specs(['bash', 'vim*', '/usr/bin/foo', 'missing', 'foo-2-1.x86_64', 'foo'])
+    assert names == ['bash', 'foo']
+    assert rest == ['vim*', '/usr/bin/foo', 'missing', 'foo-2-1.x86_64']
+    # all specs are checked by one query
+    assert command.base.sack.queries == 1
+
+
+def test_remove_bulk(command):
+    command._remove_bulk(['bash', 'oldpkg', 'foo', 'vim*'])
+    assert sorted(repr(pkg) for pkg, clean_deps in command.base._goal.erased) == ['bash-1.x86_64', 'oldpkg-1.x86_64']
+    assert all(clean_deps for dummy_pkg, clean_deps in command.base._goal.erased)
+    # not installed packages and other specs are processed by DNF to report them
+    assert command.base.removed == ['vim*', 'foo']
+
+
+@pytest.mark.parametrize('obsoletes, expected', [
+    (True, [
+        ['bash-2.x86_64', 'python3-3.x86_64'],
+        ['foo-1.x86_64', 'foo-2.x86_64', 'foo-ng-3.x86_64'],
+        ['python2-2.x86_64', 'python3-3.x86_64'],
+    ]),
+    (False, [
+        ['bash-2.x86_64'],
+        ['foo-1.x86_64', 'foo-2.x86_64'],
+        ['python2-2.x86_64'],
+    ]),
+])
+def test_install_bulk(command, obsoletes, expected):
+    command.base.conf = Conf(obsoletes=obsoletes, clean_requirements_on_remove=True)
+    command._install_bulk(['bash', 'foo', 'oldpkg', 'python2', 'vim*'])
+    # obsoleters are selected only for names matching their obsoletes,
+    # e.g. foo-compat obsoletes no available foo and python3 does not obsolete foo
+    assert command.base._goal.installed == expected
+    # only installed packages of the name exist, DNF reports it
+    assert command.base.installed == ['vim*', 'oldpkg']
@@ -1,8 +1,18 @@
 import pytest
 
-from leapp.libraries.common.rpms import _parse_config_modification, get_leapp_dep_packages, get_leapp_packages
-from leapp.libraries.common.testutils import CurrentActorMocked
-from leapp.libraries.stdlib import api
+from leapp.libraries.common import rpms
+from leapp.libraries.common.rpms import (
+    _parse_config_modification,
+    create_lookup,
+    get_files_owners,
+    get_leapp_dep_packages,
+    get_leapp_packages,
+    has_package,
+    package_data_for
+)
+from leapp.libraries.common.testutils import CurrentActorMocked, logger_mocked
+from leapp.libraries.stdlib import api, CalledProcessError
+from leapp.models import InstalledRPM, RPM
 
 
 def test_parse_config_modification():
@@ -95,3 +105,178 @@ def test_get_leapp_dep_packages(major_version, component, result, monkeypatch):
         kwargs["component"] = component
 
     assert frozenset(get_leapp_dep_packages(**kwargs)) == frozenset(result)
+
+
+class MockedContext(object):
+    def __init__(self, rpm_failure=False):
+        self.commands = []
+        self.rpm_failure = rpm_failure
+        self.packages = [
+            ('ca-certificates-2023.2.60-1.el9.noarch', ['/etc/pki/tls', '/etc/pki/tls/cert.pem']),
+            ('redhat-release-9.3-0.5.el9.x86_64', ['/etc/os-release', '/etc/pki/rpm-gpg/RPM-GPG-KEY']),
+            ('other-9.3-1.el9.x86_64', ['/etc/pki/rpm-gpg/RPM-GPG-KEY']),
+            ('bash-5.1.8-6.el9.x86_64', ['/usr/bin/bash']),
+        ]
+        # rpm resolves paths under symlinked directories
+        self.symlinks = {'/bin/bash': '/usr/bin/bash'}
+        self.unowned = ['/etc/pki/custom.pem']
+
+    def call(self, cmd, split=False, checked=True, **dummy_kwargs):
+        self.commands.append(cmd)
+        assert cmd[:3] == ['rpm', '-qf', '--queryformat']
+        list_files = cmd[3].startswith('[')
+        stdout = []
+        stderr = []
+        for path in cmd[4:]:
+            if self.rpm_failure:
+                stderr.append('error: rpmdb: damaged header')
+                continue
+            resolved_path = self.symlinks.get(path, path)
+            owners = [(pkg, files) for pkg, files in self.packages if resolved_path in files]
+            if owners and list_files:
+                stdout.extend('{}\t{}'.format(fname, pkg) for pkg, files in owners for fname in files)
+            elif owners:
+                stdout.extend(pkg for pkg, dummy_files in owners)
+            elif path in self.unowned:
+                stdout.append('file {} is not owned by any package'.format(path))
+            else:
+                stderr.append('error: file {}: No such file or directory'.format(path))
+        result = {'stdout': stdout if split else '\n'.join(stdout), 'stderr': '\n'.join(stderr),
+                  'exit_code': len(stderr) + len([line for line in stdout if 'not owned' in line])}
+        if checked and result['exit_code']:
+            raise CalledProcessError('rpm failed', cmd, result)
+        return result
+
+
+@pytest.mark.parametrize('rpm_failure,batch_size,expected_commands', (
+    (False, 1000, 2),
+    (False, 2, 4),
+    (True, 1000, 6),
+))
+def test_get_files_owners(monkeypatch, rpm_failure, batch_size, expected_commands):
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(rpms, '_FILES_OWNERS_BATCH_SIZE', batch_size)
+    context = MockedContext(rpm_failure=rpm_failure)
+    paths = ['/etc/pki/tls/cert.pem', '/etc/pki/rpm-gpg/RPM-GPG-KEY', '/etc/pki/custom.pem', '/etc/pki/missing',
+             '/bin/bash']
+
+    owners = get_files_owners(paths, context=context)
+
+    if rpm_failure:
+        assert owners == {}
+    else:
+        assert owners == {
+            '/etc/pki/tls/cert.pem': ['ca-certificates-2023.2.60-1.el9.noarch'],
+            '/etc/pki/rpm-gpg/RPM-GPG-KEY': ['redhat-release-9.3-0.5.el9.x86_64', 'other-9.3-1.el9.x86_64'],
+            '/bin/bash': ['bash-5.1.8-6.el9.x86_64'],
+        }
+    # Only the path under the symlinked directory (or all paths when rpm fails) is queried separately
+    assert len(context.commands) == expected_commands
+
+
+def test_get_files_owners_no_paths():
+    context = MockedContext()
+    assert get_files_owners([], context=context) == {}
+    assert not context.commands
+
+
+def _make_installed_rpms(names):
+    return InstalledRPM(items=[
+        RPM(name=name, version='1.0', release='1.el8', epoch='0', packager='packager', arch=arch, pgpsig='sig')
+        for name in names for arch in ('x86_64', 'i686')
+    ])
+
+
+class _CountingActorMocked(CurrentActorMocked):
+    def __init__(self, *args, **kwargs):
+        super(_CountingActorMocked, self).__init__(*args, **kwargs)
+        self.consume_calls = 0
+
+    def consume(self, model):
+        self.consume_calls += 1
+        return super(_CountingActorMocked, self).consume(model)
+
+
+def test_package_queries_consume_once(monkeypatch):
+    actor = _CountingActorMocked(msgs=[_make_installed_rpms(['pkg{}'.format(i) for i in range(5000)])])
+    monkeypatch.setattr(api, 'current_actor', actor)
+
+    for i in range(0, 5000, 50):
+        assert has_package(InstalledRPM, 'pkg{}'.format(i))
+        assert has_package(InstalledRPM, 'pkg{}'.format(i), arch='i686')
+        assert package_data_for(InstalledRPM, 'pkg{}'.format(i))['arch'] == 'x86_64'
+    assert len(create_lookup(InstalledRPM, field='items', keys=('name',))) == 10000
+    assert actor.consume_calls == 1
+
+
+@pytest.mark.parametrize('name,kwargs,expected', [
+    ('pkg1', {}, True),
+    ('pkg1', {'arch': 'i686'}, True),
+    ('pkg1', {'arch': 'noarch'}, False),
+    ('pkg1', {'version': '1.0', 'release': '1.el8'}, True),
+    ('pkg1', {'version': '2.0'}, False),
+    ('pkg1', {'release': '2.el8'}, False),
+    ('missing', {}, False),
+])
+def test_has_package(monkeypatch, name, kwargs, expected):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=[_make_installed_rpms(['pkg1', 'pkg2'])]))
+    assert has_package(InstalledRPM, name, **kwargs) == expected
+
+
+def test_package_queries_follow_consumed_messages(monkeypatch):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=[_make_installed_rpms(['pkg1'])]))
+    assert has_package(InstalledRPM, 'pkg1')
+    assert package_data_for(InstalledRPM, 'pkg2') is None
+
+    # the memoized data are not used for another actor
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=[_make_installed_rpms(['pkg2'])]))
+    assert not has_package(InstalledRPM, 'pkg1')
+    assert package_data_for(InstalledRPM, 'pkg2')['name'] == 'pkg2'
+    assert create_lookup(InstalledRPM, field='items', keys=('name',)) == [('pkg2',), ('pkg2',)]
+
+
+class _RpmHeaderMocked(object):
+    def __init__(self, entry):
+        self.entry = entry
+
+    def format(self, queryformat):
+        assert not queryformat.endswith('\\n')
+        return self.entry
+
+
+class _RpmMocked(object):
+    _RPMVSF_NOSIGNATURES = 1
+    _RPMVSF_NODIGESTS = 2
+
+    class error(Exception):  # pylint: disable=invalid-name
+        pass
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def TransactionSet(self):  # pylint: disable=invalid-name
+        return self
+
+    def setVSFlags(self, flags):  # pylint: disable=invalid-name
+        assert flags == 3
+
+    def dbMatch(self):  # pylint: disable=invalid-name
+        if isinstance(self.entries, Exception):
+            raise self.entries
+        return [_RpmHeaderMocked(entry) for entry in self.entries]
+
+
+def test_get_installed_rpms_rpmdb(monkeypatch):
+    entries = ['bash|5.1.8|6.el9|0|Red Hat, Inc.|x86_64|RSA/SHA256, Key ID 199e2f91fd431d51']
+    monkeypatch.setattr(rpms, 'rpm', _RpmMocked(entries))
+    monkeypatch.setattr(rpms.stdlib, 'run', lambda *args, **kwargs: pytest.fail('rpm should not be executed'))
+    assert rpms.get_installed_rpms() == entries
+
+
+@pytest.mark.parametrize('rpm_module', [None, _RpmMocked(_RpmMocked.error('rpmdb open failed'))])
+def test_get_installed_rpms_fallback(monkeypatch, rpm_module):
+    entries = ['bash|5.1.8|6.el9|0|Red Hat, Inc.|x86_64|RSA/SHA256, Key ID 199e2f91fd431d51']
+    monkeypatch.setattr(rpms, 'rpm', rpm_module)
+    monkeypatch.setattr(rpms.stdlib, 'run', lambda cmd, **kwargs: {'stdout': entries})
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    assert rpms.get_installed_rpms() == entries
@@ -395,6 +395,18 @@ class IscConfigParser(object):
     CHAR_KEYWORD = string.ascii_letters + string.digits + '-_.:'
     CHAR_STR_OPEN = '"'
 
+    _IMPORTANT_CHARS = {
+        "{": "}",
+        "(": ")",
+        "[": "]",
+        "\"": "\"",
+        CHAR_DELIM: None,
+    }
+    # characters which can start a comment, string, nested block or end the current one
+    _RE_CLOSING_SCAN = re.compile('[' + re.escape('#/"\'{([' + CHAR_CLOSING) + ']')
+    _RE_COMMENT_OR_STR = re.compile(r'[#/"]')
+    _CLOSING_CACHE_SIZE = 16
+
     def __init__(self, config=None):
         """Construct parser.
 
@@ -402,6 +414,7 @@ class IscConfigParser(object):
 
         Initialize contents from path to real config or already loaded ConfigFile class.
         """
+        self._closing_cache = {}
         if isinstance(config, ConfigFile):
             self.FILES_TO_CHECK = [config]
             self.load_included_files()
@@ -434,7 +447,7 @@ class IscConfigParser(object):
         if index >= length or index < 0:
             return -1
 
-        if istr[index] == "#" or istr[index:].startswith("//"):
+        if istr[index] == "#" or istr.startswith("//", index):
             return istr.find("\n", index)
 
         if index+2 < length and istr[index:index+2] == "/*":
@@ -455,32 +468,47 @@ class IscConfigParser(object):
         :return: istr without comments
         """
 
-        ostr = ""
+        ostr = []
+        ostr_len = 0
 
         length = len(istr)
         index = 0
 
         while index < length:
+            # copy the plain text up to the next possible comment or string at once
+            match = self._RE_COMMENT_OR_STR.search(istr, index)
+            if match is None:
+                ostr.append(istr[index:])
+                break
+            if match.start() > index:
+                ostr.append(istr[index:match.start()])
+                ostr_len += match.start() - index
+                index = match.start()
+
             if self.is_comment_start(istr, index):
                 index = self._find_end_of_comment(istr, index)
                 if index == -1:
                     index = length
-                if space_replace:
-                    ostr = ostr.ljust(index)
+                if space_replace and ostr_len < index:
+                    ostr.append(" " * (index - ostr_len))
+                    ostr_len = index
                 if index < length and istr[index] == "\n":
-                    ostr += "\n"
+                    ostr.append("\n")
+                    ostr_len += 1
             elif istr[index] in self.CHAR_STR_OPEN:
                 end_str = self._find_closing_char(istr, index)
                 if end_str == -1:
-                    ostr += istr[index:]
+                    ostr.append(istr[index:])
                     break
-                ostr += istr[index:end_str+1]
+                ostr.append(istr[index:end_str+1])
+                ostr_len += end_str + 1 - index
                 index = end_str
             else:
-                ostr += istr[index]
+                ostr.append(istr[index])
+                ostr_len += 1
             index += 1
 
-        return ostr
+        return "".join(ostr)
 
     def _replace_comments(self, istr):
         """Replaces all comments by spaces in the given string.
@@ -578,13 +606,6 @@ class IscConfigParser(object):
             "(hello (world) /* ) */ ), he would say"
         index of the third ")" is returned.
         """
-        important_chars = {  # TODO: should be that rather global var?
-            "{": "}",
-            "(": ")",
-            "[": "]",
-            "\"": "\"",
-            self.CHAR_DELIM: None,
-            }
         length = len(istr)
         if 0 <= end_index < length:
             length = end_index
@@ -595,33 +616,78 @@ class IscConfigParser(object):
         if index >= length or index < 0:
             return -1
 
-        closing_char = important_chars.get(istr[index], self.CHAR_DELIM)
-        if closing_char is None:
+        closing, closing_end = self._scan_closing_char(istr, index, self._get_closing_cache(istr))
+        if closing_end == -1 or closing_end >= length:
+            # the closing character is not present before the end_index
             return -1
+        return closing
 
-        isString = istr[index] in "\""
-        index += 1
-        curr_c = ""
-        while index < length:
-            curr_c = istr[index]
-            if curr_c == '//':
-                index += 2
-            elif self.is_comment_start(istr, index) and not isString:
-                index = self._find_end_of_comment(istr, index)
-                if index == -1:
-                    return -1
-            elif not isString and self.is_opening_char(curr_c):
-                deep_close = self._find_closing_char(istr[index:])
-                if deep_close == -1:
-                    break
-                index += deep_close
-            elif curr_c == closing_char:
-                if curr_c == self.CHAR_DELIM:
-                    index -= 1
-                return index
+    def _get_closing_cache(self, istr):
+        """Return the cache of closing characters found in the given string.
+
+        The cache is kept for the strings scanned last, so the parsed buffer
+        of each configuration file is tokenized just once.
+        """
+        cached = self._closing_cache.get(id(istr))
+        # keep the reference to the string, so its id cannot be reused by another one
+        if cached is None or cached[0] is not istr:
+            if len(self._closing_cache) >= self._CLOSING_CACHE_SIZE:
+                self._closing_cache.clear()
+            cached = (istr, {})
+            self._closing_cache[id(istr)] = cached
+        return cached[1]
+
+    def _scan_closing_char(self, istr, index, cache):
+        """Find the closing character for the opening one on the index.
+
+        Scans the whole rest of the string, skipping just the characters
+        which cannot affect the result. Results for all nested opening
+        characters are stored in the cache, so every part of the string
+        is scanned only once.
+
+        :returns: (index of the closing character, index where the scan stopped);
+            (-1, -1) when the closing character is not found
+        """
+        if index in cache:
+            return cache[index]
+
+        start = index
+        result = (-1, -1)
+        length = len(istr)
+        closing_char = self._IMPORTANT_CHARS.get(istr[index], self.CHAR_DELIM)
+        if length - index >= 2 and closing_char is not None:
+            isString = istr[index] in "\""
             index += 1
+            while index < length:
+                if isString:
+                    index = istr.find(closing_char, index)
+                    if index != -1:
+                        result = (index, index)
+                    break
+                match = self._RE_CLOSING_SCAN.search(istr, index)
+                if match is None:
+                    break
+                index = match.start()
+                curr_c = istr[index]
+                if self.is_comment_start(istr, index):
+                    index = self._find_end_of_comment(istr, index)
+                    if index == -1:
+                        break
+                elif self.is_opening_char(curr_c):
+                    deep_close = self._scan_closing_char(istr, index, cache)[0]
+                    if deep_close == -1:
+                        break
+                    index = deep_close
+                elif curr_c == closing_char:
+                    if curr_c == self.CHAR_DELIM:
+                        result = (index - 1, index)
+                    else:
+                        result = (index, index)
+                    break
+                index += 1
 
-        return -1
+        cache[start] = result
+        return result
 
     def find_key(self, istr, key, index=0, end_index=-1, only_first=True):
         """
@@ -926,16 +992,18 @@ class IscConfigParser(object):
         """
         # TODO: use parser instead of regexp
         pattern = re.compile(r'include\s*"(.+?)"\s*;')
+        loaded = set(f.path for f in self.FILES_TO_CHECK)
         # find includes in all files
         for ch_file in self.FILES_TO_CHECK:
             nocomments = self._remove_comments(ch_file.buffer)
             includes = re.findall(pattern, nocomments)
             for include in includes:
                 # don't include already loaded files -> prevent loops
-                if self.is_file_loaded(include):
+                if include in loaded:
                     continue
                 try:
                     self.new_config(include)
+                    loaded.add(include)
                 except IOError as e:
                     self.on_include_error(ConfigParseError(e, include))
 
@@ -375,5 +375,49 @@ def test_empty_include_config():
     assert null_cfg.buffer == ''
 
 
+def test_find_closing_char():
+    parser = isccfg.IscConfigParser()
+    istr = '(hello (world) /* ) */ ), he would say'
+    assert parser._find_closing_char(istr) == 23
+    assert parser._find_closing_char(istr, 7) == 13
+    assert parser._find_closing_char(istr, 0, 23) == -1
+    assert parser._find_closing_char('{ "}" # }\n };') == 11
+    assert parser._find_closing_char('{ { };') == -1
+    # the statement is closed by the delimiter, the index before it is returned
+    assert parser._find_closing_char('\'a b"c";') == 6
+
+
+def test_many_zones():
+    zones = ['zone "z{0}.example.com" IN {{ type master; file "z{0}.db"; /* }}; */ }};\n'.format(i)
+             for i in range(2000)]
+    config = isccfg.MockConfig(
+        'options { directory "/var/named"; };\n'
+        'view "internal" {\n' + ''.join(zones[:1000]) + '};\n' + ''.join(zones[1000:])
+    )
+    parser = isccfg.IscConfigParser(config)
+
+    view_zones = parser.find('view.zone')
+    assert [zone.name for zone in view_zones] == ['z{}.example.com'.format(i) for i in range(1000)]
+    top_zones = parser.find('zone')
+    assert [zone.name for zone in top_zones] == ['z{}.example.com'.format(i) for i in range(1000, 2000)]
+    assert all(zone.zone_class == 'IN' for zone in top_zones)
+    assert top_zones[-1].serialize().endswith('};')
+
+    state = {}
+    parser.walk(config.root_section(), {'file': lambda section, files: files.setdefault(section.var(1).invalue(), 1)},
+                state)
+    assert len(state) == 2000
+
+
+def test_include_loop(tmp_path):
+    main = tmp_path / 'named.conf'
+    included = tmp_path / 'included.conf'
+    main.write_text(u'include "{0}"; include "{0}"; include "{1}";'.format(included, main))
+    included.write_text(u'include "{0}"; # include "/nonexistent";'.format(main))
+
+    parser = isccfg.IscConfigParser(str(main))
+    assert [cfg.path for cfg in parser.FILES_TO_CHECK] == [str(main), str(included)]
+
+
 if __name__ == '__main__':
     test_key_views_lookaside()